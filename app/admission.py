@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Optional
+
+from app.prometheus_metrics import observe_admission_wait, update_active_calls, update_admission_queued, update_admission_rejected
+from app.settings import LaneConfig
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Вызов сервиса отклонен: сервис загружен и ответ не успеет к дедлайну"""
+
+    def __init__(self, service_name: str, reason: str, retry_after: float):
+        super().__init__(f"Сервис {service_name} перегружен ({reason})")
+        self.service_name = service_name
+        self.reason = reason
+        # Через сколько секунд стоит повторить запрос (оценка времени ожидания)
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Lane:
+    """Очередь одной полосы приоритета"""
+
+    weight: float
+    # Сколько слотов сервиса полоса может занимать одновременно
+    limit: int
+    active: int = 0
+    waiters: Deque[asyncio.Future] = field(default_factory=deque)
+    # Виртуальное время полосы: растет на 1 / weight за каждый выданный из очереди слот
+    virtual_time: float = 0.0
+
+
+class ConcurrencyLimiter:
+    """
+    Ограничение одновременных вызовов сервиса с очередями ожидания по полосам приоритета
+
+    Не больше max_concurrency вызовов выполняются одновременно, и не больше доли share
+    слотов занимает одна полоса. Остальные вызовы ждут в очереди своей полосы не дольше
+    своего бюджета времени. Освободившийся слот получает полоса с наименьшим
+    виртуальным временем (взвешенное справедливое обслуживание): при постоянной
+    очереди в обеих полосах слоты делятся пропорционально весам, а внутри полосы
+    вызовы обслуживаются по порядку поступления.
+
+    Вызов отклоняется сразу, если очередь полосы заполнена или по оценке ожидание
+    вместе с типичным временем ответа сервиса не укладывается в бюджет: сервис
+    остается в режиме наибольшей пропускной способности, а не копит запросы до таймаутов.
+    """
+
+    def __init__(
+        self,
+        service_name: str,
+        max_concurrency: int,
+        max_queue: int,
+        service_time: Callable[[], Optional[float]],
+        lanes: Dict[str, LaneConfig],
+    ):
+        """
+        Args:
+            service_name: Имя сервиса
+            max_concurrency: Максимум одновременных вызовов
+            max_queue: Максимум вызовов в очереди ожидания каждой полосы
+            service_time: Оценка типичного времени ответа сервиса (None, если замеров нет)
+            lanes: Полосы приоритета с весами и долями слотов
+        """
+        if max_concurrency <= 0 or max_queue < 0:
+            raise ValueError(f"Некорректные ограничения параллельности сервиса {service_name}")
+        self.service_name = service_name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.service_time = service_time
+        self.lanes = lanes
+        self.active = 0
+        self._lanes = {
+            name: _Lane(weight=lane.weight, limit=max(1, math.floor(lane.share * max_concurrency + 1e-9)))
+            for name, lane in lanes.items()
+        }
+        self._virtual_time = 0.0
+
+    def _has_slot(self, lane: _Lane) -> bool:
+        return self.active < self.max_concurrency and lane.active < lane.limit
+
+    def predicted_wait(self, lane_name: str) -> float:
+        """Оценка ожидания нового вызова полосы в очереди (секунды)"""
+        lane = self._lanes[lane_name]
+        if self._has_slot(lane) and not lane.waiters:
+            return 0.0
+        # Полоса с очередью получает долю слотов по весу среди полос с очередями, но не больше limit
+        weights = sum(other.weight for other in self._lanes.values() if other.waiters or other is lane)
+        slots = min(lane.limit, self.max_concurrency * lane.weight / weights)
+        # Слоты полосы освобождаются в среднем раз в service_time / slots секунд
+        return (len(lane.waiters) + 1) * (self.service_time() or 0.0) / slots
+
+    def _reject(self, lane_name: str, reason: str, retry_after: float) -> AdmissionRejected:
+        update_admission_rejected(self.service_name, lane_name, reason)
+        return AdmissionRejected(self.service_name, reason, retry_after)
+
+    async def acquire(self, budget: float, lane_name: str) -> None:
+        """
+        Получение слота для вызова
+
+        Args:
+            budget: Сколько секунд осталось до дедлайна запроса
+            lane_name: Полоса приоритета запроса
+
+        Raises:
+            AdmissionRejected: Очередь полосы заполнена, ответ не успеет к дедлайну
+                или слот не освободился за budget секунд
+        """
+        lane = self._lanes[lane_name]
+        if self._has_slot(lane) and not lane.waiters:
+            self._start(lane)
+            observe_admission_wait(self.service_name, lane_name, 0.0)
+            return
+        wait = self.predicted_wait(lane_name)
+        if len(lane.waiters) >= self.max_queue:
+            raise self._reject(lane_name, "queue_full", wait)
+        if wait + (self.service_time() or 0.0) > budget:
+            raise self._reject(lane_name, "deadline", wait)
+
+        if not lane.waiters:
+            # Простаивавшая полоса не копит преимущество за время простоя
+            lane.virtual_time = max(lane.virtual_time, self._virtual_time)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        lane.waiters.append(future)
+        update_admission_queued(self.service_name, lane_name, len(lane.waiters))
+        started_at = time.perf_counter()
+        timer = loop.call_later(max(budget, 0.0), self._expire, lane_name, future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже выдан этому вызову - возвращаем его
+                self.release(lane_name)
+            else:
+                self._remove(lane_name, future)
+            raise
+        finally:
+            timer.cancel()
+        observe_admission_wait(self.service_name, lane_name, time.perf_counter() - started_at)
+
+    def _start(self, lane: _Lane) -> None:
+        lane.active += 1
+        self.active += 1
+        update_active_calls(1)
+
+    def _remove(self, lane_name: str, future: asyncio.Future) -> None:
+        waiters = self._lanes[lane_name].waiters
+        try:
+            waiters.remove(future)
+        except ValueError:
+            pass
+        update_admission_queued(self.service_name, lane_name, len(waiters))
+
+    def _expire(self, lane_name: str, future: asyncio.Future) -> None:
+        """Слот не освободился за бюджет вызова"""
+        if future.done():
+            return
+        self._remove(lane_name, future)
+        future.set_exception(self._reject(lane_name, "wait_timeout", self.predicted_wait(lane_name)))
+
+    def release(self, lane_name: str) -> None:
+        """Освобождение слота и выдача свободных слотов ожидающим вызовам"""
+        lane = self._lanes[lane_name]
+        lane.active -= 1
+        self.active -= 1
+        update_active_calls(-1)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Выдача свободных слотов полосам с наименьшим виртуальным временем"""
+        while self.active < self.max_concurrency:
+            selected_name, selected = None, None
+            for name, lane in self._lanes.items():
+                while lane.waiters and lane.waiters[0].done():
+                    lane.waiters.popleft()
+                if lane.waiters and lane.active < lane.limit and (
+                    selected is None or lane.virtual_time < selected.virtual_time
+                ):
+                    selected_name, selected = name, lane
+            if selected is None:
+                return
+            future = selected.waiters.popleft()
+            update_admission_queued(self.service_name, selected_name, len(selected.waiters))
+            self._start(selected)
+            self._virtual_time = selected.virtual_time
+            selected.virtual_time += 1 / selected.weight
+            future.set_result(None)
+
+    def info(self) -> Dict[str, object]:
+        """Состояние ограничителя для /config"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "lanes": {
+                name: {
+                    "limit": lane.limit,
+                    "active": lane.active,
+                    "queued": len(lane.waiters),
+                    "predicted_wait": self.predicted_wait(name),
+                }
+                for name, lane in self._lanes.items()
+            },
+        }
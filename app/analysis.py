@@ -0,0 +1,374 @@
+"""
+Офлайн-анализ эксперимента по журналу показов
+
+Файлы журнала читаются потоково, пачками по --chunk-size записей. По каждому варианту
+считаются доли ошибок и таймаутов, перцентили задержки (по логарифмической гистограмме)
+и средние, а для разниц с контрольным вариантом - доверительные интервалы бутстрепом.
+
+Бутстреп выполняется по бакетам пользователей: каждая запись по хешу user_id попадает
+в один из --buckets бакетов, по которым копятся суммы. Повторные выборки берутся по
+бакетам, а не по записям, поэтому память не зависит от объема журнала, а отзывы одного
+пользователя (при распределении sticky) не считаются независимыми.
+
+    python -m app.analysis exposure/ --control service_a --since 2025-06-01T00:00:00
+"""
+import argparse
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from app.assignment import _mix64
+from app.exposure import EXPOSURE_DTYPE, FILE_PREFIX, FILE_SUFFIX, STATUSES, read_exposure_file
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 95, 99)
+# Логарифмические границы гистограммы задержки: от 1 мс до 1000 с, шаг около 1.2%
+LATENCY_EDGES = np.geomspace(1e-3, 1e3, 1201)
+_OK, _ERROR, _TIMEOUT = (STATUSES.index(status) for status in ("ok", "error", "timeout"))
+
+
+def exposure_files(paths: Sequence[Path]) -> List[Path]:
+    """Файлы журнала из списка файлов и каталогов, в порядке создания"""
+    files = []
+    for path in paths:
+        if path.is_dir():
+            files.extend(sorted(path.glob(f"{FILE_PREFIX}*{FILE_SUFFIX}"), key=lambda file: file.name))
+        else:
+            files.append(path)
+    return files
+
+
+def read_chunks(files: Iterable[Path], chunk_size: int) -> Iterator[np.ndarray]:
+    """Записи журнала пачками примерно по chunk_size строк"""
+    pending: List[np.ndarray] = []
+    pending_rows = 0
+    for path in files:
+        for block in read_exposure_file(path):
+            if block.dtype != EXPOSURE_DTYPE:
+                logger.warning(f"Пропущен блок с неизвестной схемой в {path}: {block.dtype}")
+                continue
+            pending.append(block)
+            pending_rows += len(block)
+            if pending_rows >= chunk_size:
+                yield np.concatenate(pending)
+                pending, pending_rows = [], 0
+    if pending:
+        yield np.concatenate(pending)
+
+
+class VariantAccumulator:
+    """
+    Потоковые суммы по вариантам
+
+    Все состояние - массивы фиксированного размера: счетчики статусов, гистограммы
+    задержки и суммы по бакетам пользователей для бутстрепа.
+    """
+
+    def __init__(self, variants: Sequence[str], buckets: int):
+        self.variants = list(variants)
+        self.buckets = buckets
+        self._names = np.array([name.encode("utf-8") for name in self.variants], dtype=EXPOSURE_DTYPE["variant"])
+        count = len(self.variants)
+        bins = len(LATENCY_EDGES) + 1
+        self.statuses = np.zeros((count, len(STATUSES)), dtype=np.int64)
+        self.histograms = np.zeros((count, bins), dtype=np.int64)
+        self.latency_sum = np.zeros(count)
+        # Суммы по бакетам: все записи, ошибки (включая таймауты), успешные, их задержка и размер ответа
+        self.bucket_rows = np.zeros((count, buckets))
+        self.bucket_errors = np.zeros((count, buckets))
+        self.bucket_ok = np.zeros((count, buckets))
+        self.bucket_latency = np.zeros((count, buckets))
+        self.bucket_bytes = np.zeros((count, buckets))
+        self.unknown: Dict[str, int] = {}
+
+    def add(self, chunk: np.ndarray) -> None:
+        """Учет пачки записей"""
+        codes = np.full(len(chunk), -1, dtype=np.int64)
+        for index, name in enumerate(self._names):
+            codes[chunk["variant"] == name] = index
+        known = codes >= 0
+        if not known.all():
+            names, counts = np.unique(chunk["variant"][~known], return_counts=True)
+            for name, count in zip(names, counts):
+                name = name.decode("utf-8", errors="replace")
+                self.unknown[name] = self.unknown.get(name, 0) + int(count)
+            chunk, codes = chunk[known], codes[known]
+        if not len(chunk):
+            return
+
+        count = len(self.variants)
+        status = chunk["status"].astype(np.int64)
+        latency = chunk["latency"].astype(np.float64)
+        ok = status == _OK
+
+        self.statuses += np.bincount(codes * len(STATUSES) + status, minlength=count * len(STATUSES)).reshape(count, -1)
+        ok_codes = codes[ok]
+        bins = np.searchsorted(LATENCY_EDGES, latency[ok])
+        self.histograms += np.bincount(
+            ok_codes * self.histograms.shape[1] + bins, minlength=self.histograms.size
+        ).reshape(self.histograms.shape)
+        self.latency_sum += np.bincount(ok_codes, weights=latency[ok], minlength=count)
+
+        buckets = (_mix64(chunk["user_id"]) % np.uint64(self.buckets)).astype(np.int64)
+        index = codes * self.buckets + buckets
+        size = count * self.buckets
+        shape = (count, self.buckets)
+        self.bucket_rows += np.bincount(index, minlength=size).reshape(shape)
+        self.bucket_errors += np.bincount(index, weights=(~ok).astype(np.float64), minlength=size).reshape(shape)
+        self.bucket_ok += np.bincount(index, weights=ok.astype(np.float64), minlength=size).reshape(shape)
+        self.bucket_latency += np.bincount(index, weights=np.where(ok, latency, 0.0), minlength=size).reshape(shape)
+        self.bucket_bytes += np.bincount(
+            index, weights=np.where(ok, chunk["response_bytes"], 0).astype(np.float64), minlength=size
+        ).reshape(shape)
+
+    def percentiles(self, index: int) -> Dict[str, Optional[float]]:
+        """Перцентили задержки успешных запросов варианта по гистограмме"""
+        histogram = self.histograms[index]
+        total = histogram.sum()
+        if not total:
+            return {f"p{q}": None for q in PERCENTILES}
+        cumulative = np.cumsum(histogram)
+        # Значение бина - его верхняя граница; переполнение гистограммы - последняя граница
+        upper = np.append(LATENCY_EDGES, LATENCY_EDGES[-1])
+        return {
+            f"p{q}": float(upper[np.searchsorted(cumulative, q / 100 * total)])
+            for q in PERCENTILES
+        }
+
+
+# Метрики для сравнения вариантов: числитель и знаменатель (суммы по бакетам)
+METRICS = {
+    "error_rate": ("bucket_errors", "bucket_rows"),
+    "mean_latency": ("bucket_latency", "bucket_ok"),
+    "mean_response_bytes": ("bucket_bytes", "bucket_ok"),
+}
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return numerator / denominator
+
+
+def bootstrap_differences(
+    accumulator: VariantAccumulator,
+    control: int,
+    replicates: int,
+    confidence: float,
+    seed: Optional[int] = None,
+) -> Dict[str, Dict[str, Dict[str, Optional[float]]]]:
+    """
+    Доверительные интервалы разниц метрик с контрольным вариантом
+
+    Веса бакетов в повторных выборках - пуассоновские (Poisson(1)), независимо для
+    каждого варианта; все повторные выборки считаются одним матричным умножением.
+
+    Args:
+        accumulator: Накопленные суммы
+        control: Индекс контрольного варианта
+        replicates: Количество повторных выборок
+        confidence: Уровень доверия
+        seed: Зерно генератора случайных чисел
+
+    Returns:
+        {вариант: {метрика: {"diff", "relative", "low", "high", "p_value"}}}
+    """
+    rng = np.random.default_rng(seed)
+    count = len(accumulator.variants)
+    weights = rng.poisson(1.0, size=(count, replicates, accumulator.buckets)).astype(np.float64)
+    alpha = (1 - confidence) / 2
+
+    result = {}
+    replicated = {}
+    point = {}
+    for metric, (numerator, denominator) in METRICS.items():
+        numerators = getattr(accumulator, numerator)
+        denominators = getattr(accumulator, denominator)
+        point[metric] = _ratio(numerators.sum(axis=1), denominators.sum(axis=1))
+        # (варианты, повторы): взвешенные суммы по бакетам
+        replicated[metric] = _ratio(
+            np.einsum("vrb,vb->vr", weights, numerators),
+            np.einsum("vrb,vb->vr", weights, denominators),
+        )
+
+    for index, name in enumerate(accumulator.variants):
+        if index == control:
+            continue
+        result[name] = {}
+        for metric in METRICS:
+            diff = point[metric][index] - point[metric][control]
+            samples = replicated[metric][index] - replicated[metric][control]
+            samples = samples[np.isfinite(samples)]
+            if not np.isfinite(diff) or not len(samples):
+                result[name][metric] = {"diff": None, "relative": None, "low": None, "high": None, "p_value": None}
+                continue
+            low, high = np.quantile(samples, [alpha, 1 - alpha])
+            # Двусторонний бутстреп-p: доля повторов по другую сторону от нуля
+            p_value = min(1.0, 2 * min(np.mean(samples <= 0), np.mean(samples >= 0)))
+            control_value = point[metric][control]
+            result[name][metric] = {
+                "diff": float(diff),
+                "relative": float(diff / control_value) if control_value else None,
+                "low": float(low),
+                "high": float(high),
+                "p_value": float(p_value),
+            }
+    return result
+
+
+def summarize(accumulator: VariantAccumulator) -> Dict[str, Dict[str, object]]:
+    """Сводка по вариантам"""
+    summary = {}
+    for index, name in enumerate(accumulator.variants):
+        statuses = accumulator.statuses[index]
+        total = int(statuses.sum())
+        ok = int(statuses[_OK])
+        summary[name] = {
+            "records": total,
+            "error_rate": float(statuses[_ERROR] / total) if total else None,
+            "timeout_rate": float(statuses[_TIMEOUT] / total) if total else None,
+            "mean_latency": float(accumulator.latency_sum[index] / ok) if ok else None,
+            **accumulator.percentiles(index),
+        }
+    return summary
+
+
+def _format(value: Optional[float], digits: int = 4) -> str:
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def print_report(report: Dict[str, object]) -> None:
+    """Текстовый отчет"""
+    print(f"Записей: {report['records']}, контрольный вариант: {report['control']}")
+    if report["unknown_variants"]:
+        print(f"Пропущены записи вариантов вне конфигурации: {report['unknown_variants']}")
+    print()
+    header = f"{'вариант':<20}{'записей':>12}{'ошибки':>10}{'таймауты':>10}{'среднее':>10}" + "".join(
+        f"{'p' + str(q):>10}" for q in PERCENTILES
+    )
+    print(header)
+    for name, row in report["variants"].items():
+        print(
+            f"{name:<20}{row['records']:>12}{_format(row['error_rate']):>10}{_format(row['timeout_rate']):>10}"
+            f"{_format(row['mean_latency'], 3):>10}"
+            + "".join(f"{_format(row['p' + str(q)], 3):>10}" for q in PERCENTILES)
+        )
+    print()
+    print(f"Разница с {report['control']} ({int(report['confidence'] * 100)}% ДИ, бутстреп по бакетам пользователей)")
+    for name, metrics in report["differences"].items():
+        for metric, values in metrics.items():
+            relative = values["relative"] * 100 if values["relative"] is not None else None
+            print(
+                f"{name:<20}{metric:<22}{_format(values['diff']):>12}"
+                f"  [{_format(values['low'])}, {_format(values['high'])}]"
+                f"  отн. {_format(relative, 2)}%"
+                f"  p={_format(values['p_value'], 3)}"
+            )
+
+
+def analyze(
+    paths: Sequence[Path],
+    variants: Sequence[str],
+    control: str,
+    chunk_size: int,
+    buckets: int,
+    replicates: int,
+    confidence: float,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    seed: Optional[int] = None,
+) -> Dict[str, object]:
+    """
+    Анализ журнала показов
+
+    Args:
+        paths: Файлы или каталоги журнала
+        variants: Имена вариантов (по умолчанию сервисы из конфигурации)
+        control: Контрольный вариант
+        chunk_size: Размер пачки записей
+        buckets: Количество бакетов пользователей для бутстрепа
+        replicates: Количество повторных выборок бутстрепа
+        confidence: Уровень доверия
+        since: Начало периода (unix time)
+        until: Конец периода (unix time)
+        seed: Зерно генератора случайных чисел
+
+    Returns:
+        Отчет: сводка по вариантам и разницы с контрольным вариантом
+    """
+    if control not in variants:
+        raise ValueError(f"Контрольный вариант {control} не входит в список вариантов: {list(variants)}")
+    accumulator = VariantAccumulator(variants, buckets)
+    records = 0
+    for chunk in read_chunks(exposure_files(paths), chunk_size):
+        if since is not None or until is not None:
+            mask = np.ones(len(chunk), dtype=bool)
+            if since is not None:
+                mask &= chunk["timestamp"] >= since
+            if until is not None:
+                mask &= chunk["timestamp"] < until
+            chunk = chunk[mask]
+        records += len(chunk)
+        accumulator.add(chunk)
+
+    return {
+        "records": records,
+        "control": control,
+        "confidence": confidence,
+        "unknown_variants": accumulator.unknown,
+        "variants": summarize(accumulator),
+        "differences": bootstrap_differences(
+            accumulator, accumulator.variants.index(control), replicates, confidence, seed
+        ),
+    }
+
+
+def _timestamp(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", type=Path, default=[Path(settings.exposure.path)],
+                        help="Файлы или каталоги журнала (по умолчанию exposure.path из конфигурации)")
+    parser.add_argument("--variants", nargs="+", default=list(settings.services),
+                        help="Варианты (по умолчанию сервисы из конфигурации)")
+    parser.add_argument("--control", default=None, help="Контрольный вариант (по умолчанию первый)")
+    parser.add_argument("--since", type=_timestamp, default=None, help="Начало периода, ISO 8601")
+    parser.add_argument("--until", type=_timestamp, default=None, help="Конец периода, ISO 8601")
+    parser.add_argument("--chunk-size", type=int, default=1_000_000, help="Записей в пачке обработки")
+    parser.add_argument("--buckets", type=int, default=1024, help="Бакетов пользователей для бутстрепа")
+    parser.add_argument("--bootstrap", type=int, default=2000, help="Повторных выборок бутстрепа")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Уровень доверия")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Вывести отчет в JSON")
+    args = parser.parse_args(argv)
+
+    if not args.variants:
+        parser.error("В конфигурации нет сервисов; укажите варианты через --variants")
+    report = analyze(
+        args.paths,
+        args.variants,
+        args.control or args.variants[0],
+        chunk_size=args.chunk_size,
+        buckets=args.buckets,
+        replicates=args.bootstrap,
+        confidence=args.confidence,
+        since=args.since,
+        until=args.until,
+        seed=args.seed,
+    )
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,243 @@
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.settings import AssignmentConfig, ServiceConfig
+
+logger = logging.getLogger(__name__)
+
+ASSIGNMENT_STRATEGIES = ("random", "sticky")
+
+_UINT64_MASK = (1 << 64) - 1
+
+
+def _hash_string(value: str) -> int:
+    """Стабильный 64-битный хеш строки (не зависит от PYTHONHASHSEED)"""
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _key_to_int(value: Any) -> int:
+    """
+    Приводит ключ распределения к 64-битному целому
+
+    Числовые строки трактуются как числа, чтобы id=123 и id="123"
+    попадали в один бакет. Числом считаются только ASCII-цифры: str.isdigit
+    пропускает "²" и "٣", которые int() не разбирает или читает как "3".
+    """
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return value & _UINT64_MASK
+    value = str(value)
+    if value.isascii() and value.isdigit():
+        return int(value) & _UINT64_MASK
+    return _hash_string(value)
+
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """Векторизованный финализатор splitmix64: равномерно перемешивает биты ключей"""
+    z = values + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _largest_remainder(weights: np.ndarray, total: int) -> np.ndarray:
+    """Раскладывает total единиц пропорционально весам так, чтобы сумма была ровно total"""
+    quotas = weights / weights.sum() * total
+    counts = np.floor(quotas).astype(np.int64)
+    remainder = total - int(counts.sum())
+    if remainder > 0:
+        order = np.argsort(-(quotas - counts), kind="stable")
+        counts[order[:remainder]] += 1
+    return counts
+
+
+class BucketTable:
+    """Таблица бакет -> индекс сервиса, построенная один раз по весам сервисов"""
+
+    def __init__(self, weights: Sequence[float], buckets: int, table: Optional[np.ndarray] = None):
+        weights = np.asarray(weights, dtype=np.float64)
+        if buckets <= 0:
+            raise ValueError("Количество бакетов должно быть положительным")
+        if weights.sum() <= 0:
+            raise ValueError("Общий вес сервисов должен быть положительным числом")
+
+        self.buckets = buckets
+        self.weights = weights
+        if table is None:
+            table = np.repeat(np.arange(len(weights), dtype=np.int32), _largest_remainder(weights, buckets))
+        self.table = table
+        self.counts = np.bincount(table, minlength=len(weights))
+
+    def shares(self) -> np.ndarray:
+        """Фактические доли трафика сервисов"""
+        return self.counts / self.buckets
+
+    def lookup(self, buckets: np.ndarray) -> np.ndarray:
+        """Индексы сервисов для массива бакетов"""
+        return self.table[buckets]
+
+    def without(self, excluded: Sequence[int]) -> "BucketTable":
+        """
+        Таблица, в которой бакеты исключенных сервисов распределены между остальными
+
+        Бакеты оставшихся сервисов не меняются, поэтому закрепленные за ними
+        ключи остаются в своих вариантах.
+
+        Args:
+            excluded: Индексы исключаемых сервисов
+
+        Returns:
+            Новая таблица или текущая, если исключать некого или не осталось сервисов
+        """
+        weights = self.weights.copy()
+        weights[list(excluded)] = 0
+        if not len(excluded) or weights.sum() <= 0:
+            return self
+
+        mask = np.isin(self.table, excluded)
+        table = self.table.copy()
+        table[mask] = np.repeat(
+            np.arange(len(weights), dtype=np.int32),
+            _largest_remainder(weights, int(mask.sum())),
+        )
+        return BucketTable(self.weights, self.buckets, table=table)
+
+    def reweighted(self, weights: Sequence[float], index_map: Optional[np.ndarray] = None) -> "BucketTable":
+        """
+        Таблица с новыми весами, в которой бакет меняет сервис только при необходимости
+
+        Сервисы, доля которых уменьшилась, отдают часть своих бакетов, остальные
+        бакеты остаются на месте. Поэтому при изменении весов в другой вариант
+        переходят только ключи перенесенных бакетов.
+
+        Args:
+            weights: Новые веса сервисов
+            index_map: Индекс нового сервиса для каждого прежнего (-1 - сервис удален);
+                по умолчанию набор сервисов не меняется
+
+        Returns:
+            Новая таблица
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        table = self.table.copy() if index_map is None else index_map[self.table].astype(np.int32)
+        target = _largest_remainder(weights, self.buckets)
+
+        free = table < 0
+        counts = np.bincount(table[~free], minlength=len(weights))
+        for index in np.flatnonzero(counts > target):
+            free[np.flatnonzero(table == index)[target[index]:]] = True
+        deficit = np.maximum(target - counts, 0)
+        table[free] = np.repeat(np.arange(len(weights), dtype=np.int32), deficit)
+        return BucketTable(weights, self.buckets, table=table)
+
+
+class Assigner:
+    """Распределение отзывов по вариантам эксперимента"""
+
+    def __init__(self, services: Dict[str, ServiceConfig], config: AssignmentConfig,
+                 weights: Optional[Sequence[float]] = None, previous: Optional["Assigner"] = None):
+        """
+        Args:
+            services: Сервисы эксперимента
+            config: Параметры распределения
+            weights: Текущие веса сервисов (по умолчанию weight из конфигурации)
+            previous: Распределитель прежней конфигурации; если параметры распределения
+                не изменились, таблица строится из его таблицы с минимальным переносом бакетов
+        """
+        if config.strategy not in ASSIGNMENT_STRATEGIES:
+            raise ValueError(f"Неизвестная стратегия распределения: {config.strategy}")
+        self.config = config
+        self.names: List[str] = list(services.keys())
+        if weights is None:
+            weights = [service.weight for service in services.values()]
+        if previous is not None and previous.config == config:
+            index_map = np.array(
+                [self.names.index(name) if name in self.names else -1 for name in previous.names],
+                dtype=np.int32,
+            )
+            self.base_table = previous.base_table.reweighted(weights, index_map)
+        else:
+            self.base_table = BucketTable(weights, config.buckets)
+        # Активная таблица: без исключенных сервисов. Подменяется целиком одним присваиванием
+        self.table = self.base_table
+        self.excluded: List[str] = []
+        self._salt = np.uint64(_hash_string(config.salt)) if config.salt else np.uint64(0)
+        self._rng = np.random.default_rng()
+
+    def exclude(self, names: Sequence[str]) -> None:
+        """
+        Исключает сервисы из распределения, перераспределяя их трафик
+        пропорционально весам остальных
+
+        Args:
+            names: Имена исключаемых сервисов (пустой список возвращает исходную таблицу)
+        """
+        excluded = [self.names.index(name) for name in names if name in self.names]
+        self.table = self.base_table.without(excluded)
+        self.excluded = [self.names[index] for index in excluded] if self.table is not self.base_table else []
+
+    def set_weights(self, weights: Sequence[float]) -> None:
+        """
+        Смена весов сервисов с минимальным переносом бакетов (разгон варианта)
+
+        Args:
+            weights: Веса в порядке self.names
+        """
+        base_table = self.base_table.reweighted(weights)
+        excluded = [self.names.index(name) for name in self.excluded]
+        # Обе таблицы подменяются без переключения цикла событий
+        self.base_table = base_table
+        self.table = base_table.without(excluded)
+
+    def _get_key(self, review: Any) -> Optional[Any]:
+        """Значение ключа распределения из отзыва (модель или словарь)"""
+        if isinstance(review, dict):
+            return review.get(self.config.key)
+        return getattr(review, self.config.key, None)
+
+    def buckets_for(self, reviews: Sequence[Any]) -> np.ndarray:
+        """
+        Бакеты для пачки отзывов за один векторизованный проход
+
+        Args:
+            reviews: Отзывы (ReviewInput или словари)
+
+        Returns:
+            Массив номеров бакетов
+        """
+        count = len(reviews)
+        if self.config.strategy == "random":
+            return self._rng.integers(0, self.table.buckets, size=count)
+
+        keys = [self._get_key(review) for review in reviews]
+        missing = np.fromiter((key is None for key in keys), dtype=bool, count=count)
+        values = np.fromiter(
+            (0 if key is None else _key_to_int(key) for key in keys),
+            dtype=np.uint64,
+            count=count,
+        )
+        buckets = (_mix64(values ^ self._salt) % np.uint64(self.table.buckets)).astype(np.int64)
+        if missing.any():
+            # Без ключа закрепить вариант невозможно — выбираем бакет случайно
+            buckets[missing] = self._rng.integers(0, self.table.buckets, size=int(missing.sum()))
+        return buckets
+
+    def assign(self, reviews: Sequence[Any]) -> np.ndarray:
+        """
+        Индексы сервисов (в порядке self.names) для пачки отзывов
+
+        Args:
+            reviews: Отзывы (ReviewInput или словари)
+
+        Returns:
+            Массив индексов сервисов той же длины, что и reviews
+        """
+        return self.table.lookup(self.buckets_for(reviews))
+
+    def assign_names(self, reviews: Sequence[Any]) -> List[str]:
+        """Имена сервисов для пачки отзывов"""
+        return [self.names[index] for index in self.assign(reviews)]
@@ -0,0 +1,78 @@
+import random
+from typing import Dict, Optional
+
+from app.assignment import Assigner
+
+
+class ServiceLoad:
+    """Счетчики нагрузки сервиса: число запросов в работе и EWMA задержки"""
+
+    __slots__ = ("inflight", "ewma")
+
+    def __init__(self):
+        self.inflight = 0
+        # None, пока у сервиса нет ни одного замера
+        self.ewma: Optional[float] = None
+
+
+class LoadBalancer:
+    """
+    Выбор наименее загруженного сервиса методом двух случайных кандидатов
+
+    Два кандидата берутся из активной таблицы бакетов распределителя, поэтому
+    учитываются веса и исключенные автоматами сервисы. Из двух выбирается сервис
+    с меньшей оценкой (inflight + 1) * EWMA задержки. У сервиса без замеров (новая
+    реплика) вместо EWMA берется среднее EWMA остальных сервисов, чтобы он не получал
+    весь трафик при нулевой оценке. Решение занимает O(1).
+    Счетчики меняются только из цикла событий, поэтому блокировки не нужны.
+    """
+
+    def __init__(self, assigner: Assigner, alpha: float):
+        self.assigner = assigner
+        self.alpha = alpha
+        self.loads: Dict[str, ServiceLoad] = {name: ServiceLoad() for name in assigner.names}
+
+    def _ewma(self, load: ServiceLoad) -> float:
+        if load.ewma is not None:
+            return load.ewma
+        peers = [other.ewma for other in self.loads.values() if other.ewma is not None]
+        return sum(peers) / len(peers) if peers else 1.0
+
+    def _score(self, name: str) -> float:
+        load = self.loads[name]
+        return (load.inflight + 1) * self._ewma(load)
+
+    def pick(self) -> str:
+        """Имя выбранного сервиса"""
+        table = self.assigner.table
+        first = self.assigner.names[table.table[random.randrange(table.buckets)]]
+        second = self.assigner.names[table.table[random.randrange(table.buckets)]]
+        if first == second:
+            return first
+        return first if self._score(first) <= self._score(second) else second
+
+    def acquire(self, name: str) -> None:
+        """Учет начала запроса к сервису"""
+        load = self.loads.get(name)
+        if load is not None:
+            load.inflight += 1
+
+    def release(self, name: str, latency: Optional[float]) -> None:
+        """
+        Учет завершения запроса к сервису
+
+        Args:
+            name: Имя сервиса
+            latency: Задержка запроса (для упавшего запроса - штрафная); None, если запрос
+                отменен и задержка не показательна
+        """
+        load = self.loads.get(name)
+        if load is None:
+            return
+        load.inflight -= 1
+        if latency is not None:
+            load.ewma = latency if load.ewma is None else load.ewma + self.alpha * (latency - load.ewma)
+
+    def info(self) -> Dict[str, Dict[str, float]]:
+        """Текущая нагрузка сервисов для /config"""
+        return {name: {"inflight": load.inflight, "ewma": load.ewma} for name, load in self.loads.items()}
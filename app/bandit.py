@@ -0,0 +1,254 @@
+"""
+Режим bandit: распределение трафика по наградам вариантов
+
+Для каждого варианта копится статистика трех сигналов в виде дробных успехов и неудач
+(бета-распределений): успешность вызовов, награда за задержку успешного вызова
+(1 до latency_target, дальше latency_target / задержка) и оценки качества генераций,
+присланные в /api/v1/llm/feedback. Раз в interval секунд статистика устаревает с периодом
+полураспада half_life, доли вариантов пересчитываются NumPy и применяются как новая
+таблица бакетов: выбор варианта для запроса по-прежнему стоит один поиск в таблице.
+"""
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.prometheus_metrics import update_bandit_feedback, update_bandit_state
+from app.settings import BanditConfig, ServiceConfig
+
+logger = logging.getLogger(__name__)
+
+BANDIT_ALGORITHMS = ("thompson", "ucb")
+
+# Сигналы награды в порядке столбцов статистики
+SIGNALS = ("success", "latency", "quality")
+
+
+class RewardStats:
+    """Дробные успехи и неудачи сигналов награды одного варианта"""
+
+    __slots__ = ("positive", "negative")
+
+    def __init__(self):
+        self.positive = [0.0] * len(SIGNALS)
+        self.negative = [0.0] * len(SIGNALS)
+
+    def record_call(self, success: bool, latency: float, latency_target: float) -> None:
+        """Учет исхода вызова; задержка упавшего вызова не учитывается - за него уже есть неудача"""
+        if not success:
+            self.negative[0] += 1
+            return
+        self.positive[0] += 1
+        score = 1.0 if latency <= latency_target else latency_target / latency
+        self.positive[1] += score
+        self.negative[1] += 1 - score
+
+    def record_quality(self, score: float) -> None:
+        self.positive[2] += score
+        self.negative[2] += 1 - score
+
+    def decay(self, factor: float) -> None:
+        """Устаревание статистики: старые наблюдения весят меньше новых"""
+        self.positive = [value * factor for value in self.positive]
+        self.negative = [value * factor for value in self.negative]
+
+
+def mean_rewards(positive: np.ndarray, negative: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Средняя апостериорная награда вариантов (от 0 до 1)"""
+    means = (positive + 1) / (positive + negative + 2)
+    return means @ weights / weights.sum()
+
+
+def thompson_shares(positive: np.ndarray, negative: np.ndarray, weights: np.ndarray,
+                    samples: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Доли вариантов при сэмплировании Томпсона: вероятность того, что награда варианта наибольшая
+
+    Args:
+        positive: Дробные успехи, форма (варианты, сигналы)
+        negative: Дробные неудачи той же формы
+        weights: Вклад сигналов в награду
+        samples: Число выборок из апостериорных распределений
+        rng: Генератор случайных чисел
+
+    Returns:
+        Доли вариантов (сумма равна 1)
+    """
+    draws = rng.beta(positive + 1, negative + 1, size=(samples,) + positive.shape)
+    best = np.argmax(draws @ weights, axis=1)
+    return np.bincount(best, minlength=positive.shape[0]) / samples
+
+
+def ucb_shares(positive: np.ndarray, negative: np.ndarray, weights: np.ndarray, exploration: float) -> np.ndarray:
+    """
+    Доли вариантов по UCB1: весь трафик - вариантам с наибольшей верхней доверительной границей награды
+
+    Args:
+        positive: Дробные успехи, форма (варианты, сигналы)
+        negative: Дробные неудачи той же формы
+        weights: Вклад сигналов в награду
+        exploration: Коэффициент ширины доверительного интервала
+
+    Returns:
+        Доли вариантов (сумма равна 1)
+    """
+    rewards = mean_rewards(positive, negative, weights)
+    # Число наблюдений варианта - число его вызовов
+    calls = positive[:, 0] + negative[:, 0]
+    bounds = rewards + exploration * np.sqrt(2 * np.log(max(calls.sum(), 1.0)) / np.maximum(calls, 1.0))
+    best = bounds >= bounds.max() - 1e-12
+    return best / best.sum()
+
+
+class BanditAllocator:
+    """
+    Статистика наград вариантов и фоновый пересчет их долей трафика
+
+    Пока вызовов меньше min_samples, доли не пересчитываются и действуют веса сервисов.
+    Каждый вариант получает не меньше своей минимальной доли, остаток делится
+    алгоритмом algorithm. Новые доли передаются в apply.
+    """
+
+    def __init__(self, services: Dict[str, ServiceConfig], config: BanditConfig,
+                 apply: Callable[[List[float]], None], previous: Optional["BanditAllocator"] = None):
+        """
+        Args:
+            services: Варианты эксперимента
+            config: Параметры режима bandit
+            apply: Применение долей вариантов (в порядке services)
+            previous: Распределитель прежней конфигурации; статистика сохранившихся
+                вариантов переходит от него, при том же наборе вариантов - и доли
+        """
+        if config.algorithm not in BANDIT_ALGORITHMS:
+            raise ValueError(f"Неизвестный алгоритм режима bandit: {config.algorithm}")
+        if config.interval <= 0 or config.latency_target <= 0 or config.samples <= 0 or config.half_life < 0:
+            raise ValueError("Некорректные параметры bandit: interval, latency_target и samples должны быть положительными")
+        rewards = config.rewards
+        if min(rewards.success, rewards.latency, rewards.quality) < 0 or rewards.success + rewards.latency + rewards.quality <= 0:
+            raise ValueError("Вклады сигналов bandit.rewards должны быть неотрицательными с положительной суммой")
+        self.floors = np.array(
+            [config.min_share if service.min_share is None else service.min_share for service in services.values()],
+            dtype=np.float64,
+        )
+        if (self.floors < 0).any() or self.floors.sum() > 1:
+            raise ValueError("Минимальные доли вариантов должны быть неотрицательными с суммой не больше 1")
+        self.config = config
+        self.names: List[str] = list(services.keys())
+        self._weights = np.array([rewards.success, rewards.latency, rewards.quality], dtype=np.float64)
+        inherited = previous.stats if previous is not None else {}
+        # Объекты статистики общие с прежним распределителем: исходы вызовов,
+        # завершившихся после перезагрузки, тоже учитываются
+        self.stats: Dict[str, RewardStats] = {name: inherited.get(name) or RewardStats() for name in self.names}
+        self.shares: Optional[np.ndarray] = None
+        if previous is not None and previous.names == self.names and previous.shares is not None:
+            self.shares = previous.shares
+        self._apply = apply
+        self._rng = np.random.default_rng()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, service_name: str, success: bool, latency: float) -> None:
+        """Учет исхода вызова сервиса"""
+        stats = self.stats.get(service_name)
+        if stats is not None:
+            stats.record_call(success, latency, self.config.latency_target)
+
+    def record_quality(self, service_name: str, score: float) -> bool:
+        """
+        Учет оценки качества генерации
+
+        Returns:
+            False, если варианта нет в эксперименте
+        """
+        stats = self.stats.get(service_name)
+        if stats is None:
+            return False
+        stats.record_quality(score)
+        update_bandit_feedback(service_name)
+        return True
+
+    def _matrices(self):
+        positive = np.array([self.stats[name].positive for name in self.names], dtype=np.float64)
+        negative = np.array([self.stats[name].negative for name in self.names], dtype=np.float64)
+        weights = self._weights
+        if not (positive[:, 2] + negative[:, 2]).any():
+            # Пока оценок качества нет, сигнал качества одинаков у всех вариантов и только добавляет шум
+            weights = weights * np.array([1.0, 1.0, 0.0])
+        if not weights.any():
+            weights = np.array([1.0, 0.0, 0.0])
+        return positive, negative, weights
+
+    def recompute(self) -> Optional[np.ndarray]:
+        """
+        Устаревание статистики за interval секунд и пересчет долей вариантов
+
+        Returns:
+            Доли вариантов или None, если вызовов пока меньше min_samples
+        """
+        if self.config.half_life > 0:
+            factor = 0.5 ** (self.config.interval / self.config.half_life)
+            for stats in self.stats.values():
+                stats.decay(factor)
+        positive, negative, weights = self._matrices()
+        if (positive[:, 0] + negative[:, 0]).sum() < self.config.min_samples:
+            return None
+        if self.config.algorithm == "thompson":
+            shares = thompson_shares(positive, negative, weights, self.config.samples, self._rng)
+        else:
+            shares = ucb_shares(positive, negative, weights, self.config.exploration)
+        shares = self.floors + (1 - self.floors.sum()) * shares
+        for name, share, reward in zip(self.names, shares, mean_rewards(positive, negative, weights)):
+            update_bandit_state(name, float(share), float(reward))
+        return shares
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.interval)
+            try:
+                shares = self.recompute()
+                if shares is not None:
+                    self.shares = shares
+                    self._apply(shares.tolist())
+            except Exception as e:
+                logger.error(f"Ошибка пересчета распределения bandit: {str(e)}", exc_info=True)
+
+    def start(self) -> None:
+        """Запуск фонового пересчета"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Остановка фонового пересчета"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def info(self) -> Dict[str, object]:
+        """Состояние распределения для /config"""
+        positive, negative, weights = self._matrices()
+        rewards = mean_rewards(positive, negative, weights)
+        return {
+            "algorithm": self.config.algorithm,
+            "shares": dict(zip(self.names, self.shares.tolist())) if self.shares is not None else None,
+            "variants": {
+                name: {
+                    "calls": round(float(positive[index, 0] + negative[index, 0]), 1),
+                    "success_rate": _ratio(positive[index, 0], negative[index, 0]),
+                    "latency_score": _ratio(positive[index, 1], negative[index, 1]),
+                    "quality": _ratio(positive[index, 2], negative[index, 2]),
+                    "reward": round(float(rewards[index]), 4),
+                    "min_share": float(self.floors[index]),
+                }
+                for index, name in enumerate(self.names)
+            },
+        }
+
+
+def _ratio(positive: float, negative: float) -> Optional[float]:
+    """Доля успехов по накопленной статистике (None, если наблюдений нет)"""
+    total = positive + negative
+    return round(float(positive / total), 4) if total > 0 else None
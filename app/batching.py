@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from app.models import GenerationResponse, ReviewInput, generation_review_id
+from app.prometheus_metrics import observe_coalesced_batch
+
+logger = logging.getLogger(__name__)
+
+SendBatch = Callable[[List[ReviewInput]], Awaitable[List[GenerationResponse]]]
+
+
+@dataclass
+class _PendingRequest:
+    reviews: List[ReviewInput]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class MicroBatcher:
+    """
+    Объединение отзывов из параллельных запросов к одному сервису
+
+    Отзывы копятся не дольше window секунд или до max_batch_size штук,
+    отправляются одним запросом, а генерации раздаются обратно ожидающим вызовам.
+    """
+
+    def __init__(self, service_name: str, send: SendBatch, window: float, max_batch_size: int):
+        self.service_name = service_name
+        self.send = send
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: List[_PendingRequest] = []
+        self._pending_size = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def submit(self, reviews: List[ReviewInput]) -> List[GenerationResponse]:
+        """
+        Ставит отзывы в очередь и ждет их генерации
+
+        Args:
+            reviews: Отзывы одного входящего запроса
+
+        Returns:
+            Генерации для переданных отзывов
+        """
+        loop = asyncio.get_running_loop()
+        pending = _PendingRequest(reviews=reviews, future=loop.create_future())
+
+        # Запрос не влезает в текущую пачку — отправляем накопленное отдельно
+        if self._pending and self._pending_size + len(reviews) > self.max_batch_size:
+            self._flush()
+
+        self._pending.append(pending)
+        self._pending_size += len(reviews)
+
+        if self._pending_size >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await pending.future
+
+    def _flush(self) -> None:
+        """Отправка накопленной пачки"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending, self._pending_size = self._pending, [], 0
+        task = asyncio.ensure_future(self._send_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send_batch(self, batch: List[_PendingRequest]) -> None:
+        """Один вызов сервиса для всей пачки и раздача результатов"""
+        reviews = [review for pending in batch for review in pending.reviews]
+        sent_at = time.perf_counter()
+        observe_coalesced_batch(
+            self.service_name,
+            len(reviews),
+            [sent_at - pending.enqueued_at for pending in batch],
+        )
+
+        try:
+            generations = await self.send(reviews)
+        except Exception as e:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+
+        if len(batch) == 1:
+            if not batch[0].future.done():
+                batch[0].future.set_result(generations)
+            return
+
+        # Раздаем генерации по идентификаторам отзывов
+        generations_by_id: Dict[str, Deque[GenerationResponse]] = defaultdict(deque)
+        for generation in generations:
+            review_id = generation_review_id(generation)
+            if review_id is None:
+                logger.warning(f"Генерация без идентификатора отзыва от сервиса {self.service_name} отброшена")
+                continue
+            generations_by_id[review_id].append(generation)
+
+        for pending in batch:
+            result = []
+            for review in pending.reviews:
+                matched = generations_by_id.get(str(review.id))
+                if matched:
+                    result.append(matched.popleft())
+            if not pending.future.done():
+                pending.future.set_result(result)
+
+    async def close(self) -> None:
+        """Отправка оставшихся отзывов и ожидание незавершенных пачек"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,199 @@
+"""
+Проверка и преобразование больших пачек отзывов без моделей Pydantic на каждый отзыв
+
+Пачка проверяется одним вызовом скомпилированного TypeAdapter по схеме TypedDict,
+повторяющей ReviewInput: pydantic-core обходит весь список за один проход и возвращает
+словари, уже готовые к сериализации, без создания моделей ReviewInput и WBUserDetails.
+Результат - ReviewBatch: строки для отправки в сервис, столбцы (id, nmId, оценки,
+объединенный текст) и легкие представления отзывов с атрибутами ReviewInput для
+распределения, кеша и журнала показов.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+from pydantic import TypeAdapter
+from typing_extensions import NotRequired, TypedDict
+
+from app.models import combine_review_text
+
+Identifier = Union[int, str]
+
+
+class _UserDetailsRecord(TypedDict):
+    name: str
+
+
+class _ReviewRecord(TypedDict):
+    """Схема ReviewInput для проверки пачки (поля и типы должны совпадать с моделью)"""
+
+    id: Identifier
+    globalUserId: Identifier
+    wbUserId: Identifier
+    imtId: Identifier
+    nmId: Identifier
+    wbUserDetails: _UserDetailsRecord
+    text: NotRequired[Optional[str]]
+    pros: NotRequired[Optional[str]]
+    cons: NotRequired[Optional[str]]
+    ProductValuation: NotRequired[Optional[int]]
+
+
+class _RequestRecord(TypedDict):
+    """Схема GenerateResponseRequest"""
+
+    reviews: List[_ReviewRecord]
+    priority: NotRequired[Optional[str]]
+
+
+_RECORDS = TypeAdapter(List[_ReviewRecord])
+_REQUEST = TypeAdapter(_RequestRecord)
+
+_RATING_MIN, _RATING_MAX = int(np.iinfo(np.int16).min), int(np.iinfo(np.int16).max)
+
+
+class UserDetails:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class BulkReview:
+    """
+    Отзыв из проверенной пачки: те же атрибуты, что у ReviewInput, без модели Pydantic
+
+    model_dump() возвращает проверенную строку пачки как есть, поэтому роутер
+    сериализует отзыв без повторного обхода полей.
+    """
+
+    __slots__ = ("id", "globalUserId", "wbUserId", "imtId", "nmId", "wbUserDetails",
+                 "text", "pros", "cons", "ProductValuation", "row")
+
+    def __init__(self, row: Dict[str, Any]):
+        self.row = row
+        self.id = row["id"]
+        self.globalUserId = row["globalUserId"]
+        self.wbUserId = row["wbUserId"]
+        self.imtId = row["imtId"]
+        self.nmId = row["nmId"]
+        self.wbUserDetails = UserDetails(row["wbUserDetails"]["name"])
+        self.text = row.get("text")
+        self.pros = row.get("pros")
+        self.cons = row.get("cons")
+        self.ProductValuation = row.get("ProductValuation")
+
+    def model_dump(self) -> Dict[str, Any]:
+        return self.row
+
+
+class ReviewBatch:
+    """
+    Проверенная пачка отзывов в столбцовом представлении
+
+    Используется вместо GenerateResponseRequest: у пачки есть reviews и priority,
+    а model_dump() возвращает тело запроса к сервису из проверенных строк.
+    """
+
+    __slots__ = ("rows", "reviews", "priority", "ids", "nm_ids", "ratings", "_texts")
+
+    def __init__(self, rows: List[Dict[str, Any]], priority: Optional[str] = None,
+                 reviews: Optional[List[BulkReview]] = None):
+        """
+        Args:
+            rows: Проверенные строки пачки
+            priority: Приоритет запроса (полоса ограничителя параллельности)
+            reviews: Готовые представления строк (при выборке из другой пачки)
+        """
+        self.rows = rows
+        self.reviews = reviews if reviews is not None else [BulkReview(row) for row in rows]
+        self.priority = priority
+        self.ids: List[Identifier] = [review.id for review in self.reviews]
+        self.nm_ids: List[Identifier] = [review.nmId for review in self.reviews]
+        # 0 - оценка не указана. ReviewInput принимает любое целое, поэтому значения вне int16
+        # прижимаются к границам типа: в формате Review оценка вне 1..5 все равно заменяется на 1
+        self.ratings = np.fromiter(
+            (min(max(review.ProductValuation or 0, _RATING_MIN), _RATING_MAX) for review in self.reviews),
+            dtype=np.int16,
+            count=len(self.reviews),
+        )
+        self._texts: Optional[List[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def texts(self) -> List[str]:
+        """Объединенный текст отзывов в формате Review (вычисляется один раз)"""
+        if self._texts is None:
+            self._texts = [combine_review_text(review.text, review.pros, review.cons) for review in self.reviews]
+        return self._texts
+
+    def model_dump(self) -> Dict[str, Any]:
+        """Тело запроса к сервису"""
+        return {"reviews": self.rows}
+
+    def select(self, positions: Iterable[int]) -> "ReviewBatch":
+        """Подпачка отзывов с указанными позициями"""
+        positions = list(positions)
+        return ReviewBatch(
+            [self.rows[position] for position in positions],
+            self.priority,
+            [self.reviews[position] for position in positions],
+        )
+
+    def review_records(self, recommendations: bool = False) -> List[Optional[Dict[str, Any]]]:
+        """
+        Отзывы в формате Review (как Review.from_kafka_input(...).model_dump()) без моделей
+
+        Returns:
+            Словари в порядке пачки; None для отзывов без текста
+        """
+        ratings = np.where(self.ratings == 0, 4, self.ratings)
+        # Оценка вне 1..5 заменяется так же, как в валидаторе Review.rating
+        ratings = np.where((ratings >= 1) & (ratings <= 5), ratings, 1).tolist()
+        return [
+            {
+                "id_review": str(review.id),
+                "id_user": str(review.globalUserId),
+                "user_name": str(review.wbUserDetails.name),
+                "nm_id": int(review.nmId),
+                "review": text,
+                "rating": rating,
+                "recommendations": recommendations,
+            } if text else None
+            for review, text, rating in zip(self.reviews, self.texts, ratings)
+        ]
+
+
+def validate_batch(records: Sequence[Any], priority: Optional[str] = None) -> ReviewBatch:
+    """
+    Проверка пачки разобранных отзывов одним вызовом
+
+    Args:
+        records: Отзывы в формате Kafka (словари)
+        priority: Приоритет запроса
+
+    Returns:
+        Проверенная пачка
+
+    Raises:
+        ValidationError: Ошибки с позицией отзыва в пачке первым элементом loc
+    """
+    return ReviewBatch(_RECORDS.validate_python(records), priority)
+
+
+def validate_request(envelope: Any) -> ReviewBatch:
+    """
+    Проверка разобранного тела запроса GenerateResponseRequest одним вызовом
+
+    Args:
+        envelope: Тело запроса (словарь с reviews и необязательным priority)
+
+    Returns:
+        Проверенная пачка с приоритетом из тела
+
+    Raises:
+        ValidationError: Ошибки с путем от корня тела (reviews, позиция отзыва, поле)
+    """
+    request = _REQUEST.validate_python(envelope)
+    return ReviewBatch(request["reviews"], request.get("priority"))
@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.models import GenerationResponse, ReviewInput
+from app.prometheus_metrics import update_cache_eviction, update_cache_lookup, update_cache_size
+
+logger = logging.getLogger(__name__)
+
+# Поля отзыва, от которых зависит генерация
+_CONTENT_FIELDS = ("text", "pros", "cons", "nmId", "ProductValuation")
+
+
+def _normalize(value: Any) -> str:
+    """Нормализация значения поля отзыва для ключа кеша"""
+    if value is None:
+        return ""
+    return " ".join(str(value).split())
+
+
+class ResponseCache:
+    """
+    LRU-кеш генераций с ограничением по объему и TTL
+
+    Ключ — хеш нормализованного содержимого отзыва и варианта. Параллельные
+    одинаковые отзывы ждут один вызов сервиса (singleflight).
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, int, GenerationResponse]]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key_for(review: ReviewInput, variant: str) -> str:
+        """
+        Ключ кеша для отзыва в варианте
+
+        Args:
+            review: Отзыв
+            variant: Имя сервиса
+
+        Returns:
+            Хеш нормализованного содержимого отзыва и варианта
+        """
+        parts = [variant] + [_normalize(getattr(review, name, None)) for name in _CONTENT_FIELDS]
+        return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str, service_name: str) -> Optional[GenerationResponse]:
+        """Генерация из кеша или None, если ее нет или она устарела"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, size, generation = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                update_cache_lookup(service_name, hit=True)
+                return generation
+            self._remove(key, reason="ttl")
+        update_cache_lookup(service_name, hit=False)
+        return None
+
+    def put(self, key: str, generation: GenerationResponse) -> None:
+        """Сохранение генерации с вытеснением самых старых записей при превышении объема"""
+        size = len(generation.model_dump_json())
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key, reason="replaced")
+        self._entries[key] = (time.monotonic() + self.ttl, size, generation)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key, reason="size")
+        update_cache_size(self._bytes, len(self._entries))
+
+    def _remove(self, key: str, reason: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        update_cache_eviction(reason)
+        update_cache_size(self._bytes, len(self._entries))
+
+    def inflight(self, key: str) -> Optional[asyncio.Future]:
+        """Незавершенный вызов сервиса для такого же отзыва"""
+        return self._inflight.get(key)
+
+    def start_flight(self, key: str) -> asyncio.Future:
+        """Регистрирует вызов сервиса для отзыва, который будут ждать дубликаты"""
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    def finish_flight(self, key: str, generation: Optional[GenerationResponse] = None,
+                      error: Optional[BaseException] = None) -> None:
+        """Завершает вызов: сохраняет результат в кеш и будит ожидающих"""
+        future = self._inflight.pop(key, None)
+        if generation is not None:
+            self.put(key, generation)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+            # Ожидающих может не быть — помечаем исключение как полученное
+            future.exception()
+        else:
+            future.set_result(generation)
+
+    def stats(self) -> Dict[str, int]:
+        """Текущий размер кеша"""
+        return {"entries": len(self._entries), "bytes": self._bytes, "inflight": len(self._inflight)}
+
+
+def rebind_generation(generation: GenerationResponse, review: ReviewInput) -> GenerationResponse:
+    """
+    Привязывает закешированную генерацию к запрошенному отзыву
+
+    Содержимое генерации общее для одинаковых отзывов, а идентификаторы
+    отзыва и пользователя в метаданных должны быть от текущего запроса.
+    """
+    original = generation.metadata.review
+    review_meta = original.model_copy(update={
+        "id_review": str(review.id),
+        "id_user": str(review.globalUserId),
+        "user_name": str(review.wbUserDetails.name),
+    })
+    metadata = generation.metadata.model_copy(update={"review": review_meta})
+    return generation.model_copy(update={"metadata": metadata})
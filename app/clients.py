@@ -0,0 +1,107 @@
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+from app.settings import ServiceConfig
+
+logger = logging.getLogger(__name__)
+
+
+class ClientPool:
+    """Долгоживущие HTTP-клиенты с пулом соединений для каждого сервиса"""
+
+    def __init__(self, services: Dict[str, ServiceConfig], timeout: float,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.services = services
+        self.timeout = timeout
+        # Общий транспорт для всех клиентов (используется бенчмарками вместо сети)
+        self.transport = transport
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _build_client(self, service: ServiceConfig) -> httpx.AsyncClient:
+        """
+        Создает клиента с настройками пула и таймаутов сервиса
+
+        Args:
+            service: Конфигурация сервиса
+
+        Returns:
+            Настроенный httpx.AsyncClient
+        """
+        read_timeout = service.read_timeout if service.read_timeout is not None else self.timeout
+        timeout = httpx.Timeout(
+            self.timeout,
+            connect=service.connect_timeout,
+            read=read_timeout,
+        )
+        limits = httpx.Limits(
+            max_connections=service.max_connections,
+            max_keepalive_connections=service.max_keepalive_connections,
+            keepalive_expiry=service.keepalive_expiry,
+        )
+        if self.transport is not None:
+            return httpx.AsyncClient(timeout=timeout, transport=self.transport)
+        try:
+            return httpx.AsyncClient(timeout=timeout, limits=limits, http2=service.http2)
+        except ImportError:
+            # Для HTTP/2 нужен пакет h2 (httpx[http2])
+            logger.warning(f"HTTP/2 недоступен для {service.url}: не установлен пакет h2. Используется HTTP/1.1")
+            return httpx.AsyncClient(timeout=timeout, limits=limits)
+
+    async def start(self) -> None:
+        """Создание клиентов для всех сконфигурированных сервисов"""
+        for name, service in self.services.items():
+            if name not in self._clients:
+                self._clients[name] = self._build_client(service)
+        logger.info(f"Пулы соединений созданы для сервисов: {list(self._clients)}")
+
+    async def close(self) -> None:
+        """Закрытие всех клиентов и их соединений"""
+        clients, self._clients = self._clients, {}
+        for name, client in clients.items():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"Ошибка при закрытии клиента сервиса {name}: {str(e)}")
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """
+        Возвращает клиента сервиса, создавая его при первом обращении
+
+        Args:
+            name: Имя сервиса
+
+        Returns:
+            httpx.AsyncClient сервиса
+        """
+        client = self._clients.get(name)
+        if client is None:
+            client = self._clients[name] = self._build_client(self.services[name])
+        return client
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Статистика пулов соединений по сервисам
+
+        Returns:
+            Словарь {сервис: {"connections": ..., "idle": ..., "pending": ...}}
+        """
+        result = {}
+        for name, client in self._clients.items():
+            pool = self._get_pool(client)
+            if pool is None:
+                continue
+            connections = list(pool.connections)
+            result[name] = {
+                "connections": len(connections),
+                "idle": sum(1 for connection in connections if connection.is_idle()),
+                "pending": len(getattr(pool, "_requests", ())),
+            }
+        return result
+
+    @staticmethod
+    def _get_pool(client: httpx.AsyncClient) -> Optional[object]:
+        """Пул соединений httpcore, лежащий под транспортом клиента"""
+        transport = getattr(client, "_transport", None)
+        return getattr(transport, "_pool", None)
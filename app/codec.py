@@ -0,0 +1,24 @@
+"""
+Быстрый JSON-кодек: orjson (зависимость проекта); без него - стандартный json
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - окружение без зависимостей проекта
+    orjson = None
+
+
+def loads(data: bytes) -> Any:
+    """Разбор JSON из байтов"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: Any) -> bytes:
+    """Сериализация в JSON-байты"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -1,9 +1,112 @@
+import os
 from pathlib import Path
 
 # Базовые пути
 BASE_DIR = Path(__file__).parent.parent
-CONFIG_PATH = BASE_DIR / "config.yaml"
+# Путь к конфигурации можно переопределить переменной AB_UTIL_CONFIG
+CONFIG_PATH = Path(os.environ.get("AB_UTIL_CONFIG", BASE_DIR / "config.yaml"))
 
 # Значения по умолчанию
 DEFAULT_TIMEOUT = 5
-DEFAULT_MODE = "triple" 
\ No newline at end of file
+DEFAULT_MODE = "triple"
+
+# Параметры пула соединений к сервисам по умолчанию
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+DEFAULT_CONNECT_TIMEOUT = 5.0
+
+# Детерминированное распределение по вариантам
+DEFAULT_ASSIGNMENT_STRATEGY = "random"
+DEFAULT_ASSIGNMENT_KEY = "globalUserId"
+DEFAULT_BUCKETS = 10000
+
+# Объединение запросов в пачки
+DEFAULT_COALESCING_WINDOW_MS = 20
+DEFAULT_COALESCING_MAX_BATCH_SIZE = 64
+
+# Кеш ответов
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_CACHE_TTL = 3600
+
+# Хеджирование запросов
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_HEDGE_MIN_DELAY = 0.5
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+
+# Автоматы отключения сервисов
+DEFAULT_BREAKER_WINDOW = 50
+DEFAULT_BREAKER_MIN_REQUESTS = 20
+DEFAULT_BREAKER_ERROR_RATE = 0.5
+DEFAULT_BREAKER_TIMEOUT_RATE = 0.3
+DEFAULT_BREAKER_LATENCY_OUTLIER_FACTOR = 3.0
+DEFAULT_BREAKER_OPEN_DURATION = 30
+DEFAULT_BREAKER_PROBE_INTERVAL = 5
+DEFAULT_BREAKER_PROBE_TIMEOUT = 5
+DEFAULT_BREAKER_PROBE_SUCCESSES = 2
+
+# Коэффициент сглаживания EWMA задержки для режима balanced
+DEFAULT_EWMA_ALPHA = 0.3
+
+# Запуск в нескольких процессах
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8000
+DEFAULT_PROMETHEUS_MULTIPROC_DIR = "/tmp/ab-util-prometheus"
+# Период обновления метрик пулов соединений в каждом процессе (в секундах)
+DEFAULT_POOL_METRICS_INTERVAL = 5
+
+# Перезагрузка конфигурации
+DEFAULT_RELOAD_INTERVAL = 5
+# Запас времени (секунды) сверх длительности запроса, после которого закрываются пулы старой конфигурации
+DEFAULT_RELOAD_DRAIN_GRACE = 5
+# Разгон веса варианта
+DEFAULT_RAMP_DURATION = 3600
+DEFAULT_RAMP_INTERVAL = 10
+
+# Журнал показов эксперимента
+DEFAULT_EXPOSURE_PATH = BASE_DIR / "exposure"
+DEFAULT_EXPOSURE_BUFFER_SIZE = 65536
+DEFAULT_EXPOSURE_FLUSH_INTERVAL = 1.0
+DEFAULT_EXPOSURE_OVERFLOW = "drop_newest"
+DEFAULT_EXPOSURE_MAX_FILE_BYTES = 64 * 1024 * 1024
+DEFAULT_EXPOSURE_ROTATE_INTERVAL = 3600
+DEFAULT_EXPOSURE_MAX_FILES = 168
+
+# Теневые сервисы
+DEFAULT_SHADOW_QUEUE_SIZE = 1000
+DEFAULT_SHADOW_CONCURRENCY = 8
+
+# Ограничение параллельности вызовов сервисов
+DEFAULT_ADMISSION_MAX_CONCURRENCY = 32
+DEFAULT_ADMISSION_MAX_QUEUE = 64
+# Максимальное ожидание слота, если дедлайн запроса не задан (секунды)
+DEFAULT_ADMISSION_MAX_WAIT = 10
+DEFAULT_ADMISSION_REJECT_STATUS = 503
+
+# Приоритеты запросов
+DEFAULT_PRIORITY_HEADER = "X-Priority"
+DEFAULT_PRIORITY_LANE = "default"
+
+# Замеры этапов обработки и профилирование
+# Доля запросов, для которых замеряются этапы обработки
+DEFAULT_PROFILING_SAMPLE_RATE = 0.01
+# Период выборки стеков профилировщиком (секунды) и максимальная длительность профилирования
+DEFAULT_PROFILING_INTERVAL = 0.005
+DEFAULT_PROFILING_MAX_SECONDS = 60
+
+# Режим bandit: распределение трафика по наградам вариантов
+DEFAULT_BANDIT_ALGORITHM = "thompson"
+# Период пересчета распределения (секунды)
+DEFAULT_BANDIT_INTERVAL = 10
+# Минимальная доля трафика каждого варианта (исследование)
+DEFAULT_BANDIT_MIN_SHARE = 0.05
+# Сколько вызовов всех вариантов нужно до первого пересчета (до этого действуют веса из конфигурации)
+DEFAULT_BANDIT_MIN_SAMPLES = 50
+# Время ответа, до которого вызов получает полную награду за задержку (секунды)
+DEFAULT_BANDIT_LATENCY_TARGET = 5.0
+# Период полураспада накопленной статистики (секунды)
+DEFAULT_BANDIT_HALF_LIFE = 600
+# Число выборок из апостериорных распределений при сэмплировании Томпсона
+DEFAULT_BANDIT_SAMPLES = 2000
+# Коэффициент исследования UCB
+DEFAULT_BANDIT_EXPLORATION = 1.0
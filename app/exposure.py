@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator, Optional
+
+import numpy as np
+
+from app.assignment import _key_to_int
+from app.prometheus_metrics import update_exposure_dropped, update_exposure_written
+from app.settings import ExposureConfig
+
+logger = logging.getLogger(__name__)
+
+# Запись журнала показов. Идентификаторы хранятся как 64-битные числа:
+# числовые значения как есть, остальные - стабильным хешем (как при распределении)
+EXPOSURE_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("review_id", "<u8"),
+    ("user_id", "<u8"),
+    ("nm_id", "<u8"),
+    ("variant", "S32"),
+    ("latency", "<f4"),
+    ("status", "u1"),
+    ("response_bytes", "<u4"),
+])
+# Коды поля status
+STATUSES = ("ok", "error", "timeout")
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest")
+FILE_PREFIX = "exposure-"
+# Файл журнала - последовательность блоков формата .npy (по одному на сброс буфера)
+FILE_SUFFIX = ".npys"
+
+
+def read_exposure_file(path: Path) -> Iterator[np.ndarray]:
+    """
+    Пачки записей из файла журнала
+
+    Недописанный последний блок (процесс остановлен во время записи) пропускается.
+
+    Args:
+        path: Путь к файлу журнала
+
+    Returns:
+        Итератор структурированных массивов с типом EXPOSURE_DTYPE
+    """
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        while file.tell() < size:
+            try:
+                yield np.load(file, allow_pickle=False)
+            except (ValueError, EOFError):
+                logger.warning(f"Файл журнала {path} обрезан на позиции {file.tell()}")
+                return
+
+
+class ExposureLog:
+    """
+    Журнал показов эксперимента: какой отзыв в какой вариант попал и чем закончился
+
+    Записи добавляются в кольцевой буфер в памяти (предвыделенный массив NumPy),
+    фоновая задача пачками переносит их в ротируемые файлы. Запись в буфер не
+    блокирует цикл событий; при переполнении записи теряются по политике overflow,
+    потери считаются в ab_util_exposure_dropped_total.
+    """
+
+    def __init__(self, config: ExposureConfig):
+        if config.overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения журнала: {config.overflow}")
+        if config.buffer_size <= 0:
+            raise ValueError("Размер буфера журнала должен быть положительным")
+        self.config = config
+        self.path = Path(config.path)
+        self._buffer = np.zeros(config.buffer_size, dtype=EXPOSURE_DTYPE)
+        self._start = 0
+        self._size = 0
+        # Сброс начинается досрочно, когда буфер заполнен наполовину
+        self._flush_threshold = max(config.buffer_size // 2, 1)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._file: Optional[BinaryIO] = None
+        self._file_opened_at = 0.0
+        self._file_bytes = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def record(
+        self,
+        review_id: Any,
+        user_id: Any,
+        nm_id: Any,
+        variant: str,
+        latency: float,
+        status: str,
+        response_bytes: int,
+    ) -> None:
+        """
+        Добавление записи в буфер
+
+        Args:
+            review_id: Идентификатор отзыва
+            user_id: Идентификатор пользователя
+            nm_id: Идентификатор товара
+            variant: Вариант, обработавший отзыв
+            latency: Время обработки запроса (секунды)
+            status: Исход: ok, error или timeout
+            response_bytes: Размер сгенерированного ответа (байт)
+        """
+        capacity = len(self._buffer)
+        if self._size == capacity:
+            update_exposure_dropped(self.config.overflow)
+            if self.config.overflow == "drop_newest":
+                return
+            self._start = (self._start + 1) % capacity
+            self._size -= 1
+        position = (self._start + self._size) % capacity
+        self._buffer[position] = (
+            time.time(),
+            _key_to_int(review_id),
+            _key_to_int(user_id) if user_id is not None else 0,
+            _key_to_int(nm_id) if nm_id is not None else 0,
+            variant.encode("utf-8"),
+            latency,
+            STATUSES.index(status),
+            response_bytes,
+        )
+        self._size += 1
+        if self._size >= self._flush_threshold:
+            self._wakeup.set()
+
+    def _drain(self) -> Optional[np.ndarray]:
+        """Копия накопленных записей; буфер освобождается"""
+        if not self._size:
+            return None
+        capacity = len(self._buffer)
+        end = self._start + self._size
+        if end <= capacity:
+            chunk = self._buffer[self._start:end].copy()
+        else:
+            chunk = np.concatenate((self._buffer[self._start:], self._buffer[:end - capacity]))
+        self._start = end % capacity
+        self._size = 0
+        return chunk
+
+    async def flush(self) -> None:
+        """Перенос накопленных записей в файл (запись выполняется в отдельном потоке)"""
+        chunk = self._drain()
+        if chunk is None:
+            return
+        started_at = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._write, chunk)
+        except Exception as e:
+            logger.error(f"Ошибка записи журнала показов: {str(e)}")
+            update_exposure_dropped("write_error", len(chunk))
+            return
+        update_exposure_written(len(chunk), time.perf_counter() - started_at)
+
+    def _write(self, chunk: np.ndarray) -> None:
+        self._rotate_if_needed()
+        np.save(self._file, chunk, allow_pickle=False)
+        self._file.flush()
+        self._file_bytes = self._file.tell()
+
+    def _rotate_if_needed(self) -> None:
+        """Открытие нового файла по размеру или возрасту текущего"""
+        now = time.time()
+        if (
+            self._file is not None
+            and self._file_bytes < self.config.max_file_bytes
+            and now - self._file_opened_at < self.config.rotate_interval
+        ):
+            return
+        if self._file is not None:
+            self._file.close()
+        self.path.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}"
+        file_path = self.path / f"{FILE_PREFIX}{stamp}-{os.getpid()}{FILE_SUFFIX}"
+        self._file = open(file_path, "ab")
+        self._file_opened_at = now
+        self._file_bytes = self._file.tell()
+        logger.info(f"Журнал показов пишется в {file_path}")
+        self._remove_old_files()
+
+    def _remove_old_files(self) -> None:
+        """Удаление самых старых файлов сверх max_files (по всем процессам)"""
+        # Имя начинается с момента создания, поэтому сортировка по имени упорядочивает по времени
+        files = sorted(self.path.glob(f"{FILE_PREFIX}*{FILE_SUFFIX}"), key=lambda path: path.name)
+        for path in files[:max(len(files) - self.config.max_files, 0)]:
+            try:
+                path.unlink()
+            except OSError as e:
+                logger.warning(f"Не удалось удалить файл журнала {path}: {str(e)}")
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.config.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        """Запуск фонового сброса буфера"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Остановка фонового сброса, запись остатка буфера и закрытие файла"""
+        if self._task is not None:
+            # Задачу не отменяем: запись в файл из потока не должна пересечься с финальной
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
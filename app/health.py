@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.prometheus_metrics import update_breaker_state, update_breaker_trips
+from app.settings import BreakerConfig
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Автомат отключения сервиса по доле ошибок, таймаутов и задержке
+
+    closed -> open: сервис исключается из распределения;
+    open -> half_open: по истечении open_duration фоновый проб проверяет сервис;
+    half_open -> closed: после probe_successes успешных проверок подряд.
+    """
+
+    def __init__(self, service_name: str, config: BreakerConfig):
+        self.service_name = service_name
+        self.config = config
+        self.state = CLOSED
+        self.reason: Optional[str] = None
+        self.opened_at = 0.0
+        self.probe_successes = 0
+        # Исходы последних вызовов: (успех, таймаут, задержка)
+        self._outcomes: Deque[Tuple[bool, bool, float]] = deque(maxlen=config.window)
+        update_breaker_state(service_name, self.state)
+
+    @property
+    def available(self) -> bool:
+        """Можно ли направлять в сервис пользовательский трафик"""
+        return self.state == CLOSED
+
+    def record(self, success: bool, timeout: bool, latency: float, can_trip: bool = True) -> bool:
+        """
+        Учет исхода вызова сервиса
+
+        Args:
+            success: Вызов завершился успешно
+            timeout: Вызов завершился таймаутом
+            latency: Задержка вызова
+            can_trip: Разрешено ли исключать сервис по итогам этого вызова
+
+        Returns:
+            True, если автомат сработал и сервис исключен
+        """
+        if self.state != CLOSED:
+            return False
+        self._outcomes.append((success, timeout, latency))
+        if not can_trip or len(self._outcomes) < self.config.min_requests:
+            return False
+
+        failures = sum(1 for ok, _, _ in self._outcomes if not ok)
+        timeouts = sum(1 for _, timed_out, _ in self._outcomes if timed_out)
+        if timeouts / len(self._outcomes) >= self.config.timeout_rate:
+            self.trip("timeout_rate")
+            return True
+        if failures / len(self._outcomes) >= self.config.error_rate:
+            self.trip("error_rate")
+            return True
+        return False
+
+    def median_latency(self) -> Optional[float]:
+        """Медиана задержки успешных вызовов в окне"""
+        latencies = [latency for ok, _, latency in self._outcomes if ok]
+        if len(latencies) < self.config.min_requests:
+            return None
+        return float(np.median(latencies))
+
+    def trip(self, reason: str) -> None:
+        """Исключение сервиса из распределения"""
+        logger.warning(f"Сервис {self.service_name} исключен из распределения: {reason}")
+        self.state = OPEN
+        self.reason = reason
+        self.opened_at = time.monotonic()
+        self.probe_successes = 0
+        self._outcomes.clear()
+        update_breaker_state(self.service_name, self.state)
+        update_breaker_trips(self.service_name, reason)
+
+    def ready_for_probe(self) -> bool:
+        """Пора ли проверять исключенный сервис"""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.config.open_duration:
+            self.state = HALF_OPEN
+            update_breaker_state(self.service_name, self.state)
+        return self.state == HALF_OPEN
+
+    def probe_result(self, success: bool) -> bool:
+        """
+        Учет результата активной проверки
+
+        Returns:
+            True, если сервис восстановлен и возвращен в распределение
+        """
+        if self.state != HALF_OPEN:
+            return False
+        if not success:
+            self.trip("probe_failed")
+            return False
+        self.probe_successes += 1
+        if self.probe_successes < self.config.probe_successes:
+            return False
+        logger.info(f"Сервис {self.service_name} восстановлен и возвращен в распределение")
+        self.state = CLOSED
+        self.reason = None
+        update_breaker_state(self.service_name, self.state)
+        return True
+
+    def info(self) -> Dict[str, object]:
+        """Состояние автомата для /config"""
+        return {"state": self.state, "reason": self.reason, "window": len(self._outcomes)}
+
+
+Probe = Callable[[str], Awaitable[bool]]
+
+
+class HealthMonitor:
+    """
+    Автоматы отключения всех сервисов и фоновая проверка исключенных
+
+    При каждом изменении набора доступных сервисов вызывается on_change
+    со списком исключенных сервисов.
+    """
+
+    def __init__(self, services: List[str], config: BreakerConfig, probe: Probe,
+                 on_change: Callable[[List[str]], None],
+                 breakers: Optional[Dict[str, CircuitBreaker]] = None):
+        """
+        Args:
+            services: Имена сервисов
+            config: Параметры автоматов
+            probe: Активная проверка сервиса
+            on_change: Вызывается со списком исключенных сервисов при его изменении
+            breakers: Автоматы, перешедшие из прежней конфигурации (состояние сохраняется)
+        """
+        self.config = config
+        breakers = breakers or {}
+        self.breakers: Dict[str, CircuitBreaker] = {
+            name: breakers[name] if name in breakers else CircuitBreaker(name, config) for name in services
+        }
+        self._probe = probe
+        self._on_change = on_change
+        self._task: Optional[asyncio.Task] = None
+
+    def is_available(self, service_name: str) -> bool:
+        breaker = self.breakers.get(service_name)
+        return breaker is None or breaker.available
+
+    @property
+    def ejected(self) -> List[str]:
+        """Сервисы, исключенные из распределения"""
+        return [name for name, breaker in self.breakers.items() if not breaker.available]
+
+    def record(self, service_name: str, success: bool, timeout: bool, latency: float) -> None:
+        """Учет исхода вызова сервиса"""
+        breaker = self.breakers.get(service_name)
+        if breaker is None:
+            return
+        # Последний доступный сервис не исключаем: отвечать ошибками лучше, чем не отвечать никак
+        can_trip = len(self.ejected) < len(self.breakers) - 1
+        if breaker.record(success, timeout, latency, can_trip=can_trip):
+            self._on_change(self.ejected)
+
+    def check_outliers(self) -> None:
+        """Исключение сервисов, медианная задержка которых сильно выше, чем у остальных"""
+        if self.config.latency_outlier_factor <= 0:
+            return
+        medians = {
+            name: median
+            for name, breaker in self.breakers.items()
+            if breaker.available and (median := breaker.median_latency()) is not None
+        }
+        if len(medians) < 2:
+            return
+        for name, median in medians.items():
+            others = [value for other, value in medians.items() if other != name]
+            if median > self.config.latency_outlier_factor * float(np.median(others)):
+                if len(self.ejected) >= len(self.breakers) - 1:
+                    return
+                self.breakers[name].trip("latency_outlier")
+                self._on_change(self.ejected)
+
+    async def _probe_once(self) -> None:
+        """Один проход проверки исключенных сервисов"""
+        for name, breaker in self.breakers.items():
+            if not breaker.ready_for_probe():
+                continue
+            try:
+                success = await self._probe(name)
+            except Exception as e:
+                logger.warning(f"Проверка сервиса {name} не удалась: {str(e)}")
+                success = False
+            if breaker.probe_result(success):
+                self._on_change(self.ejected)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.probe_interval)
+            try:
+                self.check_outliers()
+                await self._probe_once()
+            except Exception as e:
+                logger.error(f"Ошибка фоновой проверки сервисов: {str(e)}", exc_info=True)
+
+    def start(self) -> None:
+        """Запуск фоновой проверки"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Остановка фоновой проверки"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
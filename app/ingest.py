@@ -0,0 +1,463 @@
+"""
+Пакетная обработка отзывов из файлов JSONL (локальная замена топика Kafka)
+
+Каждая строка входа - отзыв в формате Kafka (ReviewInput). Строки читаются потоково,
+проверяются пачками по --batch-size одним вызовом валидации (app.bulk) и отправляются через
+ServiceRouter (с теми же вариантами, кешем, резервированием и журналом показов, что
+и в HTTP-эндпоинтах), не больше --concurrency пачек одновременно. Результаты пишутся
+в --output в порядке входа, по строке JSON на отзыв:
+
+    {"id": 1, "variant": "service_a", "generation": {...}}
+    {"id": 2, "error": {"id": 2, "service": "service_b", "error": "..."}}
+    {"source": "reviews.jsonl", "line": 17, "error": "..."}
+
+Последняя форма - строка входа, не прошедшая проверку. Вместе с записанными пачками
+в --checkpoint сохраняются смещение во входе и размер выхода, поэтому запуск с --resume
+продолжает с места остановки: выход обрезается до сохраненного размера, и отзывы
+не повторяются и не теряются. Для stdin при возобновлении пропускается сохраненное
+число байтов, так что на вход нужно подать тот же поток.
+
+    python -m app.ingest reviews.jsonl --output results.jsonl --checkpoint ingest.json --resume
+    cat reviews.jsonl | python -m app.ingest - --output results.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, BinaryIO, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pydantic import ValidationError
+
+from app import codec
+from app.admission import AdmissionRejected
+from app.bulk import ReviewBatch, validate_batch
+from app.constants import CONFIG_PATH
+from app.models import generation_review_id
+from app.services import ServiceRouter
+from app.settings import read_config
+
+logger = logging.getLogger(__name__)
+
+STDIN = "-"
+
+
+@dataclass
+class Checkpoint:
+    """Позиция обработки: все строки до (source, offset) обработаны и записаны в выход"""
+
+    inputs: List[str]
+    # Номер входа, смещение в нем (байты) и номер следующей строки
+    source: int = 0
+    offset: int = 0
+    line: int = 0
+    # Размер выхода, в котором записаны результаты всех строк до позиции
+    output_bytes: int = 0
+    reviews: int = 0
+
+    @classmethod
+    def load(cls, path: Path) -> "Checkpoint":
+        with open(path, "r", encoding="utf-8") as file:
+            return cls(**json.load(file))
+
+    def save(self, path: Path) -> None:
+        """Атомарная запись: прерванный процесс оставляет предыдущую позицию"""
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(asdict(self), file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+
+@dataclass
+class Chunk:
+    """Пачка строк входа для одного вызова роутера"""
+
+    source: int
+    # Позиция сразу после последней строки пачки
+    offset: int
+    line: int
+    # (номер строки, сырая строка)
+    lines: List[Tuple[int, bytes]] = field(default_factory=list)
+
+
+@dataclass
+class IngestStats:
+    reviews: int = 0
+    generated: int = 0
+    failed: int = 0
+    invalid: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    def rate(self) -> float:
+        """Отзывов в секунду с начала обработки"""
+        elapsed = time.perf_counter() - self.started_at
+        return self.reviews / elapsed if elapsed > 0 else 0.0
+
+
+def _open_input(name: str) -> BinaryIO:
+    return sys.stdin.buffer if name == STDIN else open(name, "rb")
+
+
+def read_chunks(checkpoint: Checkpoint, batch_size: int) -> Iterator[Chunk]:
+    """
+    Пачки непустых строк входов, начиная с позиции checkpoint
+
+    Args:
+        checkpoint: Позиция, с которой продолжается чтение
+        batch_size: Отзывов в пачке
+
+    Returns:
+        Итератор пачек с позициями их окончания
+    """
+    for source in range(checkpoint.source, len(checkpoint.inputs)):
+        name = checkpoint.inputs[source]
+        offset, line = (checkpoint.offset, checkpoint.line) if source == checkpoint.source else (0, 0)
+        file = _open_input(name)
+        try:
+            if offset:
+                if name == STDIN:
+                    skipped = 0
+                    while skipped < offset:
+                        block = file.read(min(offset - skipped, 1 << 20))
+                        if not block:
+                            raise ValueError(f"Вход {name} короче сохраненного смещения {offset}")
+                        skipped += len(block)
+                else:
+                    file.seek(offset)
+            chunk = Chunk(source=source, offset=offset, line=line)
+            started_line = line
+            for raw in file:
+                offset += len(raw)
+                line += 1
+                if raw.strip():
+                    chunk.lines.append((line, raw))
+                chunk.offset, chunk.line = offset, line
+                if len(chunk.lines) >= batch_size:
+                    yield chunk
+                    chunk = Chunk(source=source, offset=offset, line=line)
+                    started_line = line
+            if chunk.lines or line > started_line:
+                # Хвост входа из пустых строк тоже сдвигает позицию
+                yield chunk
+        finally:
+            if name != STDIN:
+                file.close()
+
+
+def _error_messages(error: ValidationError) -> Dict[int, str]:
+    """Первая ошибка валидации для каждой позиции пачки"""
+    messages: Dict[int, str] = {}
+    for item in error.errors(include_url=False):
+        messages.setdefault(item["loc"][0], f"{'.'.join(map(str, item['loc'][1:]))}: {item['msg']}")
+    return messages
+
+
+def _record_error(record: Any, priority: Optional[str]) -> Optional[str]:
+    """Причина, по которой отзыв не проходит проверку отдельно от пачки (None - проходит)"""
+    try:
+        validate_batch([record], priority)
+    except ValidationError as e:
+        return _error_messages(e)[0]
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def validate_chunk(
+    chunk: Chunk,
+    source_name: str,
+    priority: Optional[str] = None,
+) -> Tuple[List[int], ReviewBatch, Dict[int, Dict[str, Any]]]:
+    """
+    Разбор и проверка пачки одним вызовом валидации
+
+    Если пачка не проходит проверку, некорректные строки определяются по позициям
+    в ошибках валидации, а остальные проверяются повторно. Если сбой не указывает
+    на строку, отзывы проверяются по одному: любая ошибка записи становится
+    результатом ее строки и не останавливает обработку входа.
+
+    Returns:
+        Номера строк корректных отзывов, их пачка и результаты для некорректных строк
+    """
+    invalid: Dict[int, Dict[str, Any]] = {}
+    line_numbers: List[int] = []
+    records: List[Any] = []
+    for line, raw in chunk.lines:
+        try:
+            records.append(codec.loads(raw))
+        except Exception as e:
+            invalid[line] = {"source": source_name, "line": line, "error": f"Некорректный JSON: {e}"}
+            continue
+        line_numbers.append(line)
+
+    valid = list(range(len(records)))
+    while True:
+        try:
+            batch = validate_batch([records[position] for position in valid], priority)
+            break
+        except ValidationError as e:
+            errors = {valid[position]: message for position, message in _error_messages(e).items()}
+        except Exception as e:
+            errors = {}
+            for position in valid:
+                message = _record_error(records[position], priority)
+                if message is not None:
+                    errors[position] = message
+            if not errors:
+                # Каждый отзыв проходит проверку отдельно, но пачка - нет
+                errors = {position: f"{type(e).__name__}: {e}" for position in valid}
+        for position, message in errors.items():
+            line = line_numbers[position]
+            invalid[line] = {"source": source_name, "line": line, "error": message}
+        valid = [position for position in valid if position not in errors]
+    return [line_numbers[position] for position in valid], batch, invalid
+
+
+async def process_chunk(
+    router: ServiceRouter,
+    chunk: Chunk,
+    source_name: str,
+    priority: Optional[str],
+    retries: int,
+) -> Tuple[List[bytes], IngestStats]:
+    """
+    Обработка пачки через роутер
+
+    Пачка, отклоненная ограничителем параллельности, повторяется до retries раз
+    через Retry-After; прочие ошибки записываются в результат каждого отзыва пачки.
+
+    Returns:
+        Строки выхода в порядке входа и счетчики пачки
+    """
+    line_numbers, batch, invalid = validate_chunk(chunk, source_name, priority)
+    results: Dict[int, Dict[str, Any]] = dict(invalid)
+    stats = IngestStats(invalid=len(invalid))
+    if len(batch):
+        generations: Dict[str, Any] = {}
+        errors: Dict[str, Dict[str, Any]] = {}
+        for attempt in range(retries + 1):
+            try:
+                response = await router.route_batch(batch)
+            except AdmissionRejected as e:
+                if attempt < retries:
+                    await asyncio.sleep(max(e.retry_after, 0.1))
+                    continue
+                failure = {"service": e.service_name, "error": str(e)}
+            except asyncio.TimeoutError:
+                failure = {"service": "", "error": "Deadline exceeded"}
+            except Exception as e:
+                failure = {"service": "", "error": str(e)}
+            else:
+                generations = {generation_review_id(generation): generation for generation in response.generations}
+                errors = {str(error.id): error.model_dump(mode="json") for error in response.errors or ()}
+                failure = {"service": "", "error": "Сервис не вернул генерацию для отзыва"}
+            break
+
+        for line, review in zip(line_numbers, batch.reviews):
+            review_id = str(review.id)
+            generation = generations.get(review_id)
+            if generation is not None:
+                results[line] = {"id": review.id, "variant": generation.variant, "generation": generation.model_dump(mode="json")}
+                stats.generated += 1
+            else:
+                results[line] = {"id": review.id, "error": errors.get(review_id) or {"id": review.id, **failure}}
+                stats.failed += 1
+    stats.reviews = len(chunk.lines)
+    return [codec.dumps(results[line]) + b"\n" for line in sorted(results)], stats
+
+
+async def ingest(
+    router: ServiceRouter,
+    checkpoint: Checkpoint,
+    output: BinaryIO,
+    checkpoint_path: Optional[Path],
+    batch_size: int = 100,
+    concurrency: int = 8,
+    priority: Optional[str] = None,
+    retries: int = 3,
+    checkpoint_interval: float = 1.0,
+    report_interval: float = 10.0,
+) -> IngestStats:
+    """
+    Обработка входов с позиции checkpoint
+
+    Пачки выполняются параллельно, но записываются в выход по порядку: позиция
+    сохраняется только после записи всех предшествующих ей результатов.
+
+    Args:
+        router: Запущенный роутер
+        checkpoint: Начальная позиция (обновляется по мере записи)
+        output: Выход, открытый на дозапись с позиции checkpoint.output_bytes
+        checkpoint_path: Куда сохранять позицию (None - не сохранять)
+        batch_size: Отзывов в пачке
+        concurrency: Пачек в обработке одновременно
+        priority: Приоритет запросов (полоса ограничителя параллельности)
+        retries: Повторов пачки, отклоненной ограничителем параллельности
+        checkpoint_interval: Период сохранения позиции (секунды)
+        report_interval: Период вывода скорости обработки (секунды)
+
+    Returns:
+        Итоговые счетчики
+    """
+    stats = IngestStats()
+    slots = asyncio.Semaphore(concurrency)
+    # Завершенные пачки ждут записи, пока не завершатся все предыдущие
+    pending: Deque[Tuple[Chunk, asyncio.Task]] = deque()
+    saved_at = reported_at = time.perf_counter()
+    reported_reviews = 0
+
+    def write_ready() -> None:
+        nonlocal saved_at, reported_at, reported_reviews
+        while pending and pending[0][1].done():
+            chunk, task = pending.popleft()
+            lines, chunk_stats = task.result()
+            output.writelines(lines)
+            stats.reviews += chunk_stats.reviews
+            stats.generated += chunk_stats.generated
+            stats.failed += chunk_stats.failed
+            stats.invalid += chunk_stats.invalid
+            checkpoint.source, checkpoint.offset, checkpoint.line = chunk.source, chunk.offset, chunk.line
+            checkpoint.reviews += chunk_stats.reviews
+        now = time.perf_counter()
+        if checkpoint_path is not None and now - saved_at >= checkpoint_interval:
+            save()
+            saved_at = now
+        if now - reported_at >= report_interval:
+            print(
+                f"Обработано {stats.reviews} отзывов: {(stats.reviews - reported_reviews) / (now - reported_at):.1f} отз/с "
+                f"за последние {now - reported_at:.0f} с, {stats.rate():.1f} отз/с в среднем",
+                file=sys.stderr,
+            )
+            reported_at, reported_reviews = now, stats.reviews
+
+    def save() -> None:
+        output.flush()
+        os.fsync(output.fileno())
+        checkpoint.output_bytes = output.tell()
+        checkpoint.save(checkpoint_path)
+
+    async def run(chunk: Chunk) -> Tuple[List[bytes], IngestStats]:
+        try:
+            return await process_chunk(router, chunk, checkpoint.inputs[chunk.source], priority, retries)
+        finally:
+            slots.release()
+
+    try:
+        for chunk in read_chunks(checkpoint, batch_size):
+            await slots.acquire()
+            write_ready()
+            pending.append((chunk, asyncio.ensure_future(run(chunk))))
+            # Не копим в памяти результаты за долго выполняющейся пачкой
+            if len(pending) > 4 * concurrency:
+                await asyncio.wait([pending[0][1]])
+        while pending:
+            await asyncio.wait([pending[0][1]])
+            write_ready()
+    finally:
+        for _, task in pending:
+            task.cancel()
+        if checkpoint_path is not None:
+            save()
+        else:
+            output.flush()
+    return stats
+
+
+def _open_output(path: str, checkpoint: Checkpoint, resume: bool) -> BinaryIO:
+    if path == STDIN:
+        return sys.stdout.buffer
+    if not resume:
+        return open(path, "wb")
+    output = open(path, "r+b") if os.path.exists(path) else open(path, "w+b")
+    size = output.seek(0, os.SEEK_END)
+    if size < checkpoint.output_bytes:
+        output.close()
+        raise ValueError(f"Выход {path} короче сохраненного в позиции ({size} < {checkpoint.output_bytes} байт)")
+    # Результаты пачек, записанные после сохранения позиции, будут получены повторно
+    output.truncate(checkpoint.output_bytes)
+    output.seek(checkpoint.output_bytes)
+    return output
+
+
+async def _main(args: argparse.Namespace, checkpoint: Checkpoint) -> IngestStats:
+    router = ServiceRouter(read_config(args.config))
+    await router.startup()
+    output = _open_output(args.output, checkpoint, args.resume)
+    try:
+        return await ingest(
+            router,
+            checkpoint,
+            output,
+            args.checkpoint,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            priority=args.priority,
+            retries=args.retries,
+            checkpoint_interval=args.checkpoint_interval,
+            report_interval=args.report_interval,
+        )
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        await router.shutdown()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="Файлы JSONL с отзывами ('-' - stdin)")
+    parser.add_argument("--output", required=True, help="Файл результатов JSONL ('-' - stdout)")
+    parser.add_argument("--checkpoint", type=Path, default=None, help="Файл позиции обработки")
+    parser.add_argument("--resume", action="store_true", help="Продолжить с позиции из --checkpoint")
+    parser.add_argument("--config", type=Path, default=CONFIG_PATH, help="Конфигурация роутера")
+    parser.add_argument("--batch-size", type=int, default=100, help="Отзывов в запросе к сервису")
+    parser.add_argument("--concurrency", type=int, default=8, help="Пачек в обработке одновременно")
+    parser.add_argument("--priority", default=None, help="Приоритет запросов (полоса priority.lanes)")
+    parser.add_argument("--retries", type=int, default=3, help="Повторов пачки при перегрузке сервисов")
+    parser.add_argument("--checkpoint-interval", type=float, default=1.0, help="Период сохранения позиции, с")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="Период вывода скорости, с")
+    args = parser.parse_args(argv)
+
+    if args.batch_size <= 0 or args.concurrency <= 0:
+        parser.error("--batch-size и --concurrency должны быть положительными")
+    if args.inputs.count(STDIN) > 1:
+        parser.error("stdin можно указать только один раз")
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume требует --checkpoint")
+    if args.checkpoint is not None and args.output == STDIN:
+        parser.error("Позиция сохраняется только при записи в файл")
+
+    if args.resume and args.checkpoint.exists():
+        checkpoint = Checkpoint.load(args.checkpoint)
+        if checkpoint.inputs != args.inputs:
+            parser.error(f"Позиция сохранена для других входов: {checkpoint.inputs}")
+        print(f"Продолжение с {checkpoint.inputs[min(checkpoint.source, len(checkpoint.inputs) - 1)]}, "
+              f"строка {checkpoint.line} ({checkpoint.reviews} отзывов обработано ранее)", file=sys.stderr)
+    else:
+        checkpoint = Checkpoint(inputs=args.inputs)
+
+    try:
+        stats = asyncio.run(_main(args, checkpoint))
+    except ValueError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        print(f"Обработка прервана, позиция: строка {checkpoint.line} входа "
+              f"{checkpoint.inputs[checkpoint.source]}", file=sys.stderr)
+        sys.exit(130)
+    elapsed = time.perf_counter() - stats.started_at
+    print(
+        f"Обработано {stats.reviews} отзывов за {elapsed:.1f} с ({stats.rate():.1f} отз/с): "
+        f"генераций {stats.generated}, ошибок {stats.failed}, некорректных строк {stats.invalid}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,36 @@
+from typing import Optional
+
+import numpy as np
+
+
+class LatencyWindow:
+    """Скользящее окно последних задержек сервиса (кольцевой буфер)"""
+
+    def __init__(self, size: int = 512):
+        self._values = np.zeros(size, dtype=np.float64)
+        self._position = 0
+        self._count = 0
+
+    def add(self, latency: float) -> None:
+        """Добавление задержки в окно"""
+        self._values[self._position] = latency
+        self._position = (self._position + 1) % len(self._values)
+        if self._count < len(self._values):
+            self._count += 1
+
+    def __len__(self) -> int:
+        return self._count
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Перцентиль задержки по окну
+
+        Args:
+            q: Перцентиль от 0 до 100
+
+        Returns:
+            Значение перцентиля или None, если замеров нет
+        """
+        if not self._count:
+            return None
+        return float(np.percentile(self._values[:self._count], q))
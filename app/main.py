@@ -1,13 +1,33 @@
+import asyncio
 import logging
-from typing import List
+import math
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Request, status
+from fastapi.exceptions import RequestValidationError
 from pydantic import ValidationError
-from app.models import GenerateResponseRequest, AnswerOutput, Review, ReviewGenerationRequest, ReviewGenerationResponse, GenerationResponse, ProcessedReview
-from starlette.responses import Response, JSONResponse
-from app.services import service_router
+from app.models import GenerateResponseRequest, AnswerOutput, FeedbackRequest, Review, ReviewGenerationRequest, ReviewGenerationResponse, GenerationResponse, ProcessedReview
+from starlette.background import BackgroundTask
+from starlette.responses import Response, JSONResponse, PlainTextResponse, StreamingResponse
+from app import codec
+from app.admission import AdmissionRejected
+from app.bulk import validate_request
+from app.profiling import ProfilingMiddleware, SamplingProfiler, observe_since_start
+from app.reload import config_reloader
+from app.services import NDJSON_MEDIA_TYPE, STREAM_ORDERS
 from app.settings import settings
-from .prometheus_metrics import generate_latest, CONTENT_TYPE_LATEST
+from .prometheus_metrics import (
+    CONTENT_TYPE_LATEST,
+    generate_metrics,
+    mark_worker_stopped,
+    update_pipeline_errors,
+    update_pool_metrics,
+    update_received_messages,
+    update_total_errors,
+)
 
 
 # Настройка логирования
@@ -17,56 +37,294 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Создание и закрытие пулов соединений к сервисам"""
+    await config_reloader.start()
+    try:
+        yield
+    finally:
+        await config_reloader.stop()
+        mark_worker_stopped()
+
 app = FastAPI(
     title="A/B Testing Router",
     description="Балансировщик для A/B-тестирования сервисов",
     version="1.0.0",
+    lifespan=lifespan,
 )
+app.add_middleware(ProfilingMiddleware, sample_rate=lambda: config_reloader.router.config.profiling.sample_rate)
+
+# Одновременно выполняется не больше одного профилирования
+_profile_lock = asyncio.Lock()
+
+def overloaded(error: AdmissionRejected) -> HTTPException:
+    """Ответ при отказе в вызове перегруженного сервиса"""
+    logger.warning(f"Запрос отклонен: {str(error)}")
+    return HTTPException(
+        status_code=config_reloader.router.config.admission.reject_status,
+        detail="Service overloaded",
+        headers={"Retry-After": str(max(math.ceil(error.retry_after), 1))}
+    )
+
+def request_priority(http_request: Request, field: Optional[str]) -> Optional[str]:
+    """Приоритет запроса: заголовок priority.header, иначе поле priority тела"""
+    return http_request.headers.get(config_reloader.router.config.priority.header) or field
+
+async def generate_review_responses(http_request: Request) -> ReviewGenerationResponse:
+    """
+    Генерация ответов на пачку отзывов
 
-@app.post("/api/v1/llm/generate-responses", response_model=ReviewGenerationResponse)
-async def generate_review_responses(request: GenerateResponseRequest) -> ReviewGenerationResponse:
+    Тело проверяется одним вызовом валидации пачки (app.bulk) без модели Pydantic
+    на каждый отзыв; ошибки возвращаются в формате 422 FastAPI.
+    """
+    body = await http_request.body()
+    try:
+        request = validate_request(codec.loads(body))
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)],
+            body=body,
+        )
+    except ValueError as e:
+        raise RequestValidationError(
+            [{"type": "json_invalid", "loc": ("body",), "msg": "JSON decode error", "input": {}, "ctx": {"error": str(e)}}],
+            body=body,
+        )
+    observe_since_start("validate")
     if not request.reviews:
         raise HTTPException(
             status_code=400,
             detail="No reviews provided in the request"
         )
 
+    started_at = time.perf_counter()
     try:
         # Отправляем запрос напрямую, без конвертации
-        answer_outputs: List[AnswerOutput] = await service_router.route_request(
-            request,
-            AnswerOutput
+        request.priority = request_priority(http_request, request.priority)
+        response = await config_reloader.router.route_batch(request)
+
+    except AdmissionRejected as e:
+        raise overloaded(e)
+    except asyncio.TimeoutError:
+        logger.error("Превышен дедлайн обработки запроса")
+        update_total_errors()
+        update_pipeline_errors()
+        raise HTTPException(
+            status_code=504,
+            detail="Request deadline exceeded"
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при обработке запроса: {str(e)}", exc_info=True)
+        update_total_errors()
+        update_pipeline_errors()
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error"
         )
 
-        return ReviewGenerationResponse(generations=answer_outputs)
+    if response.errors:
+        update_total_errors()
+    update_received_messages(len(request.reviews), time.perf_counter() - started_at)
+    return response
+
+async def generate_review_responses_passthrough(request: Request) -> Response:
+    """Проксирование запроса в сервис без разбора отзывов в модели"""
+    body = await request.body()
+    router = config_reloader.router
+    try:
+        reviews, priority = router.parse_envelope(body)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    observe_since_start("validate")
 
+    started_at = time.perf_counter()
+    try:
+        service_name, upstream = await router.route_raw(body, reviews, request_priority(request, priority))
+    except AdmissionRejected as e:
+        raise overloaded(e)
+    except asyncio.TimeoutError:
+        logger.error("Превышен дедлайн обработки запроса")
+        update_total_errors()
+        update_pipeline_errors()
+        raise HTTPException(
+            status_code=504,
+            detail="Request deadline exceeded"
+        )
     except Exception as e:
         logger.error(f"Ошибка при обработке запроса: {str(e)}", exc_info=True)
+        update_total_errors()
+        update_pipeline_errors()
         raise HTTPException(
             status_code=500,
             detail="Internal server error"
         )
 
+    update_received_messages(len(reviews), time.perf_counter() - started_at)
+
+    headers = {"X-AB-Variant": service_name}
+    if "content-encoding" in upstream.headers:
+        headers["Content-Encoding"] = upstream.headers["content-encoding"]
+    return StreamingResponse(
+        upstream.aiter_raw(),
+        status_code=upstream.status_code,
+        media_type=upstream.headers.get("content-type", "application/json"),
+        headers=headers,
+        background=BackgroundTask(upstream.aclose),
+    )
+
+if settings.passthrough:
+    app.post("/api/v1/llm/generate-responses")(generate_review_responses_passthrough)
+else:
+    # Тело проверяется в обработчике; схема в OpenAPI та же, что у GenerateResponseRequest
+    app.post(
+        "/api/v1/llm/generate-responses",
+        response_model=ReviewGenerationResponse,
+        openapi_extra={"requestBody": {"required": True, "content": {"application/json": {
+            "schema": {"$ref": "#/components/schemas/GenerateResponseRequest"}
+        }}}},
+    )(generate_review_responses)
+
+@app.post("/api/v1/llm/generate-responses/stream")
+async def generate_review_responses_stream(
+    request: GenerateResponseRequest,
+    http_request: Request,
+    order: str = "completion",
+) -> StreamingResponse:
+    """
+    Генерации в формате NDJSON по мере готовности
+    
+    order=completion - в порядке готовности, order=request - в порядке отзывов.
+    Каждая строка содержит index отзыва и generation либо error.
+    """
+    observe_since_start("validate")
+    if not request.reviews:
+        raise HTTPException(
+            status_code=400,
+            detail="No reviews provided in the request"
+        )
+    if order not in STREAM_ORDERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Parameter 'order' must be one of: {', '.join(STREAM_ORDERS)}"
+        )
+
+    router = config_reloader.router
+
+    async def lines():
+        async for item in router.route_stream(request.reviews, order, request_priority(http_request, request.priority)):
+            yield codec.dumps(item) + b"\n"
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+@app.post("/api/v1/llm/feedback")
+async def submit_feedback(request: FeedbackRequest):
+    """Оценки качества генераций: сигнал награды вариантов в режиме bandit"""
+    router = config_reloader.router
+    if router.bandit is None:
+        raise HTTPException(status_code=404, detail="Bandit mode is disabled")
+    accepted = sum(router.bandit.record_quality(item.variant, item.score) for item in request.feedback)
+    # Оценки вариантов, которых уже нет в эксперименте, отбрасываются
+    return {"accepted": accepted, "ignored": len(request.feedback) - accepted}
+
 @app.get("/health")
 async def health_check():
     """Эндпоинт для проверки работоспособности сервиса"""
+    router = config_reloader.router
+    if router.health is not None and router.health.ejected:
+        return {"status": "degraded", "ejected": router.health.ejected}
     return {"status": "ok"}
 
 @app.get("/config")
 async def get_config():
     """Информация о текущей конфигурации"""
+    router = config_reloader.router
+    config = router.config
     return {
-        "mode": settings.mode,
+        "version": config_reloader.version,
+        "mode": config.mode,
         "services": {
-            name: {"url": service.url, "weight": service.weight} 
-            for name, service in settings.services.items()
+            name: {"url": service.url, "weight": service.weight, "current_weight": weight}
+            for (name, service), weight in zip(router.services.items(), router.current_weights())
+        },
+        "shadows": {
+            name: {"url": service.url, "mirror_rate": service.mirror_rate}
+            for name, service in router.shadows.items()
+        },
+        "shadow_queue": router.mirror.info() if router.mirror is not None else None,
+        "admission": {
+            name: limiter.info() for name, limiter in router.limiters.items()
+        } if router.limiters else None,
+        "timeout": config.timeout,
+        "fallback_enabled": config.fallback_enabled,
+        "fanout": config.fanout,
+        "passthrough": config.passthrough,
+        "hedging": {
+            "enabled": config.hedging.enabled,
+            "percentile": config.hedging.percentile,
+            "delays": router.hedge_delays(),
+        },
+        "deadline": config.deadline,
+        "circuit_breakers": {
+            name: breaker.info() for name, breaker in router.health.breakers.items()
+        } if router.health is not None else None,
+        "load": router.balancer.info() if config.mode == "balanced" else None,
+        "bandit": router.bandit.info() if router.bandit is not None else None,
+        "assignment": {
+            "strategy": config.assignment.strategy,
+            "key": config.assignment.key,
+            "salt": config.assignment.salt,
+            "buckets": config.assignment.buckets,
+            "shares": dict(zip(router.assigner.names, router.assigner.table.shares().tolist())),
         },
-        "timeout": settings.timeout,
-        "fallback_enabled": settings.fallback_enabled
     }
 
+@app.post("/config/reload")
+async def reload_config():
+    """Перечитать config.yaml и переключить трафик на новую конфигурацию"""
+    try:
+        return await config_reloader.reload()
+    except ValueError as e:
+        logger.error(f"Конфигурация не применена: {str(e)}")
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 10, interval: Optional[float] = None, limit: int = 30, format: str = "json"):
+    """
+    Профилирование цикла событий обработавшего запрос процесса в течение seconds секунд
+
+    format=json - самые частые стеки и функции, format=collapsed - стеки в формате flamegraph.pl.
+    """
+    config = config_reloader.router.config.profiling
+    if not config.endpoint:
+        raise HTTPException(status_code=404, detail="Profiling endpoint is disabled")
+    interval = interval or config.interval
+    if not 0 < seconds <= config.max_seconds or interval <= 0 or format not in ("json", "collapsed"):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Expected 0 < seconds <= {config.max_seconds}, interval > 0 and format json or collapsed"
+        )
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="Profiling is already running")
+
+    async with _profile_lock:
+        # Профилируется поток цикла событий; выборка стеков идет в отдельном потоке
+        profiler = SamplingProfiler(threading.get_ident(), interval)
+        logger.warning(f"Профилирование на {seconds} с с периодом {interval} с")
+        await asyncio.to_thread(profiler.run, seconds)
+    if format == "collapsed":
+        return PlainTextResponse(profiler.collapsed())
+    return profiler.report(limit)
+
 @app.get("/metrics")
 async def get_metrics():
     """Get service metrics"""
     logger.info("[SERVER] '/metrics'-endpoint is running...")
-    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    update_pool_metrics(config_reloader.router.clients.stats())
+    return Response(generate_metrics(), media_type=CONTENT_TYPE_LATEST)
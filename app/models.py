@@ -2,6 +2,17 @@ from pydantic import BaseModel, Field
 from typing import List, Optional, Union, Dict, Any
 from pydantic import validator
 
+def combine_review_text(text: Optional[str], pros: Optional[str], cons: Optional[str]) -> str:
+    """Review text in the legacy Review format: text, then pros and cons with labels"""
+    parts = []
+    if text:
+        parts.append(text)
+    if pros:
+        parts.append(f"Плюсы: {pros}")
+    if cons:
+        parts.append(f"Минусы: {cons}")
+    return ' '.join(parts).strip()
+
 class Review(BaseModel):
     id_review: str = Field(..., description="Unique review identifier")
     id_user: str = Field(..., description="User identifier")
@@ -27,17 +38,9 @@ class Review(BaseModel):
         return v
 
     @classmethod
-    def from_kafka_input(cls, kafka_input: 'KafkaReviewInput') -> Optional['Review']:
-        """Convert a KafkaReviewInput to a Review object"""
-        review_text = []
-        if kafka_input.text:
-            review_text.append(kafka_input.text)
-        if kafka_input.pros:
-            review_text.append(f"Плюсы: {kafka_input.pros}")
-        if kafka_input.cons:
-            review_text.append(f"Минусы: {kafka_input.cons}")
-                
-        combined_text = ' '.join(review_text).strip()
+    def from_kafka_input(cls, kafka_input: 'ReviewInput', recommendations: bool = False) -> Optional['Review']:
+        """Convert a Kafka-format ReviewInput to a Review object (None if the review has no text)"""
+        combined_text = combine_review_text(kafka_input.text, kafka_input.pros, kafka_input.cons)
         
         if not combined_text:
             return None
@@ -49,7 +52,7 @@ class Review(BaseModel):
             nm_id=int(kafka_input.nmId),
             review=combined_text,
             rating=kafka_input.ProductValuation or 4,
-            recommendations=kafka_input.recommendations
+            recommendations=recommendations
         )
 
 class WBUserDetails(BaseModel):
@@ -71,9 +74,16 @@ class GenerationResponse(BaseModel):
     response: str = Field(..., description="Generated response")
     metadata: ProcessedReview = Field(..., description="Review processing metadata")
     recommendations: Recommendations = Field(..., description="Related products recommendation")
+    variant: Optional[str] = Field(None, description="Service that generated the response")
+
+class GenerationError(BaseModel):
+    id: Union[int, str] = Field(..., description="Review ID")
+    service: str = Field(..., description="Service that failed to process the review")
+    error: str = Field(..., description="Error description")
 
 class ReviewGenerationResponse(BaseModel):
     generations: List[GenerationResponse] = Field(..., description="Generated responses for reviews")
+    errors: Optional[List[GenerationError]] = Field(None, description="Reviews that failed to process, if any")
 
 class SingleReviewInput(BaseModel):
     id: Union[int, str] = Field(..., description="Review ID")
@@ -114,6 +124,20 @@ class AnswerOutput(BaseModel):
 
 class GenerateResponseRequest(BaseModel):
     reviews: List[ReviewInput] = Field(..., description="List of reviews to process in Kafka message format")
+    # Не отправляется в сервисы: используется только для выбора полосы приоритета
+    priority: Optional[str] = Field(None, exclude=True, description="Request priority lane (overridden by the priority header)")
+
+class QualityFeedback(BaseModel):
+    variant: str = Field(..., description="Variant that generated the response (variant field or X-AB-Variant header)")
+    score: float = Field(..., ge=0, le=1, description="Response quality from 0 (bad) to 1 (good)")
+
+class FeedbackRequest(BaseModel):
+    feedback: List[QualityFeedback] = Field(..., description="Quality scores of generated responses")
+
+def generation_review_id(generation: Any) -> Optional[str]:
+    """Идентификатор отзыва, к которому относится генерация"""
+    review = getattr(getattr(generation, "metadata", None), "review", None)
+    return getattr(review, "id_review", None)
 
 class ReviewGenerationRequest(BaseModel):
     reviews: List[Review] = Field(..., description="List of reviews to process in Kafka message format")
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+Замеры этапов обработки запроса и выборочный профилировщик
+
+Этапы замеряются только у доли запросов profiling.sample_rate: решение принимается
+один раз в начале запроса и хранится в contextvar, поэтому задачи, запущенные
+запросом (подпачки, хеджирование), наследуют его. У запросов вне выборки span()
+возвращает общий пустой контекстный менеджер без замеров и выделения памяти.
+"""
+import random
+import sys
+import time
+from collections import Counter
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.prometheus_metrics import stage_observer
+
+# Этапы обработки: разбор и проверка тела запроса (вместе с чтением тела), подготовка
+# данных к отправке, сериализация, ожидание ответа сервиса, разбор JSON ответа,
+# построение моделей ответа
+STAGES = ("validate", "prepare", "encode", "upstream", "decode", "parse")
+
+_OBSERVERS = {stage: stage_observer(stage) for stage in STAGES}
+
+# Время начала запроса (perf_counter), если запрос попал в выборку
+_sampled_request: ContextVar[Optional[float]] = ContextVar("ab_util_sampled_request", default=None)
+
+
+def start_request(sample_rate: float, started_at: float) -> Token:
+    """
+    Решение о замере этапов запроса
+
+    Args:
+        sample_rate: Доля замеряемых запросов
+        started_at: Время начала запроса (perf_counter)
+
+    Returns:
+        Токен для finish_request
+    """
+    sampled = sample_rate > 0 and (sample_rate >= 1 or random.random() < sample_rate)
+    return _sampled_request.set(started_at if sampled else None)
+
+
+def finish_request(token: Token) -> None:
+    _sampled_request.reset(token)
+
+
+def observe_since_start(stage: str) -> None:
+    """Учет этапа, который длился с начала запроса до текущего момента"""
+    started_at = _sampled_request.get()
+    if started_at is not None:
+        _OBSERVERS[stage](time.perf_counter() - started_at)
+
+
+class _Span:
+    __slots__ = ("observe", "started_at")
+
+    def __init__(self, stage: str):
+        self.observe = _OBSERVERS[stage]
+
+    def __enter__(self) -> "_Span":
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.observe(time.perf_counter() - self.started_at)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(stage: str):
+    """Контекстный менеджер замера этапа (пустой, если запрос не в выборке)"""
+    if _sampled_request.get() is None:
+        return _NOOP_SPAN
+    return _Span(stage)
+
+
+class ProfilingMiddleware:
+    """ASGI-middleware: решение о замере этапов для каждого HTTP-запроса"""
+
+    def __init__(self, app: Any, sample_rate: Callable[[], float]):
+        """
+        Args:
+            app: ASGI-приложение
+            sample_rate: Функция, возвращающая текущую долю замеряемых запросов
+        """
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = start_request(self.sample_rate(), time.perf_counter())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finish_request(token)
+
+
+# Кадр стека: (модуль, функция, строка)
+Frame = Tuple[str, str, int]
+
+
+class SamplingProfiler:
+    """
+    Выборочный профилировщик потока цикла событий
+
+    Фоновый поток раз в interval секунд снимает стек профилируемого потока через
+    sys._current_frames() и считает одинаковые стеки. Профилируемый поток не
+    замедляется, кроме кратких захватов GIL при снятии стека.
+    """
+
+    def __init__(self, thread_id: int, interval: float, max_depth: int = 64):
+        """
+        Args:
+            thread_id: Идентификатор профилируемого потока
+            interval: Период выборки (секунды)
+            max_depth: Максимальная глубина сохраняемого стека
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.duration = 0.0
+        self._stacks: Counter = Counter()
+
+    def _sample(self) -> Optional[Tuple[Frame, ...]]:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return None
+        stack: List[Frame] = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append((frame.f_globals.get("__name__", "?"), code.co_name, frame.f_lineno))
+            frame = frame.f_back
+        # От внешнего кадра к внутреннему
+        return tuple(reversed(stack))
+
+    def run(self, seconds: float) -> None:
+        """Выборка стеков в течение seconds секунд (блокирует вызывающий поток)"""
+        started_at = time.perf_counter()
+        deadline = started_at + seconds
+        next_at = started_at
+        while True:
+            stack = self._sample()
+            if stack is not None:
+                self._stacks[stack] += 1
+                self.samples += 1
+            next_at += self.interval
+            now = time.perf_counter()
+            if next_at >= deadline:
+                break
+            if next_at > now:
+                time.sleep(next_at - now)
+        self.duration = time.perf_counter() - started_at
+
+    def report(self, limit: int = 30) -> Dict[str, Any]:
+        """
+        Самые частые стеки и функции
+
+        Для функций self - доля выборок, в которых функция была на вершине стека,
+        total - доля выборок, в которых она была в стеке.
+        """
+        total = max(self.samples, 1)
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in self._stacks.items():
+            self_counts[_function(stack[-1])] += count
+            for function in {_function(frame) for frame in stack}:
+                total_counts[function] += count
+        return {
+            "samples": self.samples,
+            "duration": round(self.duration, 3),
+            "interval": self.interval,
+            "stacks": [
+                {"count": count, "share": round(count / total, 4), "stack": [_format(frame) for frame in stack]}
+                for stack, count in self._stacks.most_common(limit)
+            ],
+            "functions": [
+                {"function": function, "self": round(count / total, 4),
+                 "total": round(total_counts[function] / total, 4)}
+                for function, count in self_counts.most_common(limit)
+            ],
+        }
+
+    def collapsed(self) -> str:
+        """Стеки функций в свернутом формате flamegraph.pl / speedscope: "a;b;c count" """
+        stacks: Counter = Counter()
+        for stack, count in self._stacks.items():
+            stacks[";".join(_function(frame) for frame in stack)] += count
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def _function(frame: Frame) -> str:
+    return f"{frame[0]}.{frame[1]}"
+
+
+def _format(frame: Frame) -> str:
+    return f"{frame[0]}.{frame[1]}:{frame[2]}"
+
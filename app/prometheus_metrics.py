@@ -1,14 +1,20 @@
-import time
-from typing import List
+import os
+from typing import Callable, Dict, List
 import asyncio
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST, Counter, Histogram, Gauge
+from prometheus_client import generate_latest, multiprocess, CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, Gauge
+
+# In multiprocess mode every metric writes to a file in PROMETHEUS_MULTIPROC_DIR, so the
+# directory must exist before the first metric is created (app.server also clears it)
+if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
 
 _ERRORS_COUNTER = Counter("ab_util_reviews_errors_total", 
                           "Общее количество ошибок")
 _FAILED_PIPELINES_COUNTER = Counter("ab_util_reviews_failed_pipelines", 
                                     "Общее количество неудачных пайплайнов")
 _ACTIVE_THREADS = Gauge("ab_util_reviews_active_threads", 
-                        "Количество активных потоков")
+                        "Количество активных потоков",
+                        multiprocess_mode="livesum")
 _MESSAGES_COUNTER = Counter("ab_util_reviews_received_messages_total", 
                             "Общее количество обработанных сообщений")
 _CLASSIFIED_MESSAGES_COUNTER = Counter("ab_util_reviews_classified_messages_total", 
@@ -17,34 +23,293 @@ _CLASSIFIED_MESSAGES_COUNTER = Counter("ab_util_reviews_classified_messages_tota
 _PIPELINE_LATENCY = Histogram("ab_util_reviews_pipeline_latency_seconds", 
                               "Время обработки одного сообщения", 
                               buckets=[1, 2.5, 5, 7.5, 10, 15, 20, 25, 30])
+_POOL_CONNECTIONS = Gauge("ab_util_pool_connections",
+                          "Количество соединений в пуле сервиса по состоянию",
+                          ["service", "state"],
+                          multiprocess_mode="livesum")
+_COALESCED_BATCH_SIZE = Histogram("ab_util_coalesced_batch_size",
+                                  "Размер объединенной пачки отзывов, отправленной в сервис",
+                                  ["service"],
+                                  buckets=[1, 2, 4, 8, 16, 32, 64, 128, 256, 512])
+_COALESCING_DELAY = Histogram("ab_util_coalescing_delay_seconds",
+                              "Время ожидания запроса в очереди объединения",
+                              ["service"],
+                              buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25])
+_CACHE_HITS = Counter("ab_util_cache_hits_total",
+                      "Количество отзывов, ответ на которые взят из кеша",
+                      ["service"])
+_CACHE_MISSES = Counter("ab_util_cache_misses_total",
+                        "Количество отзывов, не найденных в кеше",
+                        ["service"])
+_CACHE_EVICTIONS = Counter("ab_util_cache_evictions_total",
+                           "Количество вытесненных из кеша записей по причине",
+                           ["reason"])
+_CACHE_BYTES = Gauge("ab_util_cache_bytes",
+                     "Объем ответов в кеше",
+                     multiprocess_mode="livesum")
+_CACHE_ENTRIES = Gauge("ab_util_cache_entries",
+                       "Количество записей в кеше",
+                       multiprocess_mode="livesum")
+_BREAKER_STATE = Gauge("ab_util_breaker_state",
+                       "Состояние автомата отключения сервиса: 0 - closed, 1 - half_open, 2 - open",
+                       ["service"],
+                       multiprocess_mode="livemax")
+_BREAKER_TRIPS = Counter("ab_util_breaker_trips_total",
+                         "Количество срабатываний автомата отключения по причине",
+                         ["service", "reason"])
+
+_UPSTREAM_LATENCY = Histogram("ab_util_upstream_latency_seconds",
+                              "Время ответа сервиса по исходу вызова",
+                              ["service", "outcome"],
+                              buckets=[0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 45, 60])
+_UPSTREAM_REQUEST_BYTES = Histogram("ab_util_upstream_request_bytes",
+                                    "Размер тела запроса к сервису",
+                                    ["service"],
+                                    buckets=[1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216])
+_UPSTREAM_RESPONSE_BYTES = Histogram("ab_util_upstream_response_bytes",
+                                     "Размер тела ответа сервиса",
+                                     ["service"],
+                                     buckets=[1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216])
+_UPSTREAM_BATCH_REVIEWS = Histogram("ab_util_upstream_batch_reviews",
+                                    "Количество отзывов в пачке, отправленной в сервис",
+                                    ["service"],
+                                    buckets=[1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000])
+_UPSTREAM_INFLIGHT = Gauge("ab_util_upstream_inflight",
+                           "Количество незавершенных вызовов сервиса",
+                           ["service"],
+                           multiprocess_mode="livesum")
+_UPSTREAM_ERRORS = Counter("ab_util_upstream_errors_total",
+                           "Количество ошибок вызова сервиса по причине",
+                           ["service", "cause"])
+_EXPOSURE_RECORDS = Counter("ab_util_exposure_records_total",
+                            "Количество записей, сохраненных в журнал показов")
+_EXPOSURE_DROPPED = Counter("ab_util_exposure_dropped_total",
+                            "Количество записей журнала показов, потерянных по причине",
+                            ["reason"])
+_EXPOSURE_FLUSH_LATENCY = Histogram("ab_util_exposure_flush_seconds",
+                                    "Время записи пачки журнала показов в файл",
+                                    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1])
+_ADMISSION_QUEUED = Gauge("ab_util_admission_queued",
+                          "Количество вызовов сервиса, ожидающих слота, по полосам приоритета",
+                          ["service", "lane"],
+                          multiprocess_mode="livesum")
+_ADMISSION_WAIT = Histogram("ab_util_admission_wait_seconds",
+                            "Время ожидания слота для вызова сервиса по полосам приоритета",
+                            ["service", "lane"],
+                            buckets=[0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30])
+_ADMISSION_REJECTED = Counter("ab_util_admission_rejected_total",
+                              "Количество вызовов сервиса, отклоненных при перегрузке, по полосе и причине",
+                              ["service", "lane", "reason"])
+_SHADOW_MIRRORED = Counter("ab_util_shadow_mirrored_total",
+                           "Количество копий запросов, поставленных в очередь теневого сервиса",
+                           ["service"])
+_SHADOW_DROPPED = Counter("ab_util_shadow_dropped_total",
+                          "Количество копий запросов в теневой сервис, отброшенных по причине",
+                          ["service", "reason"])
+_SHADOW_QUEUE_DELAY = Histogram("ab_util_shadow_queue_delay_seconds",
+                                "Время ожидания копии запроса в очереди теневых сервисов",
+                                ["service"],
+                                buckets=[0.001, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60])
+_STAGE_LATENCY = Histogram("ab_util_stage_seconds",
+                           "Время этапа обработки запроса (для доли запросов profiling.sample_rate)",
+                           ["stage"],
+                           buckets=[0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                                    0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30])
+_BANDIT_SHARE = Gauge("ab_util_bandit_share",
+                      "Доля трафика варианта в режиме bandit",
+                      ["service"],
+                      multiprocess_mode="livemostrecent")
+_BANDIT_REWARD = Gauge("ab_util_bandit_reward",
+                       "Средняя награда варианта в режиме bandit (от 0 до 1)",
+                       ["service"],
+                       multiprocess_mode="livemostrecent")
+_BANDIT_FEEDBACK = Counter("ab_util_bandit_feedback_total",
+                           "Количество принятых оценок качества генераций",
+                           ["service"])
+
+
+def multiprocess_enabled() -> bool:
+    """Whether metrics are shared between worker processes"""
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+def generate_metrics() -> bytes:
+    """Render metrics; in multiprocess mode values of all workers are aggregated"""
+    if not multiprocess_enabled():
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
 
-stuff_lock = asyncio.Lock()
+def mark_worker_stopped() -> None:
+    """Drop live gauges of the current worker process on shutdown"""
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(os.getpid())
 
-async def update_total_errors() -> None:
+def update_total_errors() -> None:
     """Update the error counter"""
-    async with stuff_lock:
-        _ERRORS_COUNTER.inc()
+    _ERRORS_COUNTER.inc()
 
-async def update_pipeline_errors() -> None:
+def update_pipeline_errors() -> None:
     """Update the pipeline error counter"""
-    async with stuff_lock:
-        _FAILED_PIPELINES_COUNTER.inc()
+    _FAILED_PIPELINES_COUNTER.inc()
 
-async def update_resource_metrics(semaphore: asyncio.Semaphore,
-                                  total_threads: int) -> None:
+def update_resource_metrics(semaphore: asyncio.Semaphore,
+                            total_threads: int) -> None:
     """Update resource utilization metrics"""
-    async with stuff_lock:
-        active_threads = total_threads - semaphore._value
-        _ACTIVE_THREADS.set(active_threads)
+    active_threads = total_threads - semaphore._value
+    _ACTIVE_THREADS.set(active_threads)
+
+def update_active_calls(delta: int) -> None:
+    """Update the number of admitted in-flight service calls"""
+    _ACTIVE_THREADS.inc(delta)
+
+def update_admission_queued(service_name: str, lane: str, queued: int) -> None:
+    """Update the admission wait queue length of a priority lane"""
+    _ADMISSION_QUEUED.labels(service_name, lane).set(queued)
+
+def observe_admission_wait(service_name: str, lane: str, wait: float) -> None:
+    """Update admission wait time histogram of a priority lane"""
+    _ADMISSION_WAIT.labels(service_name, lane).observe(wait)
+
+def update_admission_rejected(service_name: str, lane: str, reason: str) -> None:
+    """Update admission rejection counter"""
+    _ADMISSION_REJECTED.labels(service_name, lane, reason).inc()
 
-async def update_service_metrics(messages: List[dict] | None,
-                                 latency: float | None) -> None:
+def update_service_metrics(messages: List[dict] | None,
+                           latency: float | None) -> None:
     """Update message processing metrics"""
-    async with stuff_lock:
-        if messages:
-            _MESSAGES_COUNTER.inc(len(messages))
-            for message in messages:
-                class_name = message.get("label") or message.get("pred_label") or "unknown"
-                _CLASSIFIED_MESSAGES_COUNTER.labels(class_name).inc()
-        if latency is not None:
-            _PIPELINE_LATENCY.observe(latency)
\ No newline at end of file
+    if messages:
+        _MESSAGES_COUNTER.inc(len(messages))
+        for message in messages:
+            class_name = message.get("label") or message.get("pred_label") or "unknown"
+            _CLASSIFIED_MESSAGES_COUNTER.labels(class_name).inc()
+    if latency is not None:
+        _PIPELINE_LATENCY.observe(latency)
+
+def update_received_messages(count: int, latency: float) -> None:
+    """Update received messages and pipeline latency for one request"""
+    _MESSAGES_COUNTER.inc(count)
+    _PIPELINE_LATENCY.observe(latency)
+
+class ServiceMetrics:
+    """
+    Метрики вызовов одного сервиса с заранее привязанными метками
+
+    Дочерние метрики создаются один раз, поэтому на горячем пути нет поиска
+    по меткам и общей блокировки — только атомарные операции prometheus_client.
+    """
+
+    __slots__ = ("service_name", "_latency", "_request_bytes", "_response_bytes",
+                 "_batch_reviews", "_inflight", "_errors")
+
+    def __init__(self, service_name: str):
+        self.service_name = service_name
+        self._latency = {outcome: _UPSTREAM_LATENCY.labels(service_name, outcome)
+                         for outcome in ("success", "error", "cancelled")}
+        self._request_bytes = _UPSTREAM_REQUEST_BYTES.labels(service_name)
+        self._response_bytes = _UPSTREAM_RESPONSE_BYTES.labels(service_name)
+        self._batch_reviews = _UPSTREAM_BATCH_REVIEWS.labels(service_name)
+        self._inflight = _UPSTREAM_INFLIGHT.labels(service_name)
+        self._errors: Dict[str, Counter] = {}
+
+    def call_started(self) -> None:
+        self._inflight.inc()
+
+    def call_finished(self, latency: float, outcome: str, cause: str | None = None) -> None:
+        """
+        Учет завершения вызова
+
+        Args:
+            latency: Задержка вызова
+            outcome: success, error или cancelled
+            cause: Причина ошибки (timeout, connect, http_5xx, ...)
+        """
+        self._inflight.dec()
+        self._latency[outcome].observe(latency)
+        if cause is not None:
+            errors = self._errors.get(cause)
+            if errors is None:
+                errors = self._errors[cause] = _UPSTREAM_ERRORS.labels(self.service_name, cause)
+            errors.inc()
+
+    def observe_payload(self, reviews: int, request_bytes: int, response_bytes: int | None) -> None:
+        """Учет размера пачки и тел запроса и ответа (если размер ответа известен)"""
+        self._batch_reviews.observe(reviews)
+        self._request_bytes.observe(request_bytes)
+        if response_bytes is not None:
+            self._response_bytes.observe(response_bytes)
+
+def update_pool_metrics(stats: Dict[str, Dict[str, int]]) -> None:
+    """Update connection pool metrics"""
+    for service_name, service_stats in stats.items():
+        _POOL_CONNECTIONS.labels(service_name, "total").set(service_stats["connections"])
+        _POOL_CONNECTIONS.labels(service_name, "idle").set(service_stats["idle"])
+        _POOL_CONNECTIONS.labels(service_name, "active").set(service_stats["connections"] - service_stats["idle"])
+        _POOL_CONNECTIONS.labels(service_name, "pending").set(service_stats["pending"])
+
+def observe_coalesced_batch(service_name: str, batch_size: int, delays: List[float]) -> None:
+    """Update request coalescing metrics"""
+    _COALESCED_BATCH_SIZE.labels(service_name).observe(batch_size)
+    delay_histogram = _COALESCING_DELAY.labels(service_name)
+    for delay in delays:
+        delay_histogram.observe(delay)
+
+def update_cache_lookup(service_name: str, hit: bool) -> None:
+    """Update response cache hit/miss counters"""
+    if hit:
+        _CACHE_HITS.labels(service_name).inc()
+    else:
+        _CACHE_MISSES.labels(service_name).inc()
+
+def update_cache_eviction(reason: str) -> None:
+    """Update response cache eviction counter"""
+    _CACHE_EVICTIONS.labels(reason).inc()
+
+def update_cache_size(size_bytes: int, entries: int) -> None:
+    """Update response cache size metrics"""
+    _CACHE_BYTES.set(size_bytes)
+    _CACHE_ENTRIES.set(entries)
+
+_BREAKER_STATE_CODES = {"closed": 0, "half_open": 1, "open": 2}
+
+def update_breaker_state(service_name: str, state: str) -> None:
+    """Update circuit breaker state gauge"""
+    _BREAKER_STATE.labels(service_name).set(_BREAKER_STATE_CODES[state])
+
+def update_breaker_trips(service_name: str, reason: str) -> None:
+    """Update circuit breaker trip counter"""
+    _BREAKER_TRIPS.labels(service_name, reason).inc()
+
+def update_exposure_written(count: int, latency: float) -> None:
+    """Update exposure log flush metrics"""
+    _EXPOSURE_RECORDS.inc(count)
+    _EXPOSURE_FLUSH_LATENCY.observe(latency)
+
+def update_exposure_dropped(reason: str, count: int = 1) -> None:
+    """Update exposure log drop counter"""
+    _EXPOSURE_DROPPED.labels(reason).inc(count)
+
+def update_shadow_mirrored(service_name: str) -> None:
+    """Update shadow mirror enqueue counter"""
+    _SHADOW_MIRRORED.labels(service_name).inc()
+
+def update_shadow_dropped(service_name: str, reason: str, count: int = 1) -> None:
+    """Update shadow mirror drop counter"""
+    _SHADOW_DROPPED.labels(service_name, reason).inc(count)
+
+def observe_shadow_queue_delay(service_name: str, delay: float) -> None:
+    """Update shadow mirror queue delay histogram"""
+    _SHADOW_QUEUE_DELAY.labels(service_name).observe(delay)
+
+def stage_observer(stage: str) -> Callable[[float], None]:
+    """Pre-bound observe() of the stage latency histogram"""
+    return _STAGE_LATENCY.labels(stage).observe
+
+def update_bandit_state(service_name: str, share: float, reward: float) -> None:
+    """Update bandit allocation share and mean reward gauges"""
+    _BANDIT_SHARE.labels(service_name).set(share)
+    _BANDIT_REWARD.labels(service_name).set(reward)
+
+def update_bandit_feedback(service_name: str) -> None:
+    """Update accepted quality feedback counter"""
+    _BANDIT_FEEDBACK.labels(service_name).inc()
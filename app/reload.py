@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+from omegaconf.errors import OmegaConfBaseException
+
+from app.constants import CONFIG_PATH
+from app.services import ServiceRouter, service_router
+from app.settings import read_config
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigReloader:
+    """
+    Перезагрузка конфигурации с атомарной подменой роутера
+
+    Новый роутер (таблицы бакетов, пулы соединений, автоматы) полностью строится
+    и запускается рядом с текущим, после чего подменяется одним присваиванием.
+    Обработчики берут роутер один раз в начале запроса, поэтому запрос целиком
+    обрабатывается одной конфигурацией, а трафик не приостанавливается.
+    """
+
+    def __init__(self, router: ServiceRouter, path: Path = CONFIG_PATH):
+        self.router = router
+        self.path = path
+        self.version = 1
+        self._mtime = self._read_mtime()
+        self._lock = asyncio.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+        self._retiring: Set[asyncio.Task] = set()
+
+    def _read_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    async def start(self) -> None:
+        """Запуск текущего роутера и наблюдения за файлом конфигурации"""
+        await self.router.startup()
+        self._ensure_watch()
+
+    async def stop(self) -> None:
+        """Остановка наблюдения и всех роутеров, включая выводимые из работы"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+        retiring = list(self._retiring)
+        for task in retiring:
+            task.cancel()
+        await asyncio.gather(*retiring, return_exceptions=True)
+        await self.router.shutdown()
+
+    async def reload(self) -> Dict[str, Any]:
+        """
+        Перечитывает файл конфигурации и переключает трафик на новую конфигурацию
+
+        Некорректная конфигурация не применяется: текущий роутер продолжает работу.
+
+        Returns:
+            Номер версии и список сервисов новой конфигурации
+
+        Raises:
+            ValueError: Конфигурация некорректна или требует перезапуска
+        """
+        async with self._lock:
+            self._mtime = self._read_mtime()
+            try:
+                config = await asyncio.to_thread(read_config, self.path)
+            except Exception as e:
+                raise ValueError(f"Не удалось прочитать конфигурацию: {str(e)}") from e
+            if config.passthrough != self.router.config.passthrough:
+                raise ValueError("Изменение passthrough требует перезапуска")
+
+            try:
+                router = ServiceRouter(config, previous=self.router)
+            except (TypeError, KeyError, AttributeError, OmegaConfBaseException) as e:
+                # Значения неверного типа (например, weight: "abc") всплывают при построении роутера
+                raise ValueError(f"Некорректная конфигурация: {str(e)}") from e
+            await router.startup()
+            previous, self.router = self.router, router
+            self.version += 1
+
+            task = asyncio.ensure_future(previous.retire(router))
+            self._retiring.add(task)
+            task.add_done_callback(self._retiring.discard)
+            self._ensure_watch()
+            logger.info(f"Применена конфигурация версии {self.version}: сервисы {list(router.services)}, "
+                        f"доли {dict(zip(router.assigner.names, router.assigner.table.shares().tolist()))}")
+            return {"version": self.version, "services": list(router.services)}
+
+    def _ensure_watch(self) -> None:
+        if self.router.config.reload.watch and (self._watch_task is None or self._watch_task.done()):
+            self._watch_task = asyncio.ensure_future(self._watch())
+
+    async def _watch(self) -> None:
+        """Перезагрузка при изменении файла (проверяется время изменения)"""
+        while self.router.config.reload.watch:
+            await asyncio.sleep(self.router.config.reload.interval)
+            mtime = self._read_mtime()
+            if mtime is None or mtime == self._mtime:
+                continue
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error(f"Конфигурация из {self.path} не применена: {str(e)}")
+
+
+config_reloader = ConfigReloader(service_router)
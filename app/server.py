@@ -0,0 +1,62 @@
+"""
+Запуск балансировщика в нескольких процессах
+
+Каждый процесс поднимает собственный экземпляр приложения со своим роутером,
+а метрики prometheus_client пишутся в общий каталог PROMETHEUS_MULTIPROC_DIR
+и агрегируются эндпоинтом /metrics любого процесса.
+
+    python -m app.server --workers 4
+"""
+import argparse
+import logging
+import os
+
+from app.constants import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_PROMETHEUS_MULTIPROC_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def prepare_multiprocess_dir(path: str) -> None:
+    """
+    Очистка каталога метрик от файлов предыдущего запуска
+
+    Должна выполняться до импорта prometheus_client в процессах-воркерах:
+    режим хранения значений выбирается при создании первой метрики.
+
+    Args:
+        path: Каталог для файлов метрик
+    """
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            if name.endswith(".db"):
+                os.remove(os.path.join(path, name))
+    else:
+        os.makedirs(path, exist_ok=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Запуск балансировщика в нескольких процессах")
+    parser.add_argument("--host", default=os.environ.get("HOST", DEFAULT_HOST))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", DEFAULT_PORT)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 1)),
+                        help="Количество процессов (по умолчанию WEB_CONCURRENCY или 1)")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    if args.workers > 1 or "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Переменная наследуется воркерами и включает в них multiprocess-режим prometheus_client
+        path = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", DEFAULT_PROMETHEUS_MULTIPROC_DIR)
+        prepare_multiprocess_dir(path)
+        logger.info(f"Метрики процессов собираются в {path}")
+
+    import uvicorn
+
+    logger.info(f"Запуск {args.workers} процессов на {args.host}:{args.port}")
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
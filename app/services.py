@@ -1,51 +1,432 @@
+import asyncio
 import logging
-import random
+import time
 import httpx
+import numpy as np
 
-from typing import Tuple, TypeVar, Generic, Type, List, Dict, Any, Union, cast
-from typing_extensions import get_type_hints
-from app.models import GenerationResponse
-from app.settings import settings
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Tuple, TypeVar, Generic, Type, List, Dict, Any, AsyncIterator, Deque, Optional, Sequence, Union
+from app import codec
+from app.admission import ConcurrencyLimiter
+from app.assignment import Assigner
+from app.balancer import LoadBalancer
+from app.bandit import BanditAllocator
+from app.clients import ClientPool
+from app.exposure import ExposureLog
+from app.health import HealthMonitor
+from app.latency import LatencyWindow
+from app.profiling import span
+from app.prometheus_metrics import ServiceMetrics, multiprocess_enabled, update_pool_metrics
+from app.models import GenerateResponseRequest, GenerationError, GenerationResponse, ReviewGenerationResponse, ReviewInput, generation_review_id
+from app.batching import MicroBatcher
+from app.bulk import BulkReview, ReviewBatch
+from app.cache import ResponseCache, rebind_generation
+from app.shadow import ShadowMirror
+from app.constants import DEFAULT_POOL_METRICS_INTERVAL, DEFAULT_RAMP_INTERVAL, DEFAULT_RELOAD_DRAIN_GRACE
+from app.settings import SERVICE_ROLES, ABTestingConfig, settings
 
 logger = logging.getLogger(__name__)
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_ORDERS = ("completion", "request")
+# Допуск (секунды) при сравнении момента отмены вызова с дедлайном запроса
+_DEADLINE_TOLERANCE = 0.001
+
 InputT = TypeVar('InputT')
 OutputT = TypeVar('OutputT')
 
+def _error_cause(error: BaseException) -> str:
+    """Причина ошибки вызова сервиса для метрик"""
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.ConnectError):
+        return "connect"
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code // 100}xx"
+    if isinstance(error, httpx.TransportError):
+        return "transport"
+    if isinstance(error, ValueError):
+        # Сюда же попадают ошибки разбора JSON и валидации pydantic
+        return "invalid_response"
+    return "other"
+
 class ServiceRouter(Generic[InputT, OutputT]):
-    def __init__(self):
-        self.services = settings.services
-        self.mode = settings.mode
-        self.timeout = settings.timeout
-        self.fallback_enabled = settings.fallback_enabled
+    def __init__(self, config: Optional[ABTestingConfig] = None, previous: Optional["ServiceRouter"] = None):
+        """
+        Args:
+            config: Конфигурация (по умолчанию загруженная при импорте)
+            previous: Роутер прежней конфигурации. От него переходят задержки, нагрузка
+                и автоматы сохранившихся сервисов, кеш и таблица бакетов (с минимальным
+                переносом бакетов между вариантами)
+        """
+        self.config = config if config is not None else settings
+        # Теневые сервисы не участвуют в распределении, балансировке и резервировании
+        self.services = {name: service for name, service in self.config.services.items() if service.role != "shadow"}
+        self.shadows = {name: service for name, service in self.config.services.items() if service.role == "shadow"}
+        self.mode = self.config.mode
+        self.timeout = self.config.timeout
+        self.fallback_enabled = self.config.fallback_enabled
+        self.fanout = self.config.fanout
+        self.hedging = self.config.hedging
+        self.deadline = self.config.deadline
         self._check_config()
+        self.ramp_starts = self._ramp_starts(previous)
+        self.bandit: Optional[BanditAllocator] = None
+        if self.mode == "bandit":
+            self.bandit = BanditAllocator(
+                self.services,
+                self.config.bandit,
+                apply=self._apply_bandit_shares,
+                previous=previous.bandit if previous is not None else None,
+            )
+        # Таблица бакетов строится один раз по весам сервисов и меняется только при разгоне
+        # и пересчете долей в режиме bandit
+        self.assigner = Assigner(
+            self.services,
+            self.config.assignment,
+            weights=self.current_weights(),
+            previous=previous.assigner if previous is not None else None,
+        )
+        self.balancer = LoadBalancer(self.assigner, self.config.ewma_alpha)
+        self.clients = ClientPool(self.config.services, self.timeout)
+        self.latencies: Dict[str, LatencyWindow] = {name: LatencyWindow() for name in self.services}
+        self.metrics: Dict[str, ServiceMetrics] = {name: ServiceMetrics(name) for name in self.config.services}
+        if previous is not None:
+            for name in self.services:
+                if name in previous.services:
+                    self.latencies[name] = previous.latencies[name]
+                    self.balancer.loads[name] = previous.balancer.loads[name]
+        self.limiters: Dict[str, ConcurrencyLimiter] = {}
+        if self.config.admission.enabled:
+            for name in self.services:
+                self.limiters[name] = self._make_limiter(name, previous)
+        self.health: Optional[HealthMonitor] = None
+        if self.config.circuit_breaker.enabled:
+            inherited = None
+            if previous is not None and previous.health is not None and previous.config.circuit_breaker == self.config.circuit_breaker:
+                inherited = previous.health.breakers
+            self.health = HealthMonitor(
+                list(self.services),
+                self.config.circuit_breaker,
+                probe=self._probe,
+                on_change=self.assigner.exclude,
+                breakers=inherited,
+            )
+            if self.health.ejected:
+                self.assigner.exclude(self.health.ejected)
+        self.cache: Optional[ResponseCache] = None
+        if self.config.cache.enabled:
+            if previous is not None and previous.cache is not None and previous.config.cache == self.config.cache:
+                self.cache = previous.cache
+            else:
+                self.cache = ResponseCache(self.config.cache.max_bytes, self.config.cache.ttl)
+        self.exposure: Optional[ExposureLog] = None
+        if self.config.exposure.enabled:
+            if previous is not None and previous.exposure is not None and previous.config.exposure == self.config.exposure:
+                self.exposure = previous.exposure
+            else:
+                self.exposure = ExposureLog(self.config.exposure)
+        self.batchers: Dict[str, MicroBatcher] = {}
+        if self.config.coalescing.enabled:
+            self.batchers = {
+                name: MicroBatcher(
+                    name,
+                    self._make_batch_sender(name),
+                    window=self.config.coalescing.window_ms / 1000,
+                    max_batch_size=self.config.coalescing.max_batch_size,
+                )
+                for name in self.services
+            }
+        self.mirror: Optional[ShadowMirror] = None
+        if self.shadows:
+            self.mirror = ShadowMirror(
+                {name: service.mirror_rate for name, service in self.shadows.items()},
+                self._send_shadow,
+                queue_size=self.config.shadow.queue_size,
+                concurrency=self.config.shadow.concurrency,
+            )
+        self._pool_metrics_task: Optional[asyncio.Task] = None
+        self._ramp_task: Optional[asyncio.Task] = None
+
+    async def startup(self) -> None:
+        """Создание пулов соединений к сервисам и запуск фоновых задач"""
+        await self.clients.start()
+        if self.health is not None:
+            self.health.start()
+        if self.exposure is not None:
+            self.exposure.start()
+        if self.mirror is not None:
+            self.mirror.start()
+        if multiprocess_enabled() and self._pool_metrics_task is None:
+            # /metrics обслуживает один из процессов, поэтому пулы остальных обновляются сами
+            self._pool_metrics_task = asyncio.ensure_future(self._refresh_pool_metrics())
+        if self.ramp_starts and self._ramp_task is None:
+            self._ramp_task = asyncio.ensure_future(self._run_ramps())
+        if self.bandit is not None:
+            self.bandit.start()
+
+    async def shutdown(self) -> None:
+        """Остановка фоновых задач, отправка накопленных пачек и закрытие пулов соединений"""
+        if self.health is not None:
+            await self.health.stop()
+        await self._close()
+
+    async def retire(self, successor: "ServiceRouter") -> None:
+        """
+        Вывод роутера из работы после переключения на новую конфигурацию
+
+        Запросы, начатые до переключения, дорабатывают на старых пулах соединений,
+        а их исходы учитываются автоматами нового роутера. Пулы закрываются, когда
+        истекает максимальная длительность запроса.
+
+        Args:
+            successor: Роутер новой конфигурации
+        """
+        if self.health is not None:
+            await self.health.stop()
+        self.health = successor.health
+        if self.bandit is not None:
+            # Статистика вариантов общая с новым роутером, пересчитывает ее только он
+            await self.bandit.stop()
+        try:
+            await asyncio.sleep(self.drain_timeout)
+        finally:
+            if self.exposure is successor.exposure:
+                # Журнал перешел в новую конфигурацию и закрывается вместе с ней
+                self.exposure = None
+            await self._close()
+
+    @property
+    def drain_timeout(self) -> float:
+        """Максимальная длительность запроса, включая резервный вызов"""
+        return (self.deadline or self.timeout * 2) + DEFAULT_RELOAD_DRAIN_GRACE
+
+    async def _close(self) -> None:
+        for task in (self._pool_metrics_task, self._ramp_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._pool_metrics_task = self._ramp_task = None
+        if self.bandit is not None:
+            await self.bandit.stop()
+        for batcher in self.batchers.values():
+            await batcher.close()
+        if self.mirror is not None:
+            await self.mirror.stop()
+        await self.clients.close()
+        if self.exposure is not None:
+            await self.exposure.stop()
+
+    async def _refresh_pool_metrics(self) -> None:
+        """Периодическое обновление метрик пулов соединений процесса"""
+        while True:
+            try:
+                update_pool_metrics(self.clients.stats())
+            except Exception as e:
+                logger.error(f"Ошибка обновления метрик пулов соединений: {str(e)}")
+            await asyncio.sleep(DEFAULT_POOL_METRICS_INTERVAL)
+
+    def _ramp_starts(self, previous: Optional["ServiceRouter"]) -> Dict[str, float]:
+        """
+        Моменты начала разгона сервисов (unix time)
+
+        Если разгон сервиса не изменился при перезагрузке, он продолжается, а не начинается заново.
+        """
+        starts = {}
+        for name, service in self.services.items():
+            ramp = service.ramp
+            if ramp is None:
+                continue
+            if ramp.start is not None:
+                starts[name] = datetime.fromisoformat(ramp.start).timestamp()
+            elif previous is not None and name in previous.ramp_starts and previous.services[name].ramp == ramp:
+                starts[name] = previous.ramp_starts[name]
+            else:
+                starts[name] = time.time()
+        return starts
+
+    def current_weights(self, now: Optional[float] = None) -> List[float]:
+        """
+        Текущие веса сервисов с учетом разгона
+
+        Вес разгоняемого сервиса линейно меняется от from_weight до weight за duration секунд.
+        В режиме bandit после первого пересчета весами служат доли вариантов.
+
+        Args:
+            now: Момент времени (unix time), по умолчанию текущий
+
+        Returns:
+            Веса в порядке self.services
+        """
+        if self.bandit is not None and self.bandit.shares is not None:
+            return self.bandit.shares.tolist()
+        now = time.time() if now is None else now
+        weights = []
+        for name, service in self.services.items():
+            ramp = service.ramp
+            if ramp is None:
+                weights.append(service.weight)
+                continue
+            progress = (now - self.ramp_starts[name]) / ramp.duration if ramp.duration > 0 else 1.0
+            progress = min(max(progress, 0.0), 1.0)
+            weights.append(ramp.from_weight + (service.weight - ramp.from_weight) * progress)
+        return weights
+
+    async def _run_ramps(self) -> None:
+        """Периодический пересчет таблицы бакетов по текущим весам до окончания разгона"""
+        finish = max(
+            self.ramp_starts[name] + self.services[name].ramp.duration for name in self.ramp_starts
+        )
+        while True:
+            await asyncio.sleep(DEFAULT_RAMP_INTERVAL)
+            now = time.time()
+            try:
+                weights = self.current_weights(now)
+                if sum(weights) > 0:
+                    self.assigner.set_weights(weights)
+            except Exception as e:
+                logger.error(f"Ошибка пересчета весов при разгоне: {str(e)}", exc_info=True)
+            if now >= finish:
+                logger.info(f"Разгон весов завершен: {dict(zip(self.assigner.names, self.current_weights(now)))}")
+                return
+
+    def _apply_bandit_shares(self, shares: List[float]) -> None:
+        """Перестроение таблицы бакетов по новым долям вариантов режима bandit"""
+        self.assigner.set_weights(shares)
+        logger.info(f"Доли вариантов bandit: {dict(zip(self.assigner.names, (round(share, 4) for share in shares)))}")
+
+    async def _probe(self, service_name: str) -> bool:
+        """
+        Активная проверка исключенного сервиса
+        
+        Args:
+            service_name: Имя сервиса
+            
+        Returns:
+            True, если сервис отвечает без серверной ошибки
+        """
+        service = self.services[service_name]
+        client = self.clients.get(service_name)
+        timeout = self.config.circuit_breaker.probe_timeout
+        if service.probe_url:
+            response = await client.get(service.probe_url, timeout=timeout)
+        else:
+            response = await client.post(service.url, json={"reviews": []}, timeout=timeout)
+        return response.status_code < 500
+
+    def _make_limiter(self, service_name: str, previous: Optional["ServiceRouter"]) -> ConcurrencyLimiter:
+        """
+        Ограничитель параллельности вызовов сервиса
+
+        При перезагрузке с теми же ограничениями ограничитель переходит от прежнего роутера:
+        вызовы, начатые до переключения, продолжают занимать слоты сервиса.
+        """
+        service = self.services[service_name]
+        admission = self.config.admission
+        max_concurrency = service.max_concurrency if service.max_concurrency is not None else admission.max_concurrency
+        max_queue = service.max_queue if service.max_queue is not None else admission.max_queue
+        lanes = self.config.priority.lanes
+        inherited = previous.limiters.get(service_name) if previous is not None else None
+        if inherited is not None and (inherited.max_concurrency, inherited.max_queue, inherited.lanes) == (max_concurrency, max_queue, lanes):
+            inherited.service_time = lambda: self.latencies[service_name].percentile(50)
+            return inherited
+        return ConcurrencyLimiter(
+            service_name,
+            max_concurrency,
+            max_queue,
+            service_time=lambda: self.latencies[service_name].percentile(50),
+            lanes=lanes,
+        )
+
+    def lane_for(self, priority: Optional[str]) -> str:
+        """
+        Полоса приоритета запроса
+
+        Args:
+            priority: Приоритет из заголовка или поля запроса
+
+        Returns:
+            Имя полосы; для пустого или неизвестного приоритета - полоса по умолчанию
+        """
+        if priority is not None and priority in self.config.priority.lanes:
+            return priority
+        return self.config.priority.default
+
+    def _admission_budget(self, deadline_at: Optional[float]) -> float:
+        """Сколько секунд вызов может ждать слота: до дедлайна запроса или admission.max_wait"""
+        if deadline_at is None:
+            return self.config.admission.max_wait
+        return deadline_at - asyncio.get_running_loop().time()
+
+    def _make_batch_sender(self, service_name: str):
+        """Функция отправки объединенной пачки отзывов в сервис"""
+        async def send(reviews: List[ReviewInput]) -> List[GenerationResponse]:
+            prepared_data = {"reviews": self._prepare_request_data(reviews)}
+            return await self._post(service_name, prepared_data, GenerationResponse)
+        return send
         
     def _check_config(self):
         """Проверка корректности конфигурации"""
+        for name, service in self.config.services.items():
+            if service.role not in SERVICE_ROLES:
+                raise ValueError(f"Неизвестная роль сервиса {name}: {service.role}")
+            if not 0 <= service.mirror_rate <= 1:
+                raise ValueError(f"Доля копируемых запросов сервиса {name} должна быть от 0 до 1")
+        priority = self.config.priority
+        if priority.default not in priority.lanes:
+            raise ValueError(f"Полоса по умолчанию {priority.default} не описана в priority.lanes")
+        for name, lane in priority.lanes.items():
+            if lane.weight <= 0 or not 0 < lane.share <= 1:
+                raise ValueError(f"Некорректная полоса {name}: weight должен быть положительным, share - от 0 до 1")
         if self.mode == "single" and len(self.services) < 1:
             raise ValueError("Для режима 'single' требуется минимум один сервис")
         elif self.mode == "dual" and len(self.services) < 2:
             raise ValueError("Для режима 'dual' требуется минимум два сервиса")
         elif self.mode == "triple" and len(self.services) < 3:
             raise ValueError("Для режима 'triple' требуется минимум два сервиса")
+        elif self.mode == "balanced" and len(self.services) < 1:
+            raise ValueError("Для режима 'balanced' требуется минимум один сервис")
+        elif self.mode == "bandit" and len(self.services) < 2:
+            raise ValueError("Для режима 'bandit' требуется минимум два сервиса")
             
         total_weight = sum(service.weight for service in self.services.values())
         if total_weight <= 0:
             raise ValueError("Общий вес сервисов должен быть положительным числом")
+        
+        for name, service in self.services.items():
+            if service.ramp is not None and (service.ramp.from_weight < 0 or service.ramp.duration < 0):
+                raise ValueError(f"Некорректный разгон сервиса {name}: from_weight и duration должны быть неотрицательными")
+            if service.ramp is not None and self.mode == "bandit":
+                raise ValueError(f"Разгон сервиса {name} не используется в режиме 'bandit': доли задает распределитель")
     
-    def _select_service(self) -> Tuple[str, str]:
-        """Выбор сервиса с учетом весов"""
+    def _select_service(self, reviews: Optional[Sequence[Any]] = None) -> Tuple[str, str]:
+        """
+        Выбор сервиса с учетом весов
+        
+        Args:
+            reviews: Отзывы запроса; в режиме sticky пачка закрепляется
+                за вариантом по ключу первого отзыва
+            
+        Returns:
+            Имя и URL выбранного сервиса
+        """
         if self.mode == "single":
             # В режиме одного сервиса берем первый
             service_name = next(iter(self.services.keys()))
             return service_name, self.services[service_name].url
         
-        # Выбор сервиса по весовой системе
-        weights = [service.weight for service in self.services.values()]
-        service_names = list(self.services.keys())
+        if self.mode == "balanced":
+            # Реплики одной модели: выбираем наименее загруженную
+            service_name = self.balancer.pick()
+            return service_name, self.services[service_name].url
         
-        # Случайный выбор с учетом весов
-        selected_service = random.choices(service_names, weights=weights, k=1)[0]
+        # Выбор сервиса по предрассчитанной таблице бакетов
+        selected_service = self.assigner.assign_names(reviews[:1] if reviews else [None])[0]
         return selected_service, self.services[selected_service].url
     
     def _prepare_request_data(self, data: Any) -> Any:
@@ -58,12 +439,13 @@ class ServiceRouter(Generic[InputT, OutputT]):
         Returns:
             Подготовленные данные для отправки
         """
-        if isinstance(data, list):
-            # Если это список, преобразуем каждый элемент
-            return [self._prepare_single_item(item) for item in data]
-        else:
-            # Если одиночный элемент
-            return self._prepare_single_item(data)
+        with span("prepare"):
+            if isinstance(data, list):
+                # Если это список, преобразуем каждый элемент
+                return [self._prepare_single_item(item) for item in data]
+            else:
+                # Если одиночный элемент
+                return self._prepare_single_item(data)
     
     def _prepare_single_item(self, item: Any) -> Dict[str, Any]:
         """
@@ -93,9 +475,8 @@ class ServiceRouter(Generic[InputT, OutputT]):
         Returns:
             Экземпляр модели с данными
         """
-
-        logger.info(f"Input data: {data}")
-        logger.info(f"Input data type: {type(data)}")
+        # Ленивое форматирование: тело ответа не превращается в строку, если DEBUG выключен
+        logger.debug("Input data (%s): %s", type(data).__name__, data)
 
         if isinstance(data, dict):
             return output_model(**data)
@@ -104,86 +485,935 @@ class ServiceRouter(Generic[InputT, OutputT]):
         else:
             raise ValueError(f"Expected dict or list, got {type(data)}")
     
-    async def route_request(self, request_data: Union[InputT, List[InputT]], output_model: Type[OutputT]) -> List[OutputT]:
+    def _parse_response(self, json_response: Any, output_model: Type[OutputT]) -> List[OutputT]:
+        """
+        Преобразует JSON-ответ сервиса в список моделей
+        
+        Args:
+            json_response: Распарсенный ответ сервиса
+            output_model: Класс модели для ответа
+            
+        Returns:
+            Список ответов в формате модели
+        """
+        if isinstance(json_response, dict):
+            # Берём значение по ключу "generations"
+            generations = json_response.get("generations")
+            if isinstance(generations, list):
+                return [GenerationResponse(**item) for item in generations]
+            elif generations is not None:
+                # Если не список, но не None — оборачиваем в список
+                return [self._create_output_model(output_model, generations)]
+            else:
+                raise ValueError("Field 'generations' is missing in the response")
+
+        elif isinstance(json_response, list):
+            # Если уже список — обрабатываем напрямую
+            return [self._create_output_model(output_model, item) for item in json_response]
+
+        # Если ничего не подошло
+        raise ValueError(f"Unexpected response format: {json_response}")
+
+    async def _post(self, service_name: str, prepared_data: Any, output_model: Type[OutputT]) -> List[OutputT]:
+        """
+        Отправка подготовленных данных в сервис через его пул соединений
+        
+        Args:
+            service_name: Имя сервиса
+            prepared_data: Подготовленные данные запроса
+            output_model: Класс модели для ответа
+            
+        Returns:
+            Список ответов от сервиса
+        """
+        client = self.clients.get(service_name)
+        with span("encode"):
+            content = codec.dumps(prepared_data)
+        with span("upstream"):
+            response = await client.post(
+                self.services[service_name].url,
+                content=content,
+                headers={"Content-Type": "application/json"},
+            )
+        reviews = prepared_data.get("reviews") if isinstance(prepared_data, dict) else prepared_data
+        self.metrics[service_name].observe_payload(
+            len(reviews) if isinstance(reviews, list) else 1,
+            len(content),
+            len(response.content),
+        )
+        response.raise_for_status()
+        with span("decode"):
+            json_response = codec.loads(response.content)
+        with span("parse"):
+            result = self._parse_response(json_response, output_model)
+        # Запоминаем вариант, который фактически обработал отзыв
+        for item in result:
+            if isinstance(item, GenerationResponse):
+                item.variant = service_name
+        return result
+
+    async def _call_service(
+        self,
+        service_name: str,
+        reviews: Optional[List[ReviewInput]],
+        prepared_data: Any,
+        output_model: Type[OutputT],
+    ) -> List[OutputT]:
+        """
+        Вызов сервиса с учетом кеша ответов
+        
+        Args:
+            service_name: Имя сервиса
+            reviews: Отзывы запроса, если запрос является пачкой отзывов
+            prepared_data: Подготовленные данные запроса
+            output_model: Класс модели для ответа
+            
+        Returns:
+            Список ответов от сервиса
+        """
+        if self.cache is not None and reviews:
+            return await self._call_cached(service_name, reviews, output_model)
+        return await self._call_upstream(service_name, reviews, prepared_data, output_model)
+
+    async def _call_cached(
+        self,
+        service_name: str,
+        reviews: List[ReviewInput],
+        output_model: Type[OutputT],
+        retry_waiting: bool = True,
+    ) -> List[OutputT]:
+        """
+        Вызов сервиса только для отзывов, которых нет в кеше
+        
+        Одинаковые отзывы, уже отправленные параллельными запросами,
+        не отправляются повторно, а ждут результата первого вызова. Если этот
+        вызов упал или был отменен, отзыв считается промахом и отправляется
+        в сервис этим запросом.
+        
+        Args:
+            service_name: Имя сервиса
+            reviews: Отзывы запроса
+            output_model: Класс модели для ответа
+            retry_waiting: Отправлять ли отзывы, чей чужой вызов не удался
+                (при повторной отправке - нет, чтобы не повторять бесконечно)
+            
+        Returns:
+            Генерации в порядке отзывов
+        """
+        cache = self.cache
+        results: List[Optional[GenerationResponse]] = [None] * len(reviews)
+        waiting: List[Tuple[int, asyncio.Future]] = []
+        misses: List[Tuple[int, str]] = []
+        for position, review in enumerate(reviews):
+            key = cache.key_for(review, service_name)
+            cached = cache.get(key, service_name)
+            if cached is not None:
+                results[position] = rebind_generation(cached, review)
+                continue
+            future = cache.inflight(key)
+            if future is not None:
+                waiting.append((position, future))
+            else:
+                cache.start_flight(key)
+                misses.append((position, key))
+
+        if misses:
+            miss_reviews = [reviews[position] for position, _ in misses]
+            prepared_data = {"reviews": self._prepare_request_data(miss_reviews)}
+            try:
+                generations = await self._call_upstream(service_name, miss_reviews, prepared_data, output_model)
+            except BaseException as e:
+                # Ожидающие запросы не выбирали отмену: при отмене этого вызова
+                # они отправят свои отзывы сами
+                error = e if isinstance(e, Exception) else RuntimeError(f"Вызов сервиса {service_name} прерван")
+                for _, key in misses:
+                    cache.finish_flight(key, error=error)
+                raise
+
+            generations_by_id: Dict[str, Deque[GenerationResponse]] = defaultdict(deque)
+            for generation in generations:
+                generations_by_id[generation_review_id(generation)].append(generation)
+            for position, key in misses:
+                matched = generations_by_id.get(str(reviews[position].id))
+                generation = matched.popleft() if matched else None
+                results[position] = generation
+                cache.finish_flight(key, generation)
+
+        failed: List[int] = []
+        for position, future in waiting:
+            try:
+                # shield: отмена этого запроса не должна отменять ожидание у других
+                generation = await asyncio.shield(future)
+            except Exception as e:
+                logger.warning(f"Общий вызов сервиса {service_name} для отзыва {reviews[position].id} не удался: {str(e)}")
+                failed.append(position)
+                continue
+            if generation is not None:
+                results[position] = rebind_generation(generation, reviews[position])
+
+        if failed and retry_waiting:
+            # Неудача чужого вызова - промах только для этих отзывов, а не ошибка всей пачки
+            try:
+                retried = await self._call_cached(
+                    service_name, [reviews[position] for position in failed], output_model, retry_waiting=False
+                )
+            except Exception:
+                if not any(generation is not None for generation in results):
+                    raise
+                # Генерации, уже полученные этим запросом, не теряются из-за чужих отзывов
+                logger.error(f"Повторная отправка {len(failed)} отзывов в сервис {service_name} не удалась", exc_info=True)
+                retried = []
+            retried_by_id = {generation_review_id(generation): generation for generation in retried}
+            for position in failed:
+                results[position] = retried_by_id.get(str(reviews[position].id))
+
+        return [generation for generation in results if generation is not None]
+
+    async def _call_upstream(
+        self,
+        service_name: str,
+        reviews: Optional[List[ReviewInput]],
+        prepared_data: Any,
+        output_model: Type[OutputT],
+    ) -> List[OutputT]:
+        """
+        Вызов сервиса напрямую или через объединение с параллельными запросами
+        
+        Args:
+            service_name: Имя сервиса
+            reviews: Отзывы запроса, если запрос является пачкой отзывов
+            prepared_data: Подготовленные данные запроса
+            output_model: Класс модели для ответа
+            
+        Returns:
+            Список ответов от сервиса
+        """
+        batcher = self.batchers.get(service_name)
+        if batcher is not None and reviews:
+            return await batcher.submit(reviews)
+        return await self._post(service_name, prepared_data, output_model)
+
+    async def route_request(
+        self,
+        request_data: Union[InputT, List[InputT]],
+        output_model: Type[OutputT],
+        service_name: Optional[str] = None,
+        lane: Optional[str] = None,
+    ) -> List[OutputT]:
         """
         Универсальная маршрутизация запроса на выбранный сервис
         
         Args:
             request_data: Данные запроса (одиночный элемент или список)
             output_model: Класс модели для ответа
+            service_name: Сервис, уже выбранный вызывающим кодом; если не задан, выбирается по весам
+            lane: Полоса приоритета запроса (по умолчанию полоса по умолчанию)
             
         Returns:
             Список ответов от сервиса в формате модели output_model
         """
-        service_name, service_url = self._select_service()
+        reviews = getattr(request_data, "reviews", request_data)
+        if not isinstance(reviews, list):
+            reviews = None
+        if service_name is None:
+            service_name, _ = self._select_service(reviews)
         logger.info(f"Выбран сервис: {service_name}")
         
         # Подготовка данных запроса
         prepared_data = self._prepare_request_data(request_data)
         
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + self.deadline if self.deadline is not None else None
+        call = self._call_with_alternatives(service_name, reviews, prepared_data, output_model, deadline_at, lane)
+        started_at = time.perf_counter()
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    service_url,
-                    json=prepared_data,
-                )
-                response.raise_for_status()
-                
-                # Преобразуем ответ в модель
-                json_response = response.json()
-
-                if isinstance(json_response, dict):
-                    # Берём значение по ключу "generations"
-                    generations = json_response.get("generations")
-                    if isinstance(generations, list):
-                        return [GenerationResponse(**item) for item in generations]
-                    
-                    if isinstance(generations, list):
-                        # Если это список — обрабатываем каждый элемент
-                        return [self._create_output_model(output_model, item) for item in generations]
-                    elif generations is not None:
-                        # Если не список, но не None — оборачиваем в список
-                        return [self._create_output_model(output_model, generations)]
-                    else:
-                        raise ValueError("Field 'generations' is missing in the response")
+            if self.deadline is None:
+                responses = await call
+            else:
+                responses = await asyncio.wait_for(call, timeout=self.deadline)
+        except Exception as e:
+            if self.exposure is not None and reviews:
+                status = "timeout" if isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)) else "error"
+                self._log_exposure(reviews, None, service_name, time.perf_counter() - started_at, status)
+            raise
+        if self.exposure is not None and reviews:
+            self._log_exposure(reviews, responses, service_name, time.perf_counter() - started_at, "ok")
+        return responses
+
+    def _log_exposure(
+        self,
+        reviews: Sequence[Any],
+        responses: Optional[Sequence[Any]],
+        service_name: str,
+        latency: float,
+        status: str,
+    ) -> None:
+        """
+        Запись показов для отзывов запроса в журнал
 
-                elif isinstance(json_response, list):
-                    # Если уже список — обрабатываем напрямую
-                    return [self._create_output_model(output_model, item) for item in json_response]
+        Args:
+            reviews: Отзывы запроса (ReviewInput, BulkReview или словари)
+            responses: Генерации; None, если запрос завершился ошибкой или ответ не разбирается
+            service_name: Выбранный для запроса сервис
+            latency: Время обработки запроса
+            status: Исход запроса
+        """
+        by_id = {generation_review_id(response): response for response in responses or ()}
+        for review in reviews:
+            if isinstance(review, BulkReview):
+                fields = review.row
+            else:
+                fields = review if isinstance(review, dict) else review.__dict__
+            response = by_id.get(str(fields.get("id")))
+            if response is None:
+                # Сервис ответил, но генерации для отзыва нет (без responses - исход запроса)
+                review_status = "error" if status == "ok" and responses is not None else status
+                self.exposure.record(fields.get("id"), fields.get("globalUserId"), fields.get("nmId"),
+                                     service_name, latency, review_status, 0)
+                continue
+            text = getattr(response, "response", None) or ""
+            self.exposure.record(fields.get("id"), fields.get("globalUserId"), fields.get("nmId"),
+                                 getattr(response, "variant", None) or service_name, latency, status,
+                                 len(text.encode("utf-8")))
+
+    async def _send_shadow(self, service_name: str, request: Tuple[Sequence[Any], Optional[bytes]]) -> None:
+        """
+        Отправка копии запроса в теневой сервис
 
-                # Если ничего не подошло
-                raise ValueError(f"Unexpected response format: {json_response}")     
-                
+        Ответ клиенту не возвращается: задержка и исход попадают в метрики сервиса,
+        генерации (при включенном журнале) - в журнал показов под именем теневого сервиса.
+
+        Args:
+            service_name: Имя теневого сервиса
+            request: Отзывы запроса и исходное тело (в режиме passthrough) или None
+        """
+        reviews, body = request
+        if body is None:
+            body = codec.dumps({"reviews": self._prepare_request_data(list(reviews))})
+        metrics = self.metrics[service_name]
+        metrics.call_started()
+        started_at = time.perf_counter()
+        generations: Optional[List[GenerationResponse]] = None
+        outcome, cause = "error", None
+        try:
+            response = await self.clients.get(service_name).post(
+                self.shadows[service_name].url,
+                content=body,
+                headers={"Content-Type": "application/json"},
+            )
+            metrics.observe_payload(len(reviews), len(body), len(response.content))
+            response.raise_for_status()
+            generations = self._parse_response(codec.loads(response.content), GenerationResponse)
+            outcome = "success"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
         except Exception as e:
-            logger.error(f"Ошибка при обращении к сервису {service_name}: {str(e)}")
-            
-            # Если включен режим резервирования и есть другие сервисы
-            if self.fallback_enabled and self.mode == "dual" and len(self.services) > 1:
-                fallback_services = {k: v for k, v in self.services.items() if k != service_name}
-                
-                if fallback_services:
-                    fallback_name = next(iter(fallback_services.keys()))
-                    fallback_url = fallback_services[fallback_name].url
-                    
-                    logger.info(f"Используем резервный сервис: {fallback_name}")
-                    
-                    try:
-                        async with httpx.AsyncClient(timeout=self.timeout) as client:
-                            response = await client.post(
-                                fallback_url,
-                                json=prepared_data,
-                            )
-                            response.raise_for_status()
-                            
-                            # Преобразуем ответ в модель
-                            json_response = response.json()
-                            if isinstance(json_response, list):
-                                return [self._create_output_model(output_model, item) for item in json_response]
-                            return [self._create_output_model(output_model, json_response)]
-                    except Exception as fallback_error:
-                        logger.error(f"Ошибка при обращении к резервному сервису: {str(fallback_error)}")
+            cause = _error_cause(e)
+            logger.warning(f"Теневой сервис {service_name} ответил ошибкой: {str(e)}")
+        finally:
+            latency = time.perf_counter() - started_at
+            metrics.call_finished(latency, outcome, cause)
+        if self.exposure is not None:
+            status = "ok" if outcome == "success" else "timeout" if cause == "timeout" else "error"
+            self._log_exposure(reviews, generations, service_name, latency, status)
+
+    def _hedge_delay(self, service_name: str) -> Optional[float]:
+        """
+        Через сколько секунд без ответа сервиса отправлять дублирующий запрос
+        
+        Args:
+            service_name: Имя основного сервиса
+            
+        Returns:
+            Задержка в секундах или None, если хеджирование выключено
+        """
+        if not self.hedging.enabled or len(self.services) < 2:
+            return None
+        max_delay = self.hedging.max_delay if self.hedging.max_delay is not None else self.timeout
+        window = self.latencies[service_name]
+        if len(window) < self.hedging.min_samples:
+            return max_delay
+        return min(max(window.percentile(self.hedging.percentile), self.hedging.min_delay), max_delay)
+
+    def hedge_delays(self) -> Dict[str, Optional[float]]:
+        """Текущие пороги хеджирования по сервисам"""
+        return {name: self._hedge_delay(name) for name in self.services}
+
+    def _pick_alternative(self, tried: Sequence[str]) -> Optional[str]:
+        """
+        Выбор сервиса для резервного или дублирующего запроса
+        
+        Предпочитается сервис с наименьшей медианной задержкой; сервисы
+        без замеров идут первыми, при равенстве — по убыванию веса.
+        
+        Args:
+            tried: Сервисы, в которые запрос уже отправлялся
             
+        Returns:
+            Имя сервиса или None, если вариантов не осталось
+        """
+        candidates = [
+            name for name, service in self.services.items()
+            if name not in tried and service.weight > 0 and (self.health is None or self.health.is_available(name))
+        ]
+        if not candidates:
+            return None
+        return min(
+            candidates,
+            key=lambda name: (self.latencies[name].percentile(50) or 0.0, -self.services[name].weight),
+        )
+
+    @asynccontextmanager
+    async def _track_call(self, service_name: str, deadline_at: Optional[float] = None, lane: Optional[str] = None):
+        """
+        Учет вызова сервиса: задержка, нагрузка и исход для автомата отключения
+        и наград режима bandit
+        
+        Задержка учитывается и для упавших или отмененных вызовов: это
+        нижняя оценка времени ответа медленного сервиса. При ограничении
+        параллельности вызов сначала ждет слот в очереди полосы lane (ожидание
+        в задержку не входит) и отклоняется с AdmissionRejected, если не успевает
+        к deadline_at. Вызов, отмененный по истечении deadline_at, учитывается
+        как таймаут сервиса, а не как отмененный.
+        """
+        limiter = self.limiters.get(service_name)
+        lane = lane or self.config.priority.default
+        if limiter is not None:
+            await limiter.acquire(self._admission_budget(deadline_at), lane)
+        started_at = time.perf_counter()
+        self.balancer.acquire(service_name)
+        metrics = self.metrics[service_name]
+        metrics.call_started()
+        success = timed_out = cancelled = False
+        cause: Optional[str] = None
+        try:
+            yield
+            success = True
+        except asyncio.CancelledError:
+            if deadline_at is not None and asyncio.get_running_loop().time() >= deadline_at - _DEADLINE_TOLERANCE:
+                # Вызов прерван дедлайном запроса: для автомата и наград это таймаут сервиса
+                cause = "timeout"
+                timed_out = True
+            else:
+                cancelled = True
+            raise
+        except Exception as e:
+            cause = _error_cause(e)
+            timed_out = cause == "timeout"
+            raise
+        finally:
+            if limiter is not None:
+                limiter.release(lane)
+            latency = time.perf_counter() - started_at
+            outcome = "success" if success else "cancelled" if cancelled else "error"
+            metrics.call_finished(latency, outcome, cause)
+            self.latencies[service_name].add(latency)
+            # Быстрая ошибка не должна делать реплику привлекательной для балансировщика:
+            # упавший вызов учитывается как ответ за таймаут, отмененный не учитывается
+            self.balancer.release(
+                service_name, None if cancelled else latency if success else max(latency, self.timeout)
+            )
+            # Вызов, отмененный до дедлайна (проигравший хедж), не говорит о здоровье сервиса
+            if self.health is not None and not cancelled:
+                self.health.record(service_name, success, timed_out, latency)
+            if self.bandit is not None and not cancelled:
+                self.bandit.record(service_name, success, latency)
+
+    async def _timed_call(
+        self,
+        service_name: str,
+        reviews: Optional[List[ReviewInput]],
+        prepared_data: Any,
+        output_model: Type[OutputT],
+        deadline_at: Optional[float] = None,
+        lane: Optional[str] = None,
+    ) -> List[OutputT]:
+        """Вызов сервиса с учетом задержки и исхода"""
+        async with self._track_call(service_name, deadline_at, lane):
+            return await self._call_service(service_name, reviews, prepared_data, output_model)
+
+    async def _call_with_alternatives(
+        self,
+        service_name: str,
+        reviews: Optional[List[ReviewInput]],
+        prepared_data: Any,
+        output_model: Type[OutputT],
+        deadline_at: Optional[float] = None,
+        lane: Optional[str] = None,
+    ) -> List[OutputT]:
+        """
+        Вызов сервиса с хеджированием и резервированием
+        
+        Если основной сервис не ответил за перцентиль своей задержки, запрос
+        дублируется в другой вариант и используется первый успешный ответ.
+        Если сервис вернул ошибку, запрос уходит в следующий резервный сервис.
+        Незавершенные вызовы отменяются.
+        
+        Args:
+            service_name: Имя основного сервиса
+            reviews: Отзывы запроса, если запрос является пачкой отзывов
+            prepared_data: Подготовленные данные запроса
+            output_model: Класс модели для ответа
+            deadline_at: Дедлайн запроса (время цикла событий) для ожидания слотов сервисов
+            lane: Полоса приоритета запроса
+            
+        Returns:
+            Список ответов от первого успешно ответившего сервиса
+        """
+        tried = [service_name]
+        tasks: Dict[asyncio.Future, str] = {}
+
+        def launch(name: str) -> None:
+            task = asyncio.ensure_future(self._timed_call(name, reviews, prepared_data, output_model, deadline_at, lane))
+            tasks[task] = name
+
+        launch(service_name)
+        hedge_delay = self._hedge_delay(service_name)
+        last_error: Optional[BaseException] = None
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Сервис отвечает дольше обычного — дублируем запрос
+                    hedge_delay = None
+                    alternative = self._pick_alternative(tried)
+                    if alternative is not None:
+                        logger.info(f"Сервис {tried[-1]} не ответил вовремя, дублируем запрос в {alternative}")
+                        tried.append(alternative)
+                        launch(alternative)
+                    continue
+
+                for task in done:
+                    name = tasks.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        return task.result()
+                    last_error = error
+                    logger.error(f"Ошибка при обращении к сервису {name}: {str(error)}")
+
+                # Если все отправленные вызовы упали, пробуем резервный сервис
+                if not tasks and self.fallback_enabled:
+                    alternative = self._pick_alternative(tried)
+                    if alternative is not None:
+                        logger.info(f"Используем резервный сервис: {alternative}")
+                        tried.append(alternative)
+                        launch(alternative)
+                        hedge_delay = self._hedge_delay(alternative)
+
             # Если все сервисы недоступны, просто выбрасываем исключение
+            raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def route_batch(self, request: Union[GenerateResponseRequest, ReviewBatch]) -> ReviewGenerationResponse:
+        """
+        Обработка пачки отзывов с учетом режима разбиения
+        
+        Args:
+            request: Запрос с пачкой отзывов (и приоритетом) или пачка, проверенная app.bulk
+            
+        Returns:
+            Ответ с генерациями (и ошибками по отзывам, если часть подпачек не обработана)
+        """
+        if self.mirror is not None:
+            self.mirror.mirror((request.reviews, None))
+        lane = self.lane_for(request.priority)
+        if not self.fanout or self.mode in ("single", "balanced"):
+            generations = await self.route_request(request, GenerationResponse, lane=lane)
+            return ReviewGenerationResponse(generations=generations)
+        return await self._route_fanout(request, lane)
+
+    def _group_positions(self, reviews: Sequence[Any]) -> Dict[str, np.ndarray]:
+        """
+        Позиции отзывов, сгруппированные по сервисам
+        
+        Без разбиения пачки (или в режимах single/balanced) вся пачка
+        достается одному выбранному сервису.
+        """
+        if not self.fanout or self.mode in ("single", "balanced"):
+            service_name, _ = self._select_service(reviews)
+            return {service_name: np.arange(len(reviews))}
+        indices = self.assigner.assign(reviews)
+        return {self.assigner.names[index]: np.flatnonzero(indices == index) for index in np.unique(indices)}
+
+    async def _route_fanout(
+        self,
+        request: Union[GenerateResponseRequest, ReviewBatch],
+        lane: Optional[str] = None,
+    ) -> ReviewGenerationResponse:
+        """
+        Распределяет каждый отзыв по вариантам и параллельно отправляет подпачки
+        
+        Args:
+            request: Запрос с пачкой отзывов
+            lane: Полоса приоритета запроса
+            
+        Returns:
+            Генерации в исходном порядке отзывов и ошибки упавших подпачек
+        """
+        reviews = request.reviews
+        positions_by_service = self._group_positions(reviews)
+        groups = {
+            name: [reviews[position] for position in positions]
+            for name, positions in positions_by_service.items()
+        }
+        logger.info(f"Отзывы распределены по сервисам: { {name: len(group) for name, group in groups.items()} }")
+
+        if isinstance(request, ReviewBatch):
+            # Подпачки из проверенных строк, без повторной проверки
+            group_requests = [request.select(positions) for positions in positions_by_service.values()]
+        else:
+            group_requests = [GenerateResponseRequest(reviews=group) for group in groups.values()]
+        results = await asyncio.gather(
+            *(
+                self.route_request(group_request, GenerationResponse, service_name=name, lane=lane)
+                for name, group_request in zip(groups, group_requests)
+            ),
+            return_exceptions=True,
+        )
+
+        generations_by_id: Dict[str, Deque[GenerationResponse]] = defaultdict(deque)
+        unmatched: List[GenerationResponse] = []
+        errors: List[GenerationError] = []
+        last_error: Optional[BaseException] = None
+        for (name, group), result in zip(groups.items(), results):
+            if isinstance(result, BaseException):
+                last_error = result
+                errors.extend(GenerationError(id=review.id, service=name, error=str(result)) for review in group)
+                continue
+            for generation in result:
+                review_id = generation_review_id(generation)
+                if review_id is None:
+                    unmatched.append(generation)
+                else:
+                    generations_by_id[review_id].append(generation)
+
+        if last_error is not None and len(errors) == len(reviews):
+            # Ни одна подпачка не обработана — отдаем ошибку целиком
+            raise last_error
+
+        # Восстанавливаем исходный порядок отзывов
+        generations: List[GenerationResponse] = []
+        for review in reviews:
+            matched = generations_by_id.get(str(review.id))
+            if matched:
+                generations.append(matched.popleft())
+        for remaining in generations_by_id.values():
+            unmatched.extend(remaining)
+
+        return ReviewGenerationResponse(generations=generations + unmatched, errors=errors or None)
+
+    async def route_stream(
+        self,
+        reviews: List[ReviewInput],
+        order: str = "completion",
+        priority: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковая обработка пачки: генерации отдаются по мере готовности
+        
+        Подпачки (при разбиении) отправляются параллельно, ответы сервисов
+        в формате NDJSON читаются построчно. Каждый элемент содержит индекс
+        отзыва в исходной пачке.
+        
+        Args:
+            reviews: Отзывы запроса
+            order: "completion" - в порядке готовности, "request" - в порядке отзывов
+            priority: Приоритет запроса
+            
+        Yields:
+            {"index": ..., "variant": ..., "generation": {...}} или {"index": ..., "error": {...}}
+        """
+        if self.mirror is not None:
+            self.mirror.mirror((reviews, None))
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + self.deadline if self.deadline is not None else None
+        lane = self.lane_for(priority)
+        started_at = time.perf_counter()
+        queue: asyncio.Queue = asyncio.Queue()
+        groups = self._group_positions(reviews)
+        tasks = [
+            asyncio.ensure_future(self._stream_group(name, reviews, positions, queue, deadline_at, lane))
+            for name, positions in groups.items()
+        ]
+        service_of = {int(position): name for name, positions in groups.items() for position in positions}
+        unresolved = set(range(len(reviews)))
+        buffer: Dict[int, Optional[Dict[str, Any]]] = {}
+        unmatched: List[Dict[str, Any]] = []
+        next_index = 0
+        running = len(tasks)
+        try:
+            while running:
+                timeout = None if deadline_at is None else max(deadline_at - loop.time(), 0)
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    logger.error("Превышен дедлайн потоковой обработки запроса")
+                    break
+                if event is None:
+                    running -= 1
+                    continue
+
+                index, item = event
+                if index is None:
+                    # Генерация без известного отзыва
+                    if order == "completion":
+                        yield item
+                    else:
+                        unmatched.append(item)
+                    continue
+                unresolved.discard(index)
+                if order == "completion":
+                    if item is not None:
+                        yield item
+                    continue
+                buffer[index] = item
+                while next_index in buffer:
+                    item = buffer.pop(next_index)
+                    next_index += 1
+                    if item is not None:
+                        yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        # Отзывы, не обработанные до дедлайна
+        for index in range(next_index if order == "request" else 0, len(reviews)):
+            if index in buffer:
+                if buffer[index] is not None:
+                    yield buffer[index]
+            elif index in unresolved:
+                if self.exposure is not None:
+                    self._log_exposure([reviews[index]], None, service_of[index], time.perf_counter() - started_at, "timeout")
+                error = GenerationError(id=reviews[index].id, service=service_of[index], error="Request deadline exceeded")
+                yield {"index": index, "error": error.model_dump(mode="json")}
+        for item in unmatched:
+            yield item
+
+    async def _stream_group(
+        self,
+        service_name: str,
+        reviews: List[ReviewInput],
+        positions: np.ndarray,
+        queue: asyncio.Queue,
+        deadline_at: Optional[float] = None,
+        lane: Optional[str] = None,
+    ) -> None:
+        """
+        Потоковая обработка подпачки с передачей элементов в очередь
+        
+        Для каждой позиции подпачки в очередь попадает ровно одно событие
+        (index, элемент) или (index, None), если сервис не вернул генерацию;
+        в конце передается None. Показ отзыва пишется в журнал, когда известен
+        его исход, со временем от начала обработки подпачки.
+        """
+        started_at = time.perf_counter()
+        group = [reviews[position] for position in positions]
+        positions_by_id: Dict[str, Deque[int]] = defaultdict(deque)
+        for position in positions:
+            positions_by_id[str(reviews[position].id)].append(int(position))
+        remaining = {int(position) for position in positions}
+        try:
+            async for generation in self._stream_service(service_name, group, deadline_at, lane):
+                matched = positions_by_id.get(generation_review_id(generation))
+                index = matched.popleft() if matched else None
+                remaining.discard(index)
+                if self.exposure is not None and index is not None:
+                    self._log_exposure([reviews[index]], [generation], service_name, time.perf_counter() - started_at, "ok")
+                item = {"index": index, "variant": generation.variant, "generation": generation.model_dump(mode="json")}
+                queue.put_nowait((index, item))
+        except asyncio.CancelledError:
             raise
+        except Exception as e:
+            if self.exposure is not None and remaining:
+                status = "timeout" if isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)) else "error"
+                self._log_exposure([reviews[index] for index in sorted(remaining)], None, service_name,
+                                   time.perf_counter() - started_at, status)
+            for index in sorted(remaining):
+                error = GenerationError(id=reviews[index].id, service=service_name, error=str(e))
+                queue.put_nowait((index, {"index": index, "error": error.model_dump(mode="json")}))
+            remaining.clear()
+        if self.exposure is not None and remaining:
+            # Сервис ответил, но генерации для отзывов нет
+            self._log_exposure([reviews[index] for index in sorted(remaining)], None, service_name,
+                               time.perf_counter() - started_at, "error")
+        for index in remaining:
+            queue.put_nowait((index, None))
+        queue.put_nowait(None)
+
+    async def _stream_service(
+        self,
+        service_name: str,
+        reviews: List[ReviewInput],
+        deadline_at: Optional[float] = None,
+        lane: Optional[str] = None,
+    ) -> AsyncIterator[GenerationResponse]:
+        """
+        Генерации сервиса по мере чтения ответа
+        
+        Если сервис отвечает в формате NDJSON, каждая строка разбирается сразу;
+        иначе ответ читается целиком. Резервный сервис используется, если ошибка
+        произошла до первой генерации.
+        """
+        prepared_data = {"reviews": self._prepare_request_data(reviews)}
+        tried = [service_name]
+        while True:
+            emitted = False
+            try:
+                async with self._track_call(service_name, deadline_at, lane):
+                    client = self.clients.get(service_name)
+                    async with client.stream(
+                        "POST",
+                        self.services[service_name].url,
+                        json=prepared_data,
+                        headers={"Accept": f"{NDJSON_MEDIA_TYPE}, application/json"},
+                    ) as response:
+                        response.raise_for_status()
+                        if response.headers.get("content-type", "").startswith(NDJSON_MEDIA_TYPE):
+                            async for line in response.aiter_lines():
+                                if not line.strip():
+                                    continue
+                                generation = GenerationResponse(**codec.loads(line))
+                                generation.variant = service_name
+                                emitted = True
+                                yield generation
+                        else:
+                            body = await response.aread()
+                            for generation in self._parse_response(codec.loads(body), GenerationResponse):
+                                generation.variant = service_name
+                                emitted = True
+                                yield generation
+                return
+            except Exception as e:
+                if emitted:
+                    raise
+                logger.error(f"Ошибка при обращении к сервису {service_name}: {str(e)}")
+                alternative = self._pick_alternative(tried) if self.fallback_enabled else None
+                if alternative is None:
+                    raise
+                logger.info(f"Используем резервный сервис: {alternative}")
+                tried.append(alternative)
+                service_name = alternative
+
+    @staticmethod
+    def parse_envelope(body: bytes) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Проверка только конверта запроса, без разбора отзывов в модели
+        
+        Args:
+            body: Тело запроса
+            
+        Returns:
+            Список отзывов в виде словарей и приоритет из поля priority (если задан)
+            
+        Raises:
+            ValueError: Если тело не является объектом с непустым списком reviews
+        """
+        try:
+            envelope = codec.loads(body)
+        except Exception as e:
+            raise ValueError(f"Invalid JSON: {str(e)}")
+        reviews = envelope.get("reviews") if isinstance(envelope, dict) else None
+        if not isinstance(reviews, list):
+            raise ValueError("Field 'reviews' must be a list")
+        if not reviews:
+            raise ValueError("No reviews provided in the request")
+        if not all(isinstance(review, dict) for review in reviews):
+            raise ValueError("Each review must be an object")
+        priority = envelope.get("priority")
+        return reviews, str(priority) if priority is not None else None
+
+    async def route_raw(
+        self,
+        body: bytes,
+        reviews: List[Dict[str, Any]],
+        priority: Optional[str] = None,
+    ) -> Tuple[str, httpx.Response]:
+        """
+        Проксирование сырого тела запроса в выбранный сервис
+        
+        Отзывы не валидируются и не сериализуются повторно, тело ответа
+        не читается: вызывающий код передает его клиенту потоком и закрывает ответ.
+        Резервный сервис используется, если ошибка произошла до начала ответа.
+        
+        Args:
+            body: Тело входящего запроса
+            reviews: Отзывы из конверта (для выбора варианта)
+            priority: Приоритет запроса
+            
+        Returns:
+            Имя сервиса и ответ с непрочитанным телом
+        """
+        if self.mirror is not None:
+            self.mirror.mirror((reviews, body))
+        lane = self.lane_for(priority)
+        service_name, _ = self._select_service(reviews)
+        # Сервисы в порядке попыток: _send_raw дописывает резервные, поэтому при ошибке
+        # (в том числе по дедлайну) известен последний вызванный сервис
+        tried = [service_name]
+        started_at = time.perf_counter()
+        try:
+            if self.deadline is None:
+                service_name, response = await self._send_raw(tried, body, reviews, lane=lane)
+            else:
+                call = self._send_raw(tried, body, reviews, asyncio.get_running_loop().time() + self.deadline, lane)
+                service_name, response = await asyncio.wait_for(call, timeout=self.deadline)
+        except Exception as e:
+            if self.exposure is not None:
+                status = "timeout" if isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)) else "error"
+                self._log_exposure(reviews, None, tried[-1], time.perf_counter() - started_at, status)
+            raise
+        if self.exposure is not None:
+            # Тело ответа не читается: исход определяется по статусу, размер ответа не известен
+            status = "ok" if response.status_code < 400 else "error"
+            self._log_exposure(reviews, None, service_name, time.perf_counter() - started_at, status)
+        return service_name, response
+
+    async def _send_raw(
+        self,
+        tried: List[str],
+        body: bytes,
+        reviews: List[Dict[str, Any]],
+        deadline_at: Optional[float] = None,
+        lane: Optional[str] = None,
+    ) -> Tuple[str, httpx.Response]:
+        """
+        Отправка тела в сервис tried[-1] с переходом на резервные
+
+        Резервные сервисы дописываются в tried до вызова.
+        """
+        service_name = tried[-1]
+        while True:
+            try:
+                async with self._track_call(service_name, deadline_at, lane):
+                    client = self.clients.get(service_name)
+                    request = client.build_request(
+                        "POST",
+                        self.services[service_name].url,
+                        content=body,
+                        headers={"Content-Type": "application/json"},
+                    )
+                    with span("upstream"):
+                        response = await client.send(request, stream=True)
+                    content_length = response.headers.get("content-length")
+                    self.metrics[service_name].observe_payload(
+                        len(reviews),
+                        len(body),
+                        int(content_length) if content_length and content_length.isdigit() else None,
+                    )
+                    if response.status_code >= 500:
+                        await response.aclose()
+                        response.raise_for_status()
+                return service_name, response
+            except Exception as e:
+                logger.error(f"Ошибка при обращении к сервису {service_name}: {str(e)}")
+                alternative = self._pick_alternative(tried) if self.fallback_enabled else None
+                if alternative is None:
+                    raise
+                logger.info(f"Используем резервный сервис: {alternative}")
+                tried.append(alternative)
+                service_name = alternative
 
 service_router = ServiceRouter()
\ No newline at end of file
@@ -1,17 +1,270 @@
 import logging
 from dataclasses import dataclass
-from typing import Dict
+from pathlib import Path
+from typing import Dict, Optional
 
 from omegaconf import OmegaConf
 
-from app.constants import CONFIG_PATH, DEFAULT_MODE, DEFAULT_TIMEOUT
+from app.constants import (
+    CONFIG_PATH,
+    DEFAULT_ADMISSION_MAX_CONCURRENCY,
+    DEFAULT_ADMISSION_MAX_QUEUE,
+    DEFAULT_ADMISSION_MAX_WAIT,
+    DEFAULT_ADMISSION_REJECT_STATUS,
+    DEFAULT_ASSIGNMENT_KEY,
+    DEFAULT_ASSIGNMENT_STRATEGY,
+    DEFAULT_BANDIT_ALGORITHM,
+    DEFAULT_BANDIT_EXPLORATION,
+    DEFAULT_BANDIT_HALF_LIFE,
+    DEFAULT_BANDIT_INTERVAL,
+    DEFAULT_BANDIT_LATENCY_TARGET,
+    DEFAULT_BANDIT_MIN_SAMPLES,
+    DEFAULT_BANDIT_MIN_SHARE,
+    DEFAULT_BANDIT_SAMPLES,
+    DEFAULT_BREAKER_ERROR_RATE,
+    DEFAULT_BREAKER_LATENCY_OUTLIER_FACTOR,
+    DEFAULT_BREAKER_MIN_REQUESTS,
+    DEFAULT_BREAKER_OPEN_DURATION,
+    DEFAULT_BREAKER_PROBE_INTERVAL,
+    DEFAULT_BREAKER_PROBE_SUCCESSES,
+    DEFAULT_BREAKER_PROBE_TIMEOUT,
+    DEFAULT_BREAKER_TIMEOUT_RATE,
+    DEFAULT_BREAKER_WINDOW,
+    DEFAULT_BUCKETS,
+    DEFAULT_CACHE_MAX_BYTES,
+    DEFAULT_CACHE_TTL,
+    DEFAULT_COALESCING_MAX_BATCH_SIZE,
+    DEFAULT_COALESCING_WINDOW_MS,
+    DEFAULT_EWMA_ALPHA,
+    DEFAULT_EXPOSURE_BUFFER_SIZE,
+    DEFAULT_EXPOSURE_FLUSH_INTERVAL,
+    DEFAULT_EXPOSURE_MAX_FILE_BYTES,
+    DEFAULT_EXPOSURE_MAX_FILES,
+    DEFAULT_EXPOSURE_OVERFLOW,
+    DEFAULT_EXPOSURE_PATH,
+    DEFAULT_EXPOSURE_ROTATE_INTERVAL,
+    DEFAULT_HEDGE_MIN_DELAY,
+    DEFAULT_HEDGE_MIN_SAMPLES,
+    DEFAULT_HEDGE_PERCENTILE,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_KEEPALIVE_EXPIRY,
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+    DEFAULT_MODE,
+    DEFAULT_PRIORITY_HEADER,
+    DEFAULT_PRIORITY_LANE,
+    DEFAULT_PROFILING_INTERVAL,
+    DEFAULT_PROFILING_MAX_SECONDS,
+    DEFAULT_PROFILING_SAMPLE_RATE,
+    DEFAULT_RAMP_DURATION,
+    DEFAULT_RELOAD_INTERVAL,
+    DEFAULT_SHADOW_CONCURRENCY,
+    DEFAULT_SHADOW_QUEUE_SIZE,
+    DEFAULT_TIMEOUT,
+)
 
 logger = logging.getLogger(__name__)
 
+# Роли сервисов: primary получает трафик по весам, shadow - только копии запросов
+SERVICE_ROLES = ("primary", "shadow")
+
+@dataclass
+class RampConfig:
+    # Вес в начале разгона; к концу разгона вес плавно доходит до weight сервиса
+    from_weight: float = 0.0
+    # Длительность разгона (секунды)
+    duration: float = DEFAULT_RAMP_DURATION
+    # Начало разгона в формате ISO 8601; если не задано - момент загрузки конфигурации
+    start: Optional[str] = None
+
 @dataclass
 class ServiceConfig:
     url: str
     weight: float = 1.0
+    # Параметры пула соединений
+    max_connections: int = DEFAULT_MAX_CONNECTIONS
+    max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS
+    keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY
+    http2: bool = False
+    # Таймауты; если read_timeout не задан, используется общий timeout
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT
+    read_timeout: Optional[float] = None
+    # URL для активной проверки (GET); если не задан, проверка отправляет пустую пачку на url
+    probe_url: Optional[str] = None
+    # Плавное изменение веса по расписанию
+    ramp: Optional[RampConfig] = None
+    # Роль сервиса: "primary" или "shadow"
+    role: str = "primary"
+    # Для теневого сервиса: доля запросов, копии которых отправляются в сервис
+    mirror_rate: float = 1.0
+    # Ограничения параллельности вызовов; если не заданы, берутся из секции admission
+    max_concurrency: Optional[int] = None
+    max_queue: Optional[int] = None
+    # Для режима bandit: минимальная доля трафика варианта; если не задана, берется bandit.min_share
+    min_share: Optional[float] = None
+
+@dataclass
+class AssignmentConfig:
+    # "random" - случайный выбор по весам, "sticky" - по хешу ключа
+    strategy: str = DEFAULT_ASSIGNMENT_STRATEGY
+    # Поле ReviewInput, по которому закрепляется вариант: globalUserId, nmId, id
+    key: str = DEFAULT_ASSIGNMENT_KEY
+    # Соль эксперимента: разные соли дают независимые разбиения
+    salt: str = ""
+    buckets: int = DEFAULT_BUCKETS
+
+@dataclass
+class CoalescingConfig:
+    # Если True, отзывы параллельных запросов к одному сервису объединяются в одну пачку
+    enabled: bool = False
+    # Максимальное время накопления пачки в миллисекундах
+    window_ms: float = DEFAULT_COALESCING_WINDOW_MS
+    # Пачка отправляется сразу, как только набралось столько отзывов
+    max_batch_size: int = DEFAULT_COALESCING_MAX_BATCH_SIZE
+
+@dataclass
+class CacheConfig:
+    # Если True, генерации для одинаковых отзывов берутся из кеша
+    enabled: bool = False
+    # Максимальный объем ответов в кеше (байт)
+    max_bytes: int = DEFAULT_CACHE_MAX_BYTES
+    # Время жизни записи (секунды)
+    ttl: float = DEFAULT_CACHE_TTL
+
+@dataclass
+class HedgingConfig:
+    # Если True, при долгом ответе основного сервиса запрос дублируется в другой вариант
+    enabled: bool = False
+    # Перцентиль задержки сервиса, после которого отправляется дублирующий запрос
+    percentile: float = DEFAULT_HEDGE_PERCENTILE
+    # Границы задержки перед дублированием (секунды); max_delay по умолчанию равен timeout
+    min_delay: float = DEFAULT_HEDGE_MIN_DELAY
+    max_delay: Optional[float] = None
+    # Пока замеров меньше, дублирование происходит через max_delay
+    min_samples: int = DEFAULT_HEDGE_MIN_SAMPLES
+
+@dataclass
+class BreakerConfig:
+    # Если True, деградировавшие сервисы исключаются из распределения
+    enabled: bool = False
+    # Количество последних вызовов, по которым считаются доли ошибок и таймаутов
+    window: int = DEFAULT_BREAKER_WINDOW
+    min_requests: int = DEFAULT_BREAKER_MIN_REQUESTS
+    # Пороги срабатывания
+    error_rate: float = DEFAULT_BREAKER_ERROR_RATE
+    timeout_rate: float = DEFAULT_BREAKER_TIMEOUT_RATE
+    # Во сколько раз медианная задержка должна превышать медиану остальных сервисов (0 - выключено)
+    latency_outlier_factor: float = DEFAULT_BREAKER_LATENCY_OUTLIER_FACTOR
+    # Сколько секунд сервис исключен до начала проверок
+    open_duration: float = DEFAULT_BREAKER_OPEN_DURATION
+    probe_interval: float = DEFAULT_BREAKER_PROBE_INTERVAL
+    probe_timeout: float = DEFAULT_BREAKER_PROBE_TIMEOUT
+    # Сколько успешных проверок подряд нужно для возврата сервиса
+    probe_successes: int = DEFAULT_BREAKER_PROBE_SUCCESSES
+
+@dataclass
+class ExposureConfig:
+    # Если True, каждый обработанный отзыв записывается в журнал показов
+    enabled: bool = False
+    # Каталог файлов журнала
+    path: str = str(DEFAULT_EXPOSURE_PATH)
+    # Емкость кольцевого буфера в памяти (записей)
+    buffer_size: int = DEFAULT_EXPOSURE_BUFFER_SIZE
+    # Период сброса буфера в файл (секунды)
+    flush_interval: float = DEFAULT_EXPOSURE_FLUSH_INTERVAL
+    # Что делать при переполнении буфера: "drop_newest" - отбрасывать новые записи,
+    # "drop_oldest" - перезаписывать самые старые
+    overflow: str = DEFAULT_EXPOSURE_OVERFLOW
+    # Ротация файлов по размеру (байт) и по времени (секунды)
+    max_file_bytes: int = DEFAULT_EXPOSURE_MAX_FILE_BYTES
+    rotate_interval: float = DEFAULT_EXPOSURE_ROTATE_INTERVAL
+    # Сколько последних файлов хранить
+    max_files: int = DEFAULT_EXPOSURE_MAX_FILES
+
+@dataclass
+class ReloadConfig:
+    # Если True, файл конфигурации перечитывается при изменении
+    watch: bool = False
+    # Период проверки файла (секунды)
+    interval: float = DEFAULT_RELOAD_INTERVAL
+
+@dataclass
+class AdmissionConfig:
+    # Если True, число одновременных вызовов каждого сервиса ограничено, лишние ждут в очереди
+    enabled: bool = False
+    # Ограничения по умолчанию для сервисов
+    max_concurrency: int = DEFAULT_ADMISSION_MAX_CONCURRENCY
+    max_queue: int = DEFAULT_ADMISSION_MAX_QUEUE
+    # Максимальное ожидание слота, если дедлайн запроса не задан (секунды)
+    max_wait: float = DEFAULT_ADMISSION_MAX_WAIT
+    # Код ответа при отказе: 503 или 429
+    reject_status: int = DEFAULT_ADMISSION_REJECT_STATUS
+
+@dataclass
+class LaneConfig:
+    # Вес полосы при распределении освободившихся слотов между очередями полос
+    weight: float = 1.0
+    # Какую долю слотов сервиса (max_concurrency) полоса может занять одновременно
+    share: float = 1.0
+
+@dataclass
+class PriorityConfig:
+    # Заголовок с приоритетом запроса; если его нет, берется поле priority тела запроса
+    header: str = DEFAULT_PRIORITY_HEADER
+    # Полоса для запросов без приоритета или с неизвестным приоритетом
+    default: str = DEFAULT_PRIORITY_LANE
+    lanes: Dict[str, LaneConfig] = None
+
+    def __post_init__(self):
+        if self.lanes is None:
+            self.lanes = {self.default: LaneConfig()}
+
+@dataclass
+class ShadowConfig:
+    # Емкость очереди копий запросов; при переполнении новые копии отбрасываются
+    queue_size: int = DEFAULT_SHADOW_QUEUE_SIZE
+    # Сколько копий одновременно отправляется в теневые сервисы
+    concurrency: int = DEFAULT_SHADOW_CONCURRENCY
+
+@dataclass
+class ProfilingConfig:
+    # Доля запросов, для которых этапы обработки попадают в ab_util_stage_seconds
+    sample_rate: float = DEFAULT_PROFILING_SAMPLE_RATE
+    # Если True, доступен эндпоинт /debug/profile
+    endpoint: bool = False
+    # Период выборки стеков по умолчанию и максимальная длительность профилирования (секунды)
+    interval: float = DEFAULT_PROFILING_INTERVAL
+    max_seconds: float = DEFAULT_PROFILING_MAX_SECONDS
+
+@dataclass
+class RewardWeights:
+    # Вклад успешности вызовов, задержки и оценки качества из /api/v1/llm/feedback в награду варианта
+    success: float = 1.0
+    latency: float = 0.5
+    quality: float = 1.0
+
+@dataclass
+class BanditConfig:
+    # "thompson" - сэмплирование Томпсона, "ucb" - верхняя доверительная граница (UCB1)
+    algorithm: str = DEFAULT_BANDIT_ALGORITHM
+    # Период пересчета распределения (секунды)
+    interval: float = DEFAULT_BANDIT_INTERVAL
+    # Минимальная доля трафика каждого варианта
+    min_share: float = DEFAULT_BANDIT_MIN_SHARE
+    # Сколько вызовов нужно до первого пересчета; до этого действуют веса сервисов
+    min_samples: int = DEFAULT_BANDIT_MIN_SAMPLES
+    # Время ответа с полной наградой за задержку; при большем времени награда - latency_target / задержка
+    latency_target: float = DEFAULT_BANDIT_LATENCY_TARGET
+    # Период полураспада статистики (секунды); 0 - статистика не устаревает
+    half_life: float = DEFAULT_BANDIT_HALF_LIFE
+    # Число выборок при сэмплировании Томпсона и коэффициент исследования UCB
+    samples: int = DEFAULT_BANDIT_SAMPLES
+    exploration: float = DEFAULT_BANDIT_EXPLORATION
+    rewards: RewardWeights = None
+
+    def __post_init__(self):
+        if self.rewards is None:
+            self.rewards = RewardWeights()
 
 @dataclass
 class ABTestingConfig:
@@ -19,11 +272,249 @@ class ABTestingConfig:
     services: Dict[str, ServiceConfig] = None
     timeout: int = DEFAULT_TIMEOUT
     fallback_enabled: bool = True
+    assignment: AssignmentConfig = None
+    # Если True, каждый отзыв распределяется по вариантам отдельно,
+    # а пачка разбивается на подпачки по сервисам
+    fanout: bool = False
+    coalescing: CoalescingConfig = None
+    cache: CacheConfig = None
+    hedging: HedgingConfig = None
+    # Общий дедлайн обработки запроса (секунды), включая резервные и дублирующие вызовы
+    deadline: Optional[float] = None
+    circuit_breaker: BreakerConfig = None
+    # Коэффициент сглаживания EWMA задержки сервисов для режима balanced
+    ewma_alpha: float = DEFAULT_EWMA_ALPHA
+    # Если True, тело запроса проксируется в сервис без разбора отзывов в модели,
+    # а ответ сервиса передается клиенту потоком как есть
+    passthrough: bool = False
+    reload: ReloadConfig = None
+    exposure: ExposureConfig = None
+    shadow: ShadowConfig = None
+    admission: AdmissionConfig = None
+    priority: PriorityConfig = None
+    profiling: ProfilingConfig = None
+    bandit: BanditConfig = None
 
     def __post_init__(self):
         # Создаем пустой словарь, если не был передан
         if self.services is None:
             self.services = {}
+        if self.assignment is None:
+            self.assignment = AssignmentConfig()
+        if self.coalescing is None:
+            self.coalescing = CoalescingConfig()
+        if self.cache is None:
+            self.cache = CacheConfig()
+        if self.hedging is None:
+            self.hedging = HedgingConfig()
+        if self.circuit_breaker is None:
+            self.circuit_breaker = BreakerConfig()
+        if self.reload is None:
+            self.reload = ReloadConfig()
+        if self.exposure is None:
+            self.exposure = ExposureConfig()
+        if self.shadow is None:
+            self.shadow = ShadowConfig()
+        if self.admission is None:
+            self.admission = AdmissionConfig()
+        if self.priority is None:
+            self.priority = PriorityConfig()
+        if self.profiling is None:
+            self.profiling = ProfilingConfig()
+        if self.bandit is None:
+            self.bandit = BanditConfig()
+
+def _parse_ramp(ramp_cfg) -> Optional[RampConfig]:
+    """Разгон веса сервиса из секции ramp"""
+    if not ramp_cfg:
+        return None
+    start = ramp_cfg.get("start", None)
+    return RampConfig(
+        from_weight=ramp_cfg.get("from_weight", 0.0),
+        duration=ramp_cfg.get("duration", DEFAULT_RAMP_DURATION),
+        start=str(start) if start is not None else None
+    )
+
+def read_config(path: Path = CONFIG_PATH) -> ABTestingConfig:
+    """
+    Чтение конфигурации из YAML файла
+
+    В отличие от load_config ошибки не подменяются значениями по умолчанию:
+    используется при перезагрузке, где некорректный файл не должен применяться.
+
+    Args:
+        path: Путь к файлу конфигурации
+
+    Returns:
+        Конфигурация
+    """
+    cfg = OmegaConf.load(path)
+    
+    # Создаем словарь сервисов
+    services_dict = {}
+    if "services" in cfg:
+        for service_name, service_cfg in cfg.services.items():
+            services_dict[service_name] = ServiceConfig(
+                url=service_cfg.get("url"),
+                weight=service_cfg.get("weight", 1.0),
+                max_connections=service_cfg.get("max_connections", DEFAULT_MAX_CONNECTIONS),
+                max_keepalive_connections=service_cfg.get(
+                    "max_keepalive_connections", DEFAULT_MAX_KEEPALIVE_CONNECTIONS
+                ),
+                keepalive_expiry=service_cfg.get("keepalive_expiry", DEFAULT_KEEPALIVE_EXPIRY),
+                http2=service_cfg.get("http2", False),
+                connect_timeout=service_cfg.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+                read_timeout=service_cfg.get("read_timeout", None),
+                probe_url=service_cfg.get("probe_url", None),
+                ramp=_parse_ramp(service_cfg.get("ramp")),
+                role=service_cfg.get("role", "primary"),
+                mirror_rate=service_cfg.get("mirror_rate", 1.0),
+                max_concurrency=service_cfg.get("max_concurrency", None),
+                max_queue=service_cfg.get("max_queue", None),
+                min_share=service_cfg.get("min_share", None)
+            )
+    
+    assignment_cfg = cfg.get("assignment") or {}
+    assignment = AssignmentConfig(
+        strategy=assignment_cfg.get("strategy", DEFAULT_ASSIGNMENT_STRATEGY),
+        key=assignment_cfg.get("key", DEFAULT_ASSIGNMENT_KEY),
+        salt=str(assignment_cfg.get("salt", "")),
+        buckets=assignment_cfg.get("buckets", DEFAULT_BUCKETS)
+    )
+    
+    coalescing_cfg = cfg.get("coalescing") or {}
+    coalescing = CoalescingConfig(
+        enabled=coalescing_cfg.get("enabled", False),
+        window_ms=coalescing_cfg.get("window_ms", DEFAULT_COALESCING_WINDOW_MS),
+        max_batch_size=coalescing_cfg.get("max_batch_size", DEFAULT_COALESCING_MAX_BATCH_SIZE)
+    )
+    
+    cache_cfg = cfg.get("cache") or {}
+    cache = CacheConfig(
+        enabled=cache_cfg.get("enabled", False),
+        max_bytes=cache_cfg.get("max_bytes", DEFAULT_CACHE_MAX_BYTES),
+        ttl=cache_cfg.get("ttl", DEFAULT_CACHE_TTL)
+    )
+    
+    hedging_cfg = cfg.get("hedging") or {}
+    hedging = HedgingConfig(
+        enabled=hedging_cfg.get("enabled", False),
+        percentile=hedging_cfg.get("percentile", DEFAULT_HEDGE_PERCENTILE),
+        min_delay=hedging_cfg.get("min_delay", DEFAULT_HEDGE_MIN_DELAY),
+        max_delay=hedging_cfg.get("max_delay", None),
+        min_samples=hedging_cfg.get("min_samples", DEFAULT_HEDGE_MIN_SAMPLES)
+    )
+    
+    breaker_cfg = cfg.get("circuit_breaker") or {}
+    circuit_breaker = BreakerConfig(
+        enabled=breaker_cfg.get("enabled", False),
+        window=breaker_cfg.get("window", DEFAULT_BREAKER_WINDOW),
+        min_requests=breaker_cfg.get("min_requests", DEFAULT_BREAKER_MIN_REQUESTS),
+        error_rate=breaker_cfg.get("error_rate", DEFAULT_BREAKER_ERROR_RATE),
+        timeout_rate=breaker_cfg.get("timeout_rate", DEFAULT_BREAKER_TIMEOUT_RATE),
+        latency_outlier_factor=breaker_cfg.get("latency_outlier_factor", DEFAULT_BREAKER_LATENCY_OUTLIER_FACTOR),
+        open_duration=breaker_cfg.get("open_duration", DEFAULT_BREAKER_OPEN_DURATION),
+        probe_interval=breaker_cfg.get("probe_interval", DEFAULT_BREAKER_PROBE_INTERVAL),
+        probe_timeout=breaker_cfg.get("probe_timeout", DEFAULT_BREAKER_PROBE_TIMEOUT),
+        probe_successes=breaker_cfg.get("probe_successes", DEFAULT_BREAKER_PROBE_SUCCESSES)
+    )
+    
+    exposure_cfg = cfg.get("exposure") or {}
+    exposure = ExposureConfig(
+        enabled=exposure_cfg.get("enabled", False),
+        path=str(exposure_cfg.get("path", DEFAULT_EXPOSURE_PATH)),
+        buffer_size=exposure_cfg.get("buffer_size", DEFAULT_EXPOSURE_BUFFER_SIZE),
+        flush_interval=exposure_cfg.get("flush_interval", DEFAULT_EXPOSURE_FLUSH_INTERVAL),
+        overflow=exposure_cfg.get("overflow", DEFAULT_EXPOSURE_OVERFLOW),
+        max_file_bytes=exposure_cfg.get("max_file_bytes", DEFAULT_EXPOSURE_MAX_FILE_BYTES),
+        rotate_interval=exposure_cfg.get("rotate_interval", DEFAULT_EXPOSURE_ROTATE_INTERVAL),
+        max_files=exposure_cfg.get("max_files", DEFAULT_EXPOSURE_MAX_FILES)
+    )
+    
+    reload_cfg = cfg.get("reload") or {}
+    reload = ReloadConfig(
+        watch=reload_cfg.get("watch", False),
+        interval=reload_cfg.get("interval", DEFAULT_RELOAD_INTERVAL)
+    )
+    
+    shadow_cfg = cfg.get("shadow") or {}
+    shadow = ShadowConfig(
+        queue_size=shadow_cfg.get("queue_size", DEFAULT_SHADOW_QUEUE_SIZE),
+        concurrency=shadow_cfg.get("concurrency", DEFAULT_SHADOW_CONCURRENCY)
+    )
+    
+    admission_cfg = cfg.get("admission") or {}
+    admission = AdmissionConfig(
+        enabled=admission_cfg.get("enabled", False),
+        max_concurrency=admission_cfg.get("max_concurrency", DEFAULT_ADMISSION_MAX_CONCURRENCY),
+        max_queue=admission_cfg.get("max_queue", DEFAULT_ADMISSION_MAX_QUEUE),
+        max_wait=admission_cfg.get("max_wait", DEFAULT_ADMISSION_MAX_WAIT),
+        reject_status=admission_cfg.get("reject_status", DEFAULT_ADMISSION_REJECT_STATUS)
+    )
+    
+    priority_cfg = cfg.get("priority") or {}
+    lanes_cfg = priority_cfg.get("lanes") or {}
+    priority = PriorityConfig(
+        header=priority_cfg.get("header", DEFAULT_PRIORITY_HEADER),
+        default=priority_cfg.get("default", DEFAULT_PRIORITY_LANE),
+        lanes={
+            str(name): LaneConfig(
+                weight=(lane_cfg or {}).get("weight", 1.0),
+                share=(lane_cfg or {}).get("share", 1.0)
+            )
+            for name, lane_cfg in lanes_cfg.items()
+        } or None
+    )
+    
+    profiling_cfg = cfg.get("profiling") or {}
+    profiling = ProfilingConfig(
+        sample_rate=profiling_cfg.get("sample_rate", DEFAULT_PROFILING_SAMPLE_RATE),
+        endpoint=profiling_cfg.get("endpoint", False),
+        interval=profiling_cfg.get("interval", DEFAULT_PROFILING_INTERVAL),
+        max_seconds=profiling_cfg.get("max_seconds", DEFAULT_PROFILING_MAX_SECONDS)
+    )
+    
+    bandit_cfg = cfg.get("bandit") or {}
+    rewards_cfg = bandit_cfg.get("rewards") or {}
+    bandit = BanditConfig(
+        algorithm=bandit_cfg.get("algorithm", DEFAULT_BANDIT_ALGORITHM),
+        interval=bandit_cfg.get("interval", DEFAULT_BANDIT_INTERVAL),
+        min_share=bandit_cfg.get("min_share", DEFAULT_BANDIT_MIN_SHARE),
+        min_samples=bandit_cfg.get("min_samples", DEFAULT_BANDIT_MIN_SAMPLES),
+        latency_target=bandit_cfg.get("latency_target", DEFAULT_BANDIT_LATENCY_TARGET),
+        half_life=bandit_cfg.get("half_life", DEFAULT_BANDIT_HALF_LIFE),
+        samples=bandit_cfg.get("samples", DEFAULT_BANDIT_SAMPLES),
+        exploration=bandit_cfg.get("exploration", DEFAULT_BANDIT_EXPLORATION),
+        rewards=RewardWeights(
+            success=rewards_cfg.get("success", 1.0),
+            latency=rewards_cfg.get("latency", 0.5),
+            quality=rewards_cfg.get("quality", 1.0)
+        )
+    )
+    
+    # Создаем и возвращаем конфигурацию
+    return ABTestingConfig(
+        mode=cfg.get("mode", DEFAULT_MODE),
+        services=services_dict,
+        timeout=cfg.get("timeout", DEFAULT_TIMEOUT),
+        fallback_enabled=cfg.get("fallback_enabled", True),
+        assignment=assignment,
+        fanout=cfg.get("fanout", False),
+        coalescing=coalescing,
+        cache=cache,
+        hedging=hedging,
+        deadline=cfg.get("deadline", None),
+        circuit_breaker=circuit_breaker,
+        ewma_alpha=cfg.get("ewma_alpha", DEFAULT_EWMA_ALPHA),
+        passthrough=cfg.get("passthrough", False),
+        reload=reload,
+        exposure=exposure,
+        shadow=shadow,
+        admission=admission,
+        priority=priority,
+        profiling=profiling,
+        bandit=bandit
+    )
 
 def load_config() -> ABTestingConfig:
     """Загрузка конфигурации из YAML файла"""
@@ -33,25 +524,7 @@ def load_config() -> ABTestingConfig:
             logger.warning(f"Файл конфигурации не найден: {CONFIG_PATH}. Используются значения по умолчанию.")
             return ABTestingConfig()
         
-        # Загружаем конфигурацию из YAML
-        cfg = OmegaConf.load(CONFIG_PATH)
-        
-        # Создаем словарь сервисов
-        services_dict = {}
-        if "services" in cfg:
-            for service_name, service_cfg in cfg.services.items():
-                services_dict[service_name] = ServiceConfig(
-                    url=service_cfg.get("url"),
-                    weight=service_cfg.get("weight", 1.0)
-                )
-        
-        # Создаем и возвращаем конфигурацию
-        return ABTestingConfig(
-            mode=cfg.get("mode", DEFAULT_MODE),
-            services=services_dict,
-            timeout=cfg.get("timeout", DEFAULT_TIMEOUT),
-            fallback_enabled=cfg.get("fallback_enabled", True)
-        )
+        return read_config(CONFIG_PATH)
     
     except Exception as e:
         logger.error(f"Ошибка загрузки конфигурации: {str(e)}. Используются значения по умолчанию.")
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from app.prometheus_metrics import observe_shadow_queue_delay, update_shadow_dropped, update_shadow_mirrored
+
+logger = logging.getLogger(__name__)
+
+# Отправка копии запроса: (имя теневого сервиса, копия запроса)
+SendMirror = Callable[[str, Any], Awaitable[None]]
+
+
+class ShadowMirror:
+    """
+    Копирование запросов в теневые сервисы без влияния на ответ клиенту
+
+    Копии ставятся в ограниченную очередь без ожидания; при переполнении новая
+    копия отбрасывается (ab_util_shadow_dropped_total). Очередь разбирают
+    concurrency фоновых задач, поэтому теневые вызовы не занимают больше
+    concurrency соединений независимо от входящего трафика.
+    """
+
+    def __init__(self, rates: Dict[str, float], send: SendMirror, queue_size: int, concurrency: int):
+        """
+        Args:
+            rates: Доля копируемых запросов по теневым сервисам
+            send: Функция отправки копии в сервис
+            queue_size: Емкость очереди копий
+            concurrency: Количество одновременно отправляемых копий
+        """
+        if queue_size <= 0 or concurrency <= 0:
+            raise ValueError("Размер очереди и параллельность теневых вызовов должны быть положительными")
+        self.rates = rates
+        self.send = send
+        self.concurrency = concurrency
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._workers: List[asyncio.Task] = []
+
+    def mirror(self, request: Any) -> None:
+        """
+        Постановка копий запроса в очередь (не блокирует вызывающий код)
+
+        Args:
+            request: Копия запроса, которая будет передана в send
+        """
+        enqueued_at = time.perf_counter()
+        for service_name, rate in self.rates.items():
+            if rate < 1.0 and random.random() >= rate:
+                continue
+            try:
+                self._queue.put_nowait((service_name, request, enqueued_at))
+            except asyncio.QueueFull:
+                update_shadow_dropped(service_name, "queue_full")
+                continue
+            update_shadow_mirrored(service_name)
+
+    async def _work(self) -> None:
+        while True:
+            service_name, request, enqueued_at = await self._queue.get()
+            observe_shadow_queue_delay(service_name, time.perf_counter() - enqueued_at)
+            try:
+                await self.send(service_name, request)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка отправки копии запроса в теневой сервис {service_name}: {str(e)}")
+
+    def info(self) -> Dict[str, int]:
+        """Состояние очереди копий"""
+        return {"queued": self._queue.qsize(), "queue_size": self._queue.maxsize, "concurrency": self.concurrency}
+
+    def start(self) -> None:
+        """Запуск фоновых задач отправки копий"""
+        if not self._workers:
+            self._workers = [asyncio.ensure_future(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        """Остановка отправки; копии, оставшиеся в очереди, отбрасываются"""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        while not self._queue.empty():
+            service_name, _, _ = self._queue.get_nowait()
+            update_shadow_dropped(service_name, "shutdown")
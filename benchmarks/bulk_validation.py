@@ -0,0 +1,95 @@
+"""
+Проверка пачки отзывов: модели Pydantic на каждый отзыв против app.bulk
+
+Для каждого размера пачки замеряются разбор тела запроса, проверка, сериализация
+тела запроса к сервису и преобразование в формат Review (from_kafka_input против
+ReviewBatch.review_records): лучшее время из --repeat повторов, пропускная
+способность в отзывах в секунду и пиковый объем памяти (tracemalloc) при проверке
+и сериализации.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bulk_validation --sizes 1000 10000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from app import codec
+from app.bulk import ReviewBatch, validate_batch
+from app.models import GenerateResponseRequest, Review
+from benchmarks.passthrough_cpu import make_review
+
+
+def model_path(body: bytes) -> bytes:
+    """Текущий путь: GenerateResponseRequest с моделью на каждый отзыв, сериализация через model_dump"""
+    request = GenerateResponseRequest(**codec.loads(body))
+    return codec.dumps(request.model_dump())
+
+
+def bulk_path(body: bytes) -> bytes:
+    """Проверка пачки одним вызовом TypeAdapter, сериализация проверенных строк"""
+    batch = validate_batch(codec.loads(body)["reviews"])
+    return codec.dumps(batch.model_dump())
+
+
+def reset(batch: ReviewBatch) -> ReviewBatch:
+    """Сброс вычисленного объединенного текста, чтобы замер включал его построение"""
+    batch._texts = None
+    return batch
+
+
+def best_time(function: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def peak_memory(function: Callable[[], Any]) -> int:
+    """Пиковый объем выделенной памяти за вызов (байты)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(size: int, repeat: int) -> List[Tuple[str, float, int]]:
+    body = codec.dumps({"reviews": [make_review(index) for index in range(size)]})
+    if codec.loads(model_path(body)) != codec.loads(bulk_path(body)):
+        raise AssertionError("Тела запросов к сервису не совпадают")
+    requests = GenerateResponseRequest(**codec.loads(body))
+    batch = validate_batch(codec.loads(body)["reviews"])
+    if [Review.from_kafka_input(review).model_dump() for review in requests.reviews] != batch.review_records():
+        raise AssertionError("Отзывы в формате Review не совпадают")
+
+    cases: Dict[str, Tuple[Callable[[], Any], bool]] = {
+        "проверка+сериализация, модели": (lambda: model_path(body), True),
+        "проверка+сериализация, bulk": (lambda: bulk_path(body), True),
+        "Review, from_kafka_input": (lambda: [Review.from_kafka_input(review).model_dump() for review in requests.reviews], False),
+        "Review, review_records": (lambda: reset(batch).review_records(), False),
+    }
+    return [
+        (name, best_time(function, repeat), peak_memory(function) if traced else 0)
+        for name, (function, traced) in cases.items()
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Отзывов в пачке")
+    parser.add_argument("--repeat", type=int, default=10, help="Повторов замера")
+    args = parser.parse_args()
+    print(f"JSON-кодек: {'orjson' if codec.orjson is not None else 'json'}")
+    for size in args.sizes:
+        print(f"\nПачка {size} отзывов")
+        for name, elapsed, peak in run(size, args.repeat):
+            memory = f"{peak / 2**20:8.1f} МБ" if peak else ""
+            print(f"  {name:32} {elapsed * 1e3:9.2f} мс {size / elapsed:12.0f} отз/с {memory}")
@@ -0,0 +1,97 @@
+"""
+Накладные расходы инструментирования вызова сервиса
+
+Сравнивается набор операций с метриками, выполняемый на один вызов сервиса
+(ServiceMetrics), с прежним подходом через общий asyncio.Lock, и доля этих
+расходов в полном процессорном времени роутера на запрос.
+
+Запуск из корня репозитория:
+    python -m benchmarks.instrumentation_overhead --iterations 100000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import httpx
+from prometheus_client import CollectorRegistry, Gauge, Histogram
+
+from app.clients import ClientPool
+from app.models import GenerateResponseRequest
+from app.prometheus_metrics import ServiceMetrics
+from app.services import service_router
+from benchmarks.passthrough_cpu import make_generation, make_review
+
+
+async def legacy_metrics(iterations: int) -> float:
+    """Прежний подход: каждая операция под общим asyncio.Lock, метки ищутся при каждом вызове"""
+    registry = CollectorRegistry()
+    latency = Histogram("legacy_latency", "", ["service", "outcome"], registry=registry)
+    inflight = Gauge("legacy_inflight", "", ["service"], registry=registry)
+    payload = Histogram("legacy_payload", "", ["service"], registry=registry)
+    lock = asyncio.Lock()
+    started = time.process_time()
+    for _ in range(iterations):
+        async with lock:
+            inflight.labels("service_a").inc()
+        async with lock:
+            payload.labels("service_a").observe(100)
+            payload.labels("service_a").observe(20000)
+            payload.labels("service_a").observe(60000)
+        async with lock:
+            inflight.labels("service_a").dec()
+            latency.labels("service_a", "success").observe(1.5)
+    return (time.process_time() - started) / iterations * 1e6
+
+
+def service_metrics(iterations: int) -> float:
+    """Текущий подход: дочерние метрики привязаны заранее, блокировки нет"""
+    metrics = ServiceMetrics("benchmark")
+    started = time.process_time()
+    for _ in range(iterations):
+        metrics.call_started()
+        metrics.observe_payload(100, 20000, 60000)
+        metrics.call_finished(1.5, "success")
+    return (time.process_time() - started) / iterations * 1e6
+
+
+async def router_request_cpu(requests: int, reviews: int) -> float:
+    """Полное процессорное время роутера на запрос с сервисом в памяти"""
+    batch = [make_review(index) for index in range(reviews)]
+    upstream_body = json.dumps({"generations": [make_generation(review) for review in batch]}).encode("utf-8")
+
+    async def upstream(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=upstream_body, headers={"Content-Type": "application/json"})
+
+    for name, service in service_router.services.items():
+        service.url = f"http://{name}/api/v1/llm/generate-responses"
+    service_router.clients = ClientPool(service_router.services, service_router.timeout,
+                                        transport=httpx.MockTransport(upstream))
+    request = GenerateResponseRequest(reviews=batch)
+    for _ in range(10):
+        await service_router.route_batch(request)
+    started = time.process_time()
+    for _ in range(requests):
+        await service_router.route_batch(request)
+    return (time.process_time() - started) / requests * 1e6
+
+
+async def run(iterations: int, requests: int, reviews: int) -> None:
+    legacy_us = await legacy_metrics(iterations)
+    current_us = service_metrics(iterations)
+    request_us = await router_request_cpu(requests, reviews)
+    print(f"Метрики на вызов, общий asyncio.Lock: {legacy_us:8.2f} мкс")
+    print(f"Метрики на вызов, ServiceMetrics:     {current_us:8.2f} мкс")
+    print(f"Роутер на запрос ({reviews} отзывов):     {request_us:8.2f} мкс")
+    print(f"Доля инструментирования:              {current_us / request_us * 100:8.2f} %")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000, help="Итераций для замера метрик")
+    parser.add_argument("--requests", type=int, default=300, help="Запросов для замера роутера")
+    parser.add_argument("--reviews", type=int, default=20, help="Отзывов в пачке")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.iterations, args.requests, args.reviews))
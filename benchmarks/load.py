@@ -0,0 +1,344 @@
+"""
+Нагрузочный стенд: балансировщик перед локальными заменителями LLM-сервисов
+
+Стенд поднимает --backends одинаковых заменителей (mocks.backend) и балансировщик
+(app.server) отдельными процессами, затем подает нагрузку с постоянной частотой
+(открытая модель: запросы отправляются по расписанию, не дожидаясь ответов, задержка
+считается от запланированного момента отправки). Нагрузка подается дважды: напрямую
+в заменители и через балансировщик, разница задержек - вклад балансировщика.
+
+Результат дописывается в --results (JSONL) вместе с коммитом и параметрами запуска
+и сравнивается с предыдущим запуском с теми же параметрами.
+
+Запуск из корня репозитория:
+    python -m benchmarks.load --rps 100 --duration 30 --batch-size 10
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+import numpy as np
+from omegaconf import OmegaConf
+
+from app.constants import BASE_DIR, CONFIG_PATH
+from benchmarks.passthrough_cpu import make_review
+
+GENERATE_PATH = "/api/v1/llm/generate-responses"
+DEFAULT_RESULTS = BASE_DIR / "benchmarks" / "results" / "load.jsonl"
+# Параметры, при совпадении которых запуски сравниваются между собой
+COMPARED_PARAMS = (
+    "rps", "duration", "batch_size", "backends", "workers", "mode",
+    "latency", "latency_median", "latency_sigma", "error_rate", "passthrough",
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_process(args: Sequence[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, *args],
+        cwd=BASE_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} не ответил за {timeout} с")
+            await asyncio.sleep(0.2)
+
+
+def process_cpu(pid: int) -> float:
+    """Процессорное время (user + system, секунды) процесса и его потомков"""
+    ticks = os.sysconf("SC_CLK_TCK")
+    stats = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as file:
+                # Имя процесса в скобках может содержать пробелы, поля считаются после него
+                fields = file.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        stats[int(entry)] = (int(fields[1]), (int(fields[11]) + int(fields[12])) / ticks)
+
+    total = 0.0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        if current in stats:
+            total += stats[current][1]
+        pending.extend(child for child, (parent, _) in stats.items() if parent == current)
+    return total
+
+
+def make_bodies(count: int, batch_size: int) -> List[bytes]:
+    """Разные тела запросов, чтобы кеш и распределение видели разные отзывы"""
+    return [
+        json.dumps({"reviews": [make_review(index * batch_size + offset) for offset in range(batch_size)]}).encode()
+        for index in range(count)
+    ]
+
+
+async def drive(urls: Sequence[str], bodies: Sequence[bytes], rps: float, duration: float, timeout: float) -> Dict[str, float]:
+    """
+    Нагрузка с постоянной частотой запросов
+
+    Args:
+        urls: Адреса, по которым запросы распределяются по кругу
+        bodies: Тела запросов (используются по кругу)
+        rps: Частота запросов в секунду
+        duration: Длительность (секунды)
+        timeout: Таймаут клиента (секунды)
+
+    Returns:
+        Пропускная способность, доля ошибок и перцентили задержки
+    """
+    loop = asyncio.get_running_loop()
+    total = int(rps * duration)
+    latencies = np.full(total, np.nan)
+    ok = np.zeros(total, dtype=bool)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    headers = {"Content-Type": "application/json"}
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        async def send(index: int, scheduled: float) -> None:
+            try:
+                response = await client.post(urls[index % len(urls)], content=bodies[index % len(bodies)], headers=headers)
+                await response.aread()
+                ok[index] = response.status_code == 200
+            except httpx.HTTPError:
+                pass
+            latencies[index] = loop.time() - scheduled
+
+        started_at = loop.time()
+        tasks = []
+        for index in range(total):
+            scheduled = started_at + index / rps
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(send(index, scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - started_at
+
+    succeeded = latencies[ok]
+    result = {
+        "requests": total,
+        "throughput": float(ok.sum() / elapsed),
+        "error_rate": float(1 - ok.mean()) if total else 0.0,
+    }
+    for q in (50, 90, 99):
+        result[f"p{q}"] = float(np.percentile(succeeded, q)) if len(succeeded) else None
+    return result
+
+
+def write_router_config(base: Optional[Path], ports: Sequence[int], args: argparse.Namespace) -> Path:
+    """Конфигурация балансировщика: разделы базовой конфигурации, сервисы - заменители"""
+    config = OmegaConf.to_container(OmegaConf.load(base)) if base else {}
+    config["mode"] = args.mode
+    config["passthrough"] = args.passthrough
+    config["services"] = {
+        f"service_{index}": {"url": f"http://127.0.0.1:{port}{GENERATE_PATH}", "weight": 1 / len(ports)}
+        for index, port in enumerate(ports)
+    }
+    config.setdefault("exposure", {})["enabled"] = False
+    config.setdefault("reload", {})["watch"] = False
+    file = tempfile.NamedTemporaryFile("w", suffix=".yaml", prefix="ab-util-load-", delete=False)
+    with file:
+        OmegaConf.save(OmegaConf.create(config), file.name)
+    return Path(file.name)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_run(path: Path, params: Dict[str, object]) -> Optional[Dict[str, object]]:
+    """Последний сохраненный запуск с теми же параметрами"""
+    if not path.exists():
+        return None
+    found = None
+    with open(path) as file:
+        for line in file:
+            entry = json.loads(line)
+            if all(entry["params"].get(name) == params[name] for name in COMPARED_PARAMS):
+                found = entry
+    return found
+
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def print_report(results: Dict[str, object], previous: Optional[Dict[str, object]]) -> None:
+    print(f"{'':<10}{'запросов':>10}{'rps':>10}{'ошибки':>10}{'p50, мс':>10}{'p90, мс':>10}{'p99, мс':>10}")
+    for phase in ("direct", "router"):
+        row = results[phase]
+        print(f"{phase:<10}{row['requests']:>10}{row['throughput']:>10.1f}{row['error_rate']:>10.4f}"
+              f"{_ms(row['p50']):>10}{_ms(row['p90']):>10}{_ms(row['p99']):>10}")
+    print(f"Вклад балансировщика: p50 {_ms(results['overhead_p50'])} мс, p99 {_ms(results['overhead_p99'])} мс, "
+          f"CPU {_ms(results['router_cpu_per_request'])} мс на запрос")
+    if previous is None:
+        print("Предыдущих запусков с такими параметрами нет")
+        return
+    print(f"Предыдущий запуск ({previous['commit']}, {previous['timestamp']}):")
+    for name in ("overhead_p50", "overhead_p99", "router_cpu_per_request"):
+        before, after = previous["results"].get(name), results[name]
+        if before is None or after is None:
+            continue
+        change = f" ({(after - before) / before * 100:+.1f}%)" if before else ""
+        print(f"  {name}: {_ms(before)} -> {_ms(after)} мс{change}")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, object]:
+    mock_env = {
+        "MOCK_LATENCY": args.latency,
+        "MOCK_LATENCY_MEDIAN": str(args.latency_median),
+        "MOCK_LATENCY_SIGMA": str(args.latency_sigma),
+        "MOCK_LATENCY_PER_REVIEW": "0",
+        "MOCK_ERROR_RATE": str(args.error_rate),
+        "MOCK_HANG_RATE": "0",
+        "MOCK_SLOW_START": "0",
+        "MOCK_CONCURRENCY": "0",
+    }
+    processes = []
+    config_path = None
+    try:
+        ports = [free_port() for _ in range(args.backends)]
+        for index, port in enumerate(ports):
+            # Модули mocks.v1..v3 различаются только профилем по умолчанию, который здесь переопределен
+            module = f"mocks.v{index % 3 + 1}.main:app"
+            processes.append(start_process(
+                ["-m", "uvicorn", module, "--port", str(port), "--log-level", "warning"],
+                {**mock_env, "MOCK_SEED": str(args.seed + index)},
+            ))
+        config_path = write_router_config(args.config, ports, args)
+        router_port = free_port()
+        router_env = {"AB_UTIL_CONFIG": str(config_path)}
+        if args.workers > 1:
+            router_env["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="ab-util-load-metrics-")
+        router = start_process(["-m", "app.server", "--port", str(router_port), "--workers", str(args.workers)], router_env)
+        processes.append(router)
+
+        for port in ports:
+            await wait_ready(f"http://127.0.0.1:{port}/health")
+        await wait_ready(f"http://127.0.0.1:{router_port}/health")
+
+        bodies = make_bodies(args.bodies, args.batch_size)
+        direct_urls = [f"http://127.0.0.1:{port}{GENERATE_PATH}" for port in ports]
+        router_urls = [f"http://127.0.0.1:{router_port}{GENERATE_PATH}"]
+
+        await drive(direct_urls, bodies, args.rps, args.warmup, args.timeout)
+        direct = await drive(direct_urls, bodies, args.rps, args.duration, args.timeout)
+        await drive(router_urls, bodies, args.rps, args.warmup, args.timeout)
+        cpu_before = process_cpu(router.pid)
+        routed = await drive(router_urls, bodies, args.rps, args.duration, args.timeout)
+        cpu = process_cpu(router.pid) - cpu_before
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if config_path is not None:
+            config_path.unlink()
+
+    def difference(name: str) -> Optional[float]:
+        if direct[name] is None or routed[name] is None:
+            return None
+        return routed[name] - direct[name]
+
+    return {
+        "direct": direct,
+        "router": routed,
+        "overhead_p50": difference("p50"),
+        "overhead_p99": difference("p99"),
+        "router_cpu_per_request": cpu / routed["requests"] if routed["requests"] else None,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=50, help="Запросов в секунду")
+    parser.add_argument("--duration", type=float, default=30, help="Длительность замера каждой фазы (секунды)")
+    parser.add_argument("--warmup", type=float, default=5, help="Прогрев перед каждой фазой (секунды)")
+    parser.add_argument("--batch-size", type=int, default=10, help="Отзывов в запросе")
+    parser.add_argument("--bodies", type=int, default=1000, help="Различных тел запросов")
+    parser.add_argument("--backends", type=int, default=3, help="Количество заменителей сервисов")
+    parser.add_argument("--workers", type=int, default=1, help="Процессов балансировщика")
+    parser.add_argument("--mode", default="triple", help="Режим балансировщика")
+    parser.add_argument("--passthrough", action="store_true", help="Режим passthrough")
+    parser.add_argument("--config", type=Path, default=CONFIG_PATH,
+                        help="Базовая конфигурация (сервисы заменяются заменителями)")
+    parser.add_argument("--latency", default="lognormal", help="Распределение задержки заменителей")
+    parser.add_argument("--latency-median", type=float, default=0.2, help="Медиана задержки заменителей (секунды)")
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ошибок заменителей")
+    parser.add_argument("--timeout", type=float, default=60, help="Таймаут клиента нагрузки (секунды)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS, help="Файл результатов (JSONL)")
+    parser.add_argument("--no-save", action="store_true", help="Не сохранять результат")
+    parser.add_argument("--label", default=None, help="Пометка запуска")
+    args = parser.parse_args(argv)
+    # Приложение настраивает логирование при импорте; запросы нагрузки не логируем
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if args.mode == "triple" and args.backends != 3 or args.mode == "dual" and args.backends != 2:
+        parser.error(f"Режим {args.mode} требует другого количества сервисов (--backends)")
+
+    params = {
+        "rps": args.rps, "duration": args.duration, "batch_size": args.batch_size, "backends": args.backends,
+        "workers": args.workers, "mode": args.mode, "latency": args.latency, "latency_median": args.latency_median,
+        "latency_sigma": args.latency_sigma, "error_rate": args.error_rate, "passthrough": args.passthrough,
+    }
+    results = asyncio.run(run(args))
+    previous = previous_run(args.results, params)
+    print_report(results, previous)
+    if not args.no_save:
+        args.results.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "label": args.label,
+            "params": params,
+            "results": results,
+        }
+        with open(args.results, "a") as file:
+            file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        print(f"Результат сохранен в {args.results}")
+
+
+if __name__ == "__main__":
+    main()
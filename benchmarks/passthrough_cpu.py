@@ -0,0 +1,111 @@
+"""
+Сравнение затрат CPU на запрос: обычный путь с моделями Pydantic и режим passthrough
+
+Сервисы подменяются транспортом в памяти, который отдает заранее
+сериализованный ответ, поэтому замер включает только работу роутера
+(и клиента ASGI, одинакового для обоих путей).
+
+Запуск из корня репозитория:
+    python -m benchmarks.passthrough_cpu --reviews 200 --requests 300
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app import main
+from app.clients import ClientPool
+from app.services import service_router
+
+
+def make_review(index: int) -> dict:
+    return {
+        "id": index,
+        "globalUserId": 1000 + index,
+        "wbUserId": 2000 + index,
+        "imtId": 3000 + index,
+        "nmId": 4000 + index,
+        "wbUserDetails": {"name": "Иван"},
+        "text": "Отличный товар, пользуюсь каждый день " * 4,
+        "pros": "Качество",
+        "cons": "Цена",
+        "ProductValuation": 5,
+    }
+
+
+def make_generation(review: dict) -> dict:
+    return {
+        "response": "Спасибо за отзыв! Рады, что товар вам понравился. " * 3,
+        "metadata": {
+            "review": {
+                "id_review": str(review["id"]),
+                "id_user": str(review["globalUserId"]),
+                "user_name": review["wbUserDetails"]["name"],
+                "nm_id": review["nmId"],
+                "review": review["text"],
+                "rating": review["ProductValuation"],
+                "recommendations": False,
+            },
+            "product_data": {"title": "Чехол", "category": "Аксессуары"},
+        },
+        "recommendations": {"items": [], "summary": None},
+    }
+
+
+async def measure(app: FastAPI, body: bytes, requests: int, warmup: int) -> float:
+    """Среднее процессорное время на запрос в миллисекундах"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://router") as client:
+        for _ in range(warmup):
+            response = await client.post("/api/v1/llm/generate-responses", content=body,
+                                         headers={"Content-Type": "application/json"})
+            response.raise_for_status()
+        started = time.process_time()
+        for _ in range(requests):
+            response = await client.post("/api/v1/llm/generate-responses", content=body,
+                                         headers={"Content-Type": "application/json"})
+            response.raise_for_status()
+        return (time.process_time() - started) / requests * 1000
+
+
+async def run(reviews: int, requests: int, warmup: int) -> None:
+    batch = [make_review(index) for index in range(reviews)]
+    body = json.dumps({"reviews": batch}, ensure_ascii=False).encode("utf-8")
+    upstream_body = json.dumps({"generations": [make_generation(review) for review in batch]},
+                               ensure_ascii=False).encode("utf-8")
+
+    async def upstream(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, stream=httpx.ByteStream(upstream_body), headers={"Content-Type": "application/json"})
+
+    # В config.yaml адреса сервисов могут быть не заполнены — подставляем фиктивные
+    for name, service in service_router.services.items():
+        service.url = f"http://{name}/api/v1/llm/generate-responses"
+    service_router.clients = ClientPool(service_router.services, service_router.timeout,
+                                        transport=httpx.MockTransport(upstream))
+
+    model_app = FastAPI()
+    model_app.post("/api/v1/llm/generate-responses",
+                   response_model=main.ReviewGenerationResponse)(main.generate_review_responses)
+    passthrough_app = FastAPI()
+    passthrough_app.post("/api/v1/llm/generate-responses")(main.generate_review_responses_passthrough)
+
+    model_ms = await measure(model_app, body, requests, warmup)
+    passthrough_ms = await measure(passthrough_app, body, requests, warmup)
+    print(f"Отзывов в пачке: {reviews}, запросов: {requests}")
+    print(f"Модели Pydantic: {model_ms:8.2f} мс CPU на запрос")
+    print(f"Passthrough:     {passthrough_ms:8.2f} мс CPU на запрос")
+    print(f"Ускорение:       {model_ms / passthrough_ms:8.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reviews", type=int, default=200, help="Отзывов в пачке")
+    parser.add_argument("--requests", type=int, default=300, help="Количество замеряемых запросов")
+    parser.add_argument("--warmup", type=int, default=20, help="Количество прогревочных запросов")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.reviews, args.requests, args.warmup))
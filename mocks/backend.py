@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, HTTPException
+
+from app.models import GenerateResponseRequest, ReviewInput
+
+logger = logging.getLogger(__name__)
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+
+@dataclass
+class MockProfile:
+    """Поведение локального заменителя LLM-сервиса"""
+
+    # Распределение задержки пачки: fixed, uniform или lognormal
+    latency: str = "lognormal"
+    # Медиана задержки пачки (секунды) и добавка за каждый отзыв пачки
+    latency_median: float = 0.5
+    latency_per_review: float = 0.0
+    # Разброс: sigma для lognormal, полуширина интервала в долях медианы для uniform
+    latency_sigma: float = 0.3
+    # Доля ответов 500 и доля "зависших" запросов, отвечающих через hang_duration секунд
+    error_rate: float = 0.0
+    hang_rate: float = 0.0
+    hang_duration: float = 60.0
+    # Медленный старт: в первые slow_start секунд задержка умножается на slow_start_factor,
+    # множитель линейно снижается до 1
+    slow_start: float = 0.0
+    slow_start_factor: float = 5.0
+    # Сколько пачек обрабатывается одновременно (0 - без ограничения), остальные ждут в очереди
+    concurrency: int = 0
+    # Длина сгенерированного ответа (символов)
+    response_chars: int = 400
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls, prefix: str = "MOCK_", **defaults: Any) -> "MockProfile":
+        """
+        Профиль из переменных окружения (MOCK_LATENCY_MEDIAN=0.2 и т.д.)
+
+        Args:
+            prefix: Префикс переменных окружения
+            defaults: Значения по умолчанию для этого сервиса
+
+        Returns:
+            Профиль сервиса
+        """
+        values = cls(**defaults)
+        for field in fields(cls):
+            raw = os.environ.get(prefix + field.name.upper())
+            if raw is None:
+                continue
+            current = getattr(values, field.name)
+            if field.name == "seed":
+                setattr(values, field.name, int(raw))
+            else:
+                setattr(values, field.name, type(current)(raw))
+        if values.latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Неизвестное распределение задержки: {values.latency}")
+        return values
+
+
+def _generation(review: ReviewInput, text: str) -> Dict[str, Any]:
+    """Генерация в формате GenerationResponse"""
+    parts = [part for part in (review.text, review.pros, review.cons) if part]
+    return {
+        "response": text,
+        "metadata": {
+            "review": {
+                "id_review": str(review.id),
+                "id_user": str(review.globalUserId),
+                "user_name": review.wbUserDetails.name,
+                "nm_id": review.nmId,
+                "review": " ".join(parts),
+                "rating": review.ProductValuation if review.ProductValuation in range(1, 6) else 4,
+                "recommendations": False,
+            },
+            "product_data": {"title": "Unknown", "category": "Unknown"},
+        },
+        "recommendations": {"items": [], "summary": None},
+    }
+
+
+def create_app(name: str, profile: MockProfile) -> FastAPI:
+    """
+    Заменитель LLM-сервиса с контрактом пачки, который использует роутер
+
+    POST /api/v1/llm/generate-responses принимает {"reviews": [...]} и возвращает
+    {"generations": [...]} с задержкой, ошибками и медленным стартом по профилю.
+
+    Args:
+        name: Имя сервиса (попадает в текст ответа)
+        profile: Поведение сервиса
+
+    Returns:
+        Приложение FastAPI
+    """
+    app = FastAPI(title=f"Mock LLM service {name}")
+    rng = random.Random(profile.seed)
+    started_at = time.monotonic()
+    semaphore = asyncio.Semaphore(profile.concurrency) if profile.concurrency > 0 else None
+    text = (f"Спасибо за отзыв! Ответ сервиса {name}. " * (profile.response_chars // 30 + 1))[:profile.response_chars]
+    logger.info(f"Сервис {name} запущен с профилем {profile}")
+
+    def sample_latency(reviews: int) -> float:
+        median = profile.latency_median + profile.latency_per_review * reviews
+        if profile.latency == "fixed":
+            latency = median
+        elif profile.latency == "uniform":
+            latency = rng.uniform(median * (1 - profile.latency_sigma), median * (1 + profile.latency_sigma))
+        else:
+            latency = median * rng.lognormvariate(0.0, profile.latency_sigma)
+        uptime = time.monotonic() - started_at
+        if uptime < profile.slow_start:
+            latency *= 1 + (profile.slow_start_factor - 1) * (1 - uptime / profile.slow_start)
+        return max(latency, 0.0)
+
+    @app.post("/api/v1/llm/generate-responses")
+    async def generate_responses(request: GenerateResponseRequest) -> Dict[str, Any]:
+        roll = rng.random()
+        if roll < profile.hang_rate:
+            await asyncio.sleep(profile.hang_duration)
+        async with semaphore if semaphore is not None else nullcontext():
+            await asyncio.sleep(sample_latency(len(request.reviews)))
+        if profile.hang_rate <= roll < profile.hang_rate + profile.error_rate:
+            raise HTTPException(status_code=500, detail="Injected error")
+        return {"generations": [_generation(review, text) for review in request.reviews]}
+
+    @app.get("/health")
+    async def health() -> Dict[str, str]:
+        return {"status": "ok", "service": name}
+
+    return app
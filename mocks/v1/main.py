@@ -1,32 +1,10 @@
-import logging
+"""
+Заменитель LLM-сервиса v1: быстрый и стабильный
 
-from app.models import ReviewInput, AnswerOutput
-from fastapi import FastAPI, HTTPException
+    uvicorn mocks.v1.main:app --port 8001
 
-app = FastAPI()
-logger = logging.getLogger(__name__)
+Профиль переопределяется переменными окружения MOCK_* (см. mocks.backend.MockProfile).
+"""
+from mocks.backend import MockProfile, create_app
 
-@app.post("/respond")
-async def respond(review: ReviewInput):
-    try:
-        logger.info(f"Получен отзыв: {review.model_dump()}")
-        logger.info(f"Отзыв: {review}")
-        
-        response = AnswerOutput(
-            response=review.text,
-            metadata={
-                "review": {
-                    "id": review.id,
-                    "wbUserId": review.wbUserId,
-                    "userName": getattr(review.wbUserDetails, 'name', None),
-                    "nmId": review.nmId,
-                    "review": review.text,
-                    "rating": review.ProductValuation or 4,
-                    "recommendations": review.recommendations
-                }
-            }
-        )
-        return response
-    except Exception as e:
-        logger.error(f"Ошибка при обработке отзыва: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
\ No newline at end of file
+app = create_app("v1", MockProfile.from_env(latency_median=0.8, latency_sigma=0.25))
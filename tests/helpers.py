@@ -0,0 +1,97 @@
+"""Общие заготовки тестов: отзывы, генерации и роутер с сервисами в памяти"""
+import json
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+
+import httpx
+from omegaconf import OmegaConf
+
+from app.clients import ClientPool
+from app.services import ServiceRouter
+from app.settings import read_config
+
+Handler = Callable[[httpx.Request], Awaitable[httpx.Response]]
+
+
+def make_review(index: int, **fields: Any) -> Dict[str, Any]:
+    """Отзыв в формате Kafka"""
+    review = {
+        "id": index,
+        "globalUserId": 1000 + index,
+        "wbUserId": 2000 + index,
+        "imtId": 3000 + index,
+        "nmId": 4000 + index,
+        "wbUserDetails": {"name": "Иван"},
+        "text": f"Отзыв {index}",
+        "pros": "Качество",
+        "cons": "Цена",
+        "ProductValuation": 5,
+    }
+    review.update(fields)
+    return review
+
+
+def make_generation(review: Dict[str, Any], response: str = "Спасибо за отзыв!") -> Dict[str, Any]:
+    """Генерация сервиса для отзыва"""
+    return {
+        "response": response,
+        "metadata": {
+            "review": {
+                "id_review": str(review["id"]),
+                "id_user": str(review["globalUserId"]),
+                "user_name": review["wbUserDetails"]["name"],
+                "nm_id": review["nmId"],
+                "review": review.get("text") or "",
+                "rating": review.get("ProductValuation") or 4,
+                "recommendations": False,
+            },
+            "product_data": {"title": "Чехол", "category": "Аксессуары"},
+        },
+        "recommendations": {"items": [], "summary": None},
+    }
+
+
+def generations_response(request: httpx.Request) -> httpx.Response:
+    """Ответ сервиса с генерацией на каждый отзыв запроса"""
+    reviews = json.loads(request.content)["reviews"]
+    return httpx.Response(200, json={"generations": [make_generation(review) for review in reviews]})
+
+
+def write_config(tmp_path: Path, **sections: Any) -> Path:
+    """
+    Файл конфигурации с одним сервисом service_a (секции переопределяются аргументами)
+
+    Returns:
+        Путь к config.yaml
+    """
+    config: Dict[str, Any] = {
+        "mode": "single",
+        "services": {"service_a": {"url": "http://service_a/api/v1/llm/generate-responses", "weight": 1.0}},
+        "timeout": 5,
+    }
+    config.update(sections)
+    path = tmp_path / "config.yaml"
+    OmegaConf.save(OmegaConf.create(config), path)
+    return path
+
+
+def use_transport(router: ServiceRouter, handler: Handler) -> None:
+    """Подмена сети роутера обработчиком в памяти"""
+    router.clients = ClientPool(router.config.services, router.timeout, transport=httpx.MockTransport(handler))
+
+
+@asynccontextmanager
+async def running_router(config_path: Path, handler: Handler) -> AsyncIterator[ServiceRouter]:
+    """Запущенный роутер, вызовы сервисов которого обслуживает handler"""
+    router = ServiceRouter(read_config(config_path))
+    use_transport(router, handler)
+    await router.startup()
+    try:
+        yield router
+    finally:
+        await router.shutdown()
+
+
+def review_ids(generations: List[Any]) -> List[str]:
+    return [generation.metadata.review.id_review for generation in generations]
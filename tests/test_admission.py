@@ -0,0 +1,187 @@
+import asyncio
+
+import pytest
+
+from app.admission import AdmissionRejected, ConcurrencyLimiter
+from app.settings import LaneConfig
+
+
+def make_limiter(max_concurrency=1, max_queue=10, service_time=0.1, lanes=None):
+    lanes = lanes or {"default": LaneConfig()}
+    return ConcurrencyLimiter("svc", max_concurrency, max_queue, lambda: service_time, lanes)
+
+
+async def settle():
+    """Даем ожидающим задачам выполниться"""
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_free_slot_is_granted_without_waiting():
+    async def scenario():
+        limiter = make_limiter(max_concurrency=2)
+        await limiter.acquire(1.0, "default")
+        await limiter.acquire(1.0, "default")
+        assert limiter.active == 2
+
+    asyncio.run(scenario())
+
+
+def test_predicted_wait_grows_with_queue():
+    async def scenario():
+        limiter = make_limiter(max_concurrency=2, service_time=0.2)
+        assert limiter.predicted_wait("default") == 0.0
+        await limiter.acquire(10.0, "default")
+        await limiter.acquire(10.0, "default")
+        # Два слота освобождаются в среднем раз в 0.1 с
+        assert limiter.predicted_wait("default") == pytest.approx(0.1)
+        waiter = asyncio.ensure_future(limiter.acquire(10.0, "default"))
+        await settle()
+        assert limiter.predicted_wait("default") == pytest.approx(0.2)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_rejects_when_queue_is_full():
+    async def scenario():
+        limiter = make_limiter(max_queue=1)
+        await limiter.acquire(10.0, "default")
+        waiter = asyncio.ensure_future(limiter.acquire(10.0, "default"))
+        await settle()
+        with pytest.raises(AdmissionRejected) as error:
+            await limiter.acquire(10.0, "default")
+        assert error.value.reason == "queue_full"
+        assert error.value.service_name == "svc"
+        limiter.release("default")
+        await waiter
+
+    asyncio.run(scenario())
+
+
+def test_rejects_when_predicted_wait_misses_deadline():
+    async def scenario():
+        limiter = make_limiter(service_time=0.5)
+        await limiter.acquire(10.0, "default")
+        with pytest.raises(AdmissionRejected) as error:
+            # Ожидание 0.5 с и ответ 0.5 с не укладываются в 0.8 с
+            await limiter.acquire(0.8, "default")
+        assert error.value.reason == "deadline"
+        assert error.value.retry_after == pytest.approx(0.5)
+        assert not limiter._lanes["default"].waiters
+
+    asyncio.run(scenario())
+
+
+def test_rejects_when_slot_is_not_freed_within_budget():
+    async def scenario():
+        limiter = make_limiter(service_time=0.0)
+        await limiter.acquire(10.0, "default")
+        with pytest.raises(AdmissionRejected) as error:
+            await limiter.acquire(0.01, "default")
+        assert error.value.reason == "wait_timeout"
+        assert not limiter._lanes["default"].waiters
+
+    asyncio.run(scenario())
+
+
+def test_waiters_are_served_in_arrival_order():
+    async def scenario():
+        limiter = make_limiter()
+        await limiter.acquire(10.0, "default")
+        order = []
+
+        async def call(index):
+            await limiter.acquire(10.0, "default")
+            order.append(index)
+
+        tasks = [asyncio.ensure_future(call(index)) for index in range(3)]
+        await settle()
+        for _ in range(3):
+            limiter.release("default")
+            await settle()
+        await asyncio.gather(*tasks)
+        assert order == [0, 1, 2]
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def scenario():
+        limiter = make_limiter()
+        await limiter.acquire(10.0, "default")
+        waiter = asyncio.ensure_future(limiter.acquire(10.0, "default"))
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release("default")
+        assert limiter.active == 0
+        assert not limiter._lanes["default"].waiters
+
+    asyncio.run(scenario())
+
+
+LANES = {"interactive": LaneConfig(weight=3.0), "bulk": LaneConfig(weight=1.0, share=0.5)}
+
+
+def test_backlogged_lanes_share_slots_by_weight():
+    async def scenario():
+        limiter = make_limiter(max_concurrency=1, max_queue=100, service_time=0.0, lanes=LANES)
+        await limiter.acquire(10.0, "bulk")
+        order = []
+
+        async def call(lane):
+            await limiter.acquire(10.0, lane)
+            order.append(lane)
+
+        tasks = [asyncio.ensure_future(call("bulk")) for _ in range(8)]
+        tasks += [asyncio.ensure_future(call("interactive")) for _ in range(8)]
+        await settle()
+        lane = "bulk"
+        for _ in range(8):
+            limiter.release(lane)
+            await settle()
+            lane = order[-1]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Вес 3:1 - на каждый слот bulk приходится три слота interactive
+        assert order.count("interactive") == 6
+        assert order.count("bulk") == 2
+
+    asyncio.run(scenario())
+
+
+def test_lane_share_caps_its_slots():
+    async def scenario():
+        limiter = make_limiter(max_concurrency=2, service_time=0.0, lanes=LANES)
+        await limiter.acquire(10.0, "bulk")
+        # bulk занимает не больше половины слотов, хотя второй слот свободен
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire(0.01, "bulk")
+        await limiter.acquire(10.0, "interactive")
+        assert limiter.active == 2
+
+    asyncio.run(scenario())
+
+
+def test_predicted_wait_uses_lane_weight_among_backlogged_lanes():
+    async def scenario():
+        limiter = make_limiter(max_concurrency=4, service_time=1.0, lanes=LANES)
+        for _ in range(2):
+            await limiter.acquire(10.0, "bulk")
+        for _ in range(2):
+            await limiter.acquire(10.0, "interactive")
+        # Без очередей полоса может рассчитывать на все свои слоты: bulk - на половину
+        assert limiter.predicted_wait("interactive") == pytest.approx(1.0 / 4)
+        assert limiter.predicted_wait("bulk") == pytest.approx(1.0 / 2)
+        waiter = asyncio.ensure_future(limiter.acquire(10.0, "interactive"))
+        await settle()
+        # При очереди interactive bulk получает долю по весу: 1/4 слотов
+        assert limiter.predicted_wait("bulk") == pytest.approx(1.0)
+        assert limiter.predicted_wait("interactive") == pytest.approx(2.0 / 4)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    asyncio.run(scenario())
@@ -0,0 +1,86 @@
+import numpy as np
+
+from app.assignment import Assigner, BucketTable, _hash_string, _key_to_int
+from app.settings import AssignmentConfig, ServiceConfig
+
+
+def make_assigner(weights, salt="exp-1", buckets=10_000, key="globalUserId"):
+    services = {f"service_{index}": ServiceConfig(url="http://localhost", weight=weight)
+                for index, weight in enumerate(weights)}
+    return Assigner(services, AssignmentConfig(strategy="sticky", key=key, salt=salt, buckets=buckets))
+
+
+def reviews(user_ids):
+    return [{"globalUserId": user_id} for user_id in user_ids]
+
+
+def test_numeric_strings_share_bucket_with_ints():
+    assert _key_to_int("123") == _key_to_int(123) == 123
+
+
+def test_non_ascii_digits_are_hashed():
+    # "²".isdigit() is True, but int("²") raises; "٣" must not collide with "3"
+    assert _key_to_int("²") == _hash_string("²")
+    assert _key_to_int("٣") == _hash_string("٣")
+    assert _key_to_int("٣") != _key_to_int("3")
+
+
+def test_assign_accepts_non_ascii_digit_keys():
+    assigner = make_assigner([0.5, 0.5])
+    assert len(assigner.assign(reviews(["²", "٣", "3"]))) == 3
+
+
+def test_bucket_table_shares_match_weights_exactly():
+    table = BucketTable([0.33, 0.33, 0.34], 1000)
+    assert table.counts.sum() == 1000
+    assert table.counts.tolist() == [330, 330, 340]
+    np.testing.assert_allclose(table.shares(), [0.33, 0.33, 0.34])
+
+
+def test_bucket_table_largest_remainder_keeps_total():
+    table = BucketTable([1, 1, 1], 100)
+    assert table.counts.sum() == 100
+    assert sorted(table.counts.tolist()) == [33, 33, 34]
+
+
+def test_observed_shares_follow_weights():
+    assigner = make_assigner([0.2, 0.8])
+    indices = assigner.assign(reviews(range(50_000)))
+    share = np.mean(indices == 1)
+    assert abs(share - 0.8) < 0.01
+
+
+def test_assignment_is_stable_for_same_salt():
+    keys = reviews(range(1000))
+    first = make_assigner([0.5, 0.5], salt="exp-1").assign(keys)
+    second = make_assigner([0.5, 0.5], salt="exp-1").assign(keys)
+    np.testing.assert_array_equal(first, second)
+
+
+def test_different_salts_give_independent_partitions():
+    keys = reviews(range(10_000))
+    first = make_assigner([0.5, 0.5], salt="exp-1").assign(keys)
+    second = make_assigner([0.5, 0.5], salt="exp-2").assign(keys)
+    # Independent 50/50 splits agree for about half of the keys
+    assert 0.4 < np.mean(first == second) < 0.6
+
+
+def test_exclude_keeps_buckets_of_remaining_services():
+    assigner = make_assigner([0.25, 0.25, 0.5])
+    keys = reviews(range(5000))
+    before = assigner.assign(keys)
+    assigner.exclude(["service_0"])
+    after = assigner.assign(keys)
+    assert not np.any(after == 0)
+    kept = before != 0
+    np.testing.assert_array_equal(before[kept], after[kept])
+    assigner.exclude([])
+    np.testing.assert_array_equal(assigner.assign(keys), before)
+
+
+def test_reweighting_moves_only_necessary_buckets():
+    table = BucketTable([0.5, 0.5], 1000)
+    reweighted = table.reweighted([0.4, 0.6])
+    assert reweighted.counts.tolist() == [400, 600]
+    # Only the 100 buckets taken from service 0 change owner
+    assert int(np.sum(table.table != reweighted.table)) == 100
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from app.bulk import validate_batch, validate_request
+from app.main import app
+from app.models import GenerateResponseRequest, Review, ReviewInput
+from tests.helpers import make_review
+
+ENDPOINT = "/api/v1/llm/generate-responses"
+
+INVALID_BODIES = [
+    {},
+    {"reviews": "not a list"},
+    {"reviews": [make_review(0, nmId=None)]},
+    {"reviews": [make_review(0), {"id": 1}]},
+    {"reviews": [make_review(0, wbUserDetails={})]},
+    {"reviews": [make_review(0, ProductValuation="five")]},
+    {"reviews": [make_review(0, text=123)]},
+    {"reviews": [make_review(0)], "priority": 1},
+]
+
+
+def model_errors(envelope):
+    with pytest.raises(ValidationError) as info:
+        GenerateResponseRequest.model_validate(envelope)
+    return [(error["type"], error["loc"]) for error in info.value.errors()]
+
+
+def bulk_errors(envelope):
+    with pytest.raises(ValidationError) as info:
+        validate_request(envelope)
+    return [(error["type"], error["loc"]) for error in info.value.errors()]
+
+
+def test_rows_match_model_dump():
+    reviews = [make_review(0), make_review(1, text=None, ProductValuation=None), make_review(2, id="r-2", nmId="42")]
+    batch = validate_request({"reviews": reviews, "priority": "bulk"})
+    expected = GenerateResponseRequest.model_validate({"reviews": reviews}).model_dump()
+    assert batch.priority == "bulk"
+    assert batch.ids == [0, 1, "r-2"]
+    for row, dumped in zip(batch.model_dump()["reviews"], expected["reviews"]):
+        assert {key: row.get(key) for key in dumped} == dumped
+
+
+@pytest.mark.parametrize("envelope", INVALID_BODIES)
+def test_errors_match_pydantic_model(envelope):
+    assert bulk_errors(envelope) == model_errors(envelope)
+
+
+def test_validate_batch_reports_review_position():
+    with pytest.raises(ValidationError) as info:
+        validate_batch([make_review(0), make_review(1, nmId=None)])
+    # Ошибки по каждой ветке Union: id, затем int или str
+    assert {error["loc"][:2] for error in info.value.errors()} == {(1, "nmId")}
+
+
+def test_review_records_match_review_model():
+    reviews = [
+        make_review(0),
+        make_review(1, ProductValuation=None),
+        make_review(2, ProductValuation=1),
+        make_review(3, pros=None, cons=None),
+        make_review(4, text=None, pros=None, cons=None),
+    ]
+    batch = validate_batch(reviews)
+    expected = [
+        review.model_dump() if review else None
+        for review in (Review.from_kafka_input(ReviewInput(**record), recommendations=True) for record in reviews)
+    ]
+    assert batch.review_records(recommendations=True) == expected
+
+
+def test_out_of_range_ratings_are_clamped_to_int16():
+    batch = validate_batch([make_review(0, ProductValuation=40000), make_review(1, ProductValuation=-40000)])
+    assert batch.ratings.dtype == np.int16
+    assert batch.ratings.tolist() == [32767, -32768]
+    assert [record["rating"] for record in batch.review_records()] == [1, 1]
+
+
+def test_select_keeps_rows_and_priority():
+    batch = validate_batch([make_review(index) for index in range(4)], priority="interactive")
+    subset = batch.select([3, 1])
+    assert subset.ids == [3, 1]
+    assert subset.priority == "interactive"
+    assert subset.rows == [batch.rows[3], batch.rows[1]]
+
+
+@pytest.fixture
+def client():
+    # Без контекстного менеджера lifespan не запускается: до роутера запросы не доходят
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("envelope", INVALID_BODIES)
+def test_endpoint_returns_fastapi_422(client, envelope):
+    response = client.post(ENDPOINT, json=envelope)
+    assert response.status_code == 422
+    detail = [(error["type"], tuple(error["loc"])) for error in response.json()["detail"]]
+    assert detail == [(kind, ("body", *loc)) for kind, loc in model_errors(envelope)]
+
+
+def test_endpoint_rejects_malformed_json(client):
+    response = client.post(ENDPOINT, content=b"{not json",
+                           headers={"Content-Type": "application/json"})
+    assert response.status_code == 422
+    assert [error["type"] for error in response.json()["detail"]] == ["json_invalid"]
+
+
+def test_endpoint_rejects_empty_reviews(client):
+    response = client.post(ENDPOINT, json={"reviews": []})
+    assert response.status_code == 400
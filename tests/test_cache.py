@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.cache import ResponseCache, rebind_generation
+from app.models import GenerateResponseRequest, GenerationResponse, ReviewInput
+from tests.helpers import generations_response, make_generation, make_review, review_ids, running_router, write_config
+
+
+def review_input(index: int, **fields) -> ReviewInput:
+    return ReviewInput(**make_review(index, **fields))
+
+
+def generation_for(review: ReviewInput) -> GenerationResponse:
+    return GenerationResponse(**make_generation(review.model_dump()))
+
+
+def test_key_depends_on_content_and_variant_only():
+    first = review_input(1, text="Хороший  товар ")
+    same_content = review_input(2, text="Хороший товар", nmId=4001)
+    assert ResponseCache.key_for(first, "a") == ResponseCache.key_for(same_content, "a")
+    assert ResponseCache.key_for(first, "a") != ResponseCache.key_for(first, "b")
+    assert ResponseCache.key_for(first, "a") != ResponseCache.key_for(review_input(1, text="Плохой товар"), "a")
+
+
+def test_evicts_least_recently_used_entries_over_max_bytes():
+    generation = generation_for(review_input(1))
+    size = len(generation.model_dump_json())
+    cache = ResponseCache(max_bytes=2 * size, ttl=60)
+    cache.put("first", generation)
+    cache.put("second", generation)
+    assert cache.get("first", "a") is not None
+    cache.put("third", generation)
+    # "second" использовался давнее всех
+    assert cache.get("second", "a") is None
+    assert cache.get("first", "a") is not None
+    assert cache.stats()["bytes"] == 2 * size
+
+
+def test_expired_entries_are_misses(monkeypatch):
+    cache = ResponseCache(max_bytes=1 << 20, ttl=10)
+    cache.put("key", generation_for(review_input(1)))
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get("key", "a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_rebind_generation_uses_ids_of_requested_review():
+    cached = generation_for(review_input(1))
+    rebound = rebind_generation(cached, review_input(7, wbUserDetails={"name": "Мария"}))
+    assert rebound.metadata.review.id_review == "7"
+    assert rebound.metadata.review.id_user == "1007"
+    assert rebound.metadata.review.user_name == "Мария"
+    assert rebound.response == cached.response
+    # Закешированная генерация не меняется
+    assert cached.metadata.review.id_review == "1"
+
+
+def test_finish_flight_wakes_waiters_and_stores_result():
+    async def scenario():
+        cache = ResponseCache(max_bytes=1 << 20, ttl=60)
+        future = cache.start_flight("key")
+        assert cache.inflight("key") is future
+        generation = generation_for(review_input(1))
+        cache.finish_flight("key", generation)
+        assert await future is generation
+        assert cache.inflight("key") is None
+        assert cache.get("key", "a") is generation
+
+    asyncio.run(scenario())
+
+
+def duplicate(index):
+    """Отзыв с тем же содержимым, что у make_review(1)"""
+    return make_review(index, text="Отзыв 1", nmId=4001)
+
+
+def cache_config(tmp_path):
+    return write_config(tmp_path, cache={"enabled": True, "max_bytes": 1 << 20, "ttl": 60})
+
+
+def test_identical_reviews_share_one_upstream_call(tmp_path):
+    calls = []
+    release = asyncio.Event()
+
+    async def upstream(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        await release.wait()
+        return generations_response(request)
+
+    async def scenario():
+        async with running_router(cache_config(tmp_path), upstream) as router:
+            first = asyncio.ensure_future(router.route_batch(GenerateResponseRequest(reviews=[make_review(1)])))
+            await asyncio.sleep(0.05)
+            # То же содержимое, другой отзыв и пользователь
+            second = asyncio.ensure_future(router.route_batch(
+                GenerateResponseRequest(reviews=[duplicate(2)])
+            ))
+            await asyncio.sleep(0.05)
+            release.set()
+            first_response, second_response = await asyncio.wait_for(asyncio.gather(first, second), timeout=5)
+            assert len(calls) == 1
+            assert review_ids(first_response.generations) == ["1"]
+            assert review_ids(second_response.generations) == ["2"]
+            assert second_response.generations[0].metadata.review.id_user == "1002"
+
+            # Повтор берется из кеша без вызова сервиса
+            third = await router.route_batch(GenerateResponseRequest(reviews=[duplicate(3)]))
+            assert len(calls) == 1
+            assert review_ids(third.generations) == ["3"]
+
+    asyncio.run(scenario())
+
+
+def test_waiter_sends_review_itself_when_owner_is_cancelled(tmp_path):
+    calls = []
+    release = asyncio.Event()
+
+    async def upstream(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            await release.wait()
+        return generations_response(request)
+
+    async def scenario():
+        async with running_router(cache_config(tmp_path), upstream) as router:
+            owner = asyncio.ensure_future(router.route_batch(GenerateResponseRequest(reviews=[make_review(1)])))
+            await asyncio.sleep(0.05)
+            waiter = asyncio.ensure_future(router.route_batch(
+                GenerateResponseRequest(reviews=[duplicate(2)])
+            ))
+            await asyncio.sleep(0.05)
+            owner.cancel()
+            response = await asyncio.wait_for(waiter, timeout=5)
+            with pytest.raises(asyncio.CancelledError):
+                await owner
+            assert review_ids(response.generations) == ["2"]
+            assert len(calls) == 2
+
+    asyncio.run(scenario())
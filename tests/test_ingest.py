@@ -0,0 +1,107 @@
+import asyncio
+import json
+import random
+
+import httpx
+
+from app.ingest import Checkpoint, _open_output, ingest
+from tests.helpers import generations_response, make_review, running_router, write_config
+
+
+def write_input(path, lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+    return path
+
+
+def read_output(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+async def run_ingest(router, checkpoint, output_path, checkpoint_path, resume=False, **kwargs):
+    output = _open_output(str(output_path), checkpoint, resume)
+    try:
+        return await ingest(router, checkpoint, output, checkpoint_path,
+                            checkpoint_interval=0, report_interval=1e9, **kwargs)
+    finally:
+        output.close()
+
+
+def test_output_follows_input_order_with_invalid_lines(tmp_path):
+    lines = [json.dumps(make_review(index)) for index in range(20)]
+    lines[3] = "{not json"
+    lines[7] = json.dumps(make_review(7, nmId=None))
+    lines[11] = "[1, 2]"
+    lines.insert(15, "")
+    input_path = write_input(tmp_path / "reviews.jsonl", lines)
+
+    async def upstream(request: httpx.Request) -> httpx.Response:
+        # Пачки завершаются не в порядке отправки
+        await asyncio.sleep(random.uniform(0, 0.02))
+        return generations_response(request)
+
+    async def scenario():
+        async with running_router(write_config(tmp_path), upstream) as router:
+            checkpoint = Checkpoint(inputs=[str(input_path)])
+            return await run_ingest(router, checkpoint, tmp_path / "out.jsonl", tmp_path / "ingest.json",
+                                    batch_size=3, concurrency=4)
+
+    stats = asyncio.run(scenario())
+    rows = read_output(tmp_path / "out.jsonl")
+    assert stats.reviews == 20 and stats.invalid == 3 and stats.generated == 17
+    assert [row.get("id") for row in rows] == [index if index not in (3, 7, 11) else None for index in range(20)]
+    invalid = {row["line"]: row for row in rows if "line" in row}
+    assert sorted(invalid) == [4, 8, 12]
+    assert all(row["source"] == str(input_path) for row in invalid.values())
+    assert "nmId" in invalid[8]["error"]
+
+
+def test_resume_continues_after_interruption_without_duplicates(tmp_path):
+    input_path = write_input(tmp_path / "reviews.jsonl", [json.dumps(make_review(index)) for index in range(30)])
+    output_path = tmp_path / "out.jsonl"
+    checkpoint_path = tmp_path / "ingest.json"
+    config_path = write_config(tmp_path)
+    stalled = asyncio.Event()
+
+    async def stalling_upstream(request: httpx.Request) -> httpx.Response:
+        if any(review["id"] >= 12 for review in json.loads(request.content)["reviews"]):
+            stalled.set()
+            await asyncio.Event().wait()
+        return generations_response(request)
+
+    async def interrupted():
+        async with running_router(config_path, stalling_upstream) as router:
+            checkpoint = Checkpoint(inputs=[str(input_path)])
+            task = asyncio.ensure_future(run_ingest(router, checkpoint, output_path, checkpoint_path,
+                                                    batch_size=4, concurrency=2))
+            await asyncio.wait_for(stalled.wait(), timeout=5)
+            await asyncio.sleep(0.05)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(interrupted())
+    saved = Checkpoint.load(checkpoint_path)
+    assert saved.line == 12
+    assert [row["id"] for row in read_output(output_path)] == list(range(12))
+
+    async def upstream(request: httpx.Request) -> httpx.Response:
+        return generations_response(request)
+
+    async def resumed():
+        async with running_router(config_path, upstream) as router:
+            checkpoint = Checkpoint.load(checkpoint_path)
+            return await run_ingest(router, checkpoint, output_path, checkpoint_path, resume=True,
+                                    batch_size=4, concurrency=2)
+
+    stats = asyncio.run(resumed())
+    assert stats.reviews == 18
+    assert [row["id"] for row in read_output(output_path)] == list(range(30))
+    assert Checkpoint.load(checkpoint_path).line == 30
+
+
+def test_resume_truncates_output_written_after_checkpoint(tmp_path):
+    output_path = tmp_path / "out.jsonl"
+    output_path.write_bytes(b'{"id": 0}\n{"id": 1}\n')
+    checkpoint = Checkpoint(inputs=["reviews.jsonl"], output_bytes=len(b'{"id": 0}\n'))
+    output = _open_output(str(output_path), checkpoint, resume=True)
+    output.close()
+    assert output_path.read_bytes() == b'{"id": 0}\n'
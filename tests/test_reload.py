@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main
+from app.reload import ConfigReloader
+from app.services import ServiceRouter
+from app.settings import read_config
+from tests.helpers import write_config
+
+TWO_SERVICES = {
+    "service_a": {"url": "http://service_a/api/v1/llm/generate-responses", "weight": 0.5},
+    "service_b": {"url": "http://service_b/api/v1/llm/generate-responses", "weight": 0.5},
+}
+
+
+def make_reloader(tmp_path):
+    path = write_config(tmp_path)
+    return ConfigReloader(ServiceRouter(read_config(path)), path)
+
+
+def test_valid_config_swaps_router_and_bumps_version(tmp_path):
+    async def scenario():
+        reloader = make_reloader(tmp_path)
+        await reloader.start()
+        previous = reloader.router
+        try:
+            write_config(tmp_path, services=TWO_SERVICES)
+            result = await reloader.reload()
+            return previous, reloader.router, reloader.version, result
+        finally:
+            await reloader.stop()
+
+    previous, router, version, result = asyncio.run(scenario())
+    assert router is not previous
+    assert version == 2
+    assert result == {"version": 2, "services": ["service_a", "service_b"]}
+    assert router.assigner.table.shares().tolist() == [0.5, 0.5]
+
+
+@pytest.mark.parametrize("services", [
+    {"service_a": {"url": "http://service_a/api/v1/llm/generate-responses", "weight": "abc"}},
+    {"service_a": {"url": "http://service_a/api/v1/llm/generate-responses", "weight": [1.0]}},
+    {},
+])
+def test_bad_values_keep_current_router(tmp_path, services):
+    async def scenario():
+        reloader = make_reloader(tmp_path)
+        await reloader.start()
+        previous = reloader.router
+        try:
+            write_config(tmp_path, services=services)
+            with pytest.raises(ValueError):
+                await reloader.reload()
+            return previous, reloader.router, reloader.version
+        finally:
+            await reloader.stop()
+
+    previous, router, version = asyncio.run(scenario())
+    assert router is previous
+    assert version == 1
+    assert list(router.services) == ["service_a"]
+
+
+def test_unreadable_config_keeps_current_router(tmp_path):
+    async def scenario():
+        reloader = make_reloader(tmp_path)
+        await reloader.start()
+        previous = reloader.router
+        try:
+            (tmp_path / "config.yaml").write_text("services: [unclosed", encoding="utf-8")
+            with pytest.raises(ValueError, match="Не удалось прочитать"):
+                await reloader.reload()
+            return reloader.router is previous, reloader.version
+        finally:
+            await reloader.stop()
+
+    assert asyncio.run(scenario()) == (True, 1)
+
+
+def test_reload_endpoint_returns_400_on_bad_config(tmp_path, monkeypatch):
+    reloader = make_reloader(tmp_path)
+    monkeypatch.setattr(app.main, "config_reloader", reloader)
+    write_config(tmp_path, services={"service_a": {"url": "http://service_a", "weight": "abc"}})
+    # Без контекстного менеджера lifespan не запускается: роутер не стартует и не останавливается
+    response = TestClient(app.main.app).post("/config/reload")
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Некорректная конфигурация")
+    assert reloader.version == 1